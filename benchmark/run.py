@@ -0,0 +1,123 @@
+import sys
+import os
+import io
+import json
+import platform
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
+from subprocess import run
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import perf_counter
+
+# Add the path ./main/ to the sys.path
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(repo, 'main'))
+from synthetic import makeWorkspace
+
+def commit():
+    # Short hash of the checked out commit ("-dirty" if there are uncommitted changes).
+    head = run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=repo).stdout.strip()
+    dirty = run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, cwd=repo).stdout.strip()
+
+    return f'{head}-dirty' if dirty else head or 'unknown'
+
+def benchmark(years, extent = 'tile', workdir = None, keep = False, quiet = True):
+    # Time each stage of BMNP_Data on years years of synthetic data: subsetting the granules (FixData), the single-day
+    # DHWs, recreating the csv files, the monthly calculations and the daily statistics.
+    root = mkdtemp(prefix=f'bmnp_{years}y_', dir=workdir)
+    cwd = os.getcwd()
+    output = io.StringIO() if quiet else sys.stdout
+
+    try:
+        print(f'[{datetime.now().strftime("%H:%M:%S")}] Generating {years} years of synthetic data in {root}...')
+        started = perf_counter()
+        dates = makeWorkspace(root, years, os.path.join(repo, 'config.ini'), extent)
+        generate_seconds = perf_counter() - started
+
+        os.chdir(root)
+        from bmnp import BMNP_Data, BMNP_Download
+        from instrument import BMNP_Instrument
+
+        with redirect_stdout(output):
+            # Subset every granule, the same as after a download (csv files are left for recreateCSVs).
+            instrument = BMNP_Instrument()
+            with instrument.stage('subset'):
+                data = BMNP_Data(dates[0], dates[-1], manually=True)
+                download = BMNP_Download(dates=dates, manually=True, catalog=data.catalog, text_csvs=False)
+                for filename in sorted(os.listdir('granules')):
+                    date = datetime.strptime(filename[0:8], '%Y%m%d').strftime('%Y-%m-%d')
+                    download.FixData(date, 'granules/', filename)
+
+            # Then the rest of the pipeline, which writes its own report.
+            data = BMNP_Data(dates[0], dates[-1], delete_singles=True, recreate_csvs=True, report=True)
+
+        with open(sorted(os.path.join('data/reports', file) for file in os.listdir('data/reports'))[-1], 'r') as f:
+            report = json.load(f)
+        report['stages'] = {**instrument.stages, **report['stages']}
+
+        return {'years': years, 'extent': extent, 'days': len(dates), 'generate_seconds': round(generate_seconds, 2),
+                'seconds': {name: stage['seconds'] for name, stage in report['stages'].items()},
+                'peak_rss_mb': report['peak_rss_mb'], 'counters': report['counters']}
+    finally:
+        os.chdir(cwd)
+        if not keep: rmtree(root)
+
+def compare(results_dir, commits):
+    # Print the seconds of each stage for each commit, side by side (one table per archive size).
+    results = {}
+    for name in commits:
+        with open(os.path.join(results_dir, f'{name}.json'), 'r') as f:
+            results[name] = {(run['years'], run['extent']): run for run in json.load(f)['runs']}
+
+    sizes = sorted(set(size for runs in results.values() for size in runs))
+    for size in sizes:
+        print(f'\n{size[0]} years ({size[1]})')
+        stages = []
+        for runs in results.values():
+            for stage in runs.get(size, {}).get('seconds', {}):
+                if stage not in stages: stages.append(stage)
+
+        print(f"{'stage':<24}" + ''.join(f'{name:>16}' for name in commits))
+        for stage in stages:
+            values = [results[name].get(size, {}).get('seconds', {}).get(stage) for name in commits]
+            print(f'{stage:<24}' + ''.join(f'{value:>16.3f}' if value is not None else f"{'-':>16}" for value in values))
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the BMNP_Data stages on synthetic MUR and MMM data.')
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 10, 22], help='Archive sizes to run, in years.')
+    parser.add_argument('--extent', choices=['tile', 'global'], default='tile', help='Size of the synthetic granules.')
+    parser.add_argument('--workdir', default=None, help='Where to make the synthetic data (a temporary folder by default).')
+    parser.add_argument('--results', default=os.path.join(repo, 'benchmark', 'results'), help='Folder of the results.')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic data after the run.')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of BMNP_Data.')
+    parser.add_argument('--compare', nargs='+', default=None, help='Compare the results of these commits instead of running.')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        compare(args.results, args.compare)
+        sys.exit()
+
+    # Results are saved per commit, so runs of different commits can be compared.
+    name = commit()
+    results_file = os.path.join(args.results, f'{name}.json')
+    if not os.path.exists(args.results): os.makedirs(args.results)
+
+    results = {'commit': name, 'python': platform.python_version(), 'machine': platform.platform(), 'runs': []}
+    if os.path.exists(results_file):
+        with open(results_file, 'r') as f:
+            results = json.load(f)
+
+    for years in args.years:
+        years = int(years) if float(years).is_integer() else years
+        result = benchmark(years, args.extent, args.workdir, args.keep, not args.verbose)
+        result['date'] = datetime.now().isoformat(timespec='seconds')
+        print(json.dumps(result['seconds'], indent=4))
+
+        # Replace an earlier run of the same size.
+        results['runs'] = [run for run in results['runs'] if (run['years'], run['extent']) != (years, args.extent)] + [result]
+        with open(results_file, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    print(f'[{datetime.now().strftime("%H:%M:%S")}] Results have been saved to {results_file}.')
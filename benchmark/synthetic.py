@@ -0,0 +1,111 @@
+from os import path, makedirs
+from datetime import datetime, timedelta
+from shutil import copy, copytree
+from configparser import ConfigParser
+import netCDF4 as nc
+import numpy as np
+
+# The MUR grid: 0.01 degree pixels, from -89.99 to 89.99 latitude and -179.99 to 180.0 longitude.
+MUR_LAT = np.round(-89.99 + 0.01 * np.arange(17999), 2)
+MUR_LON = np.round(-179.99 + 0.01 * np.arange(36000), 2)
+
+def murGrid(extent = 'tile', margin = 1.0, center = (12.16, -68.31)):
+    # Latitude and longitude of the synthetic granules. "global" is the full MUR grid (1.3 GB per day once decoded),
+    # "tile" is the part of it within margin degrees of center (Bonaire), which is enough for FixData to subset.
+    if extent == 'global': return MUR_LAT, MUR_LON
+
+    lat_idx = np.where(np.abs(MUR_LAT - center[0]) <= margin)[0]
+    lon_idx = np.where(np.abs(MUR_LON - center[1]) <= margin)[0]
+
+    return MUR_LAT[lat_idx], MUR_LON[lon_idx]
+
+def landMask(lats, lons):
+    # A rough Bonaire: an ellipse of land in the middle of the grid, and Klein Bonaire to the west of it.
+    lat, lon = np.meshgrid(lats, lons, indexing='ij')
+    land = ((lat - 12.18) / 0.12) ** 2 + ((lon + 68.27) / 0.07) ** 2 < 1
+    land |= ((lat - 12.16) / 0.02) ** 2 + ((lon + 68.32) / 0.02) ** 2 < 1
+
+    return land
+
+def sstField(day, lats, lons, rng):
+    # sst (Kelvin) of a day: a seasonal cycle with a slow warming trend, a warm event every few years (so the DHW
+    # reaches bleaching levels), a gradient across the grid and some noise.
+    seasonal = 27.8 + 1.4 * np.sin(2 * np.pi * (day - 120) / 365.25) + 0.02 * day / 365.25
+    event = 1.5 * np.exp(-((day % 1461) - 1200) ** 2 / (2 * 30 ** 2))
+    gradient = 0.2 * (lats[:, None] - lats.mean()) + 0.1 * (lons[None, :] - lons.mean())
+
+    return 273.15 + seasonal + event + gradient + rng.normal(0, 0.3, (len(lats), len(lons)))
+
+def makeGranule(filename, date, lats, lons, rng, land):
+    # One MUR L4 granule, with the same layout as the files podaac-data-downloader gives: analysed_sst is int16
+    # (time, lat, lon) with a scale factor and offset, and time is in seconds since 1981-01-01.
+    day = (datetime.strptime(date, '%Y-%m-%d') - datetime(2002, 6, 1)).days
+    sst = np.ma.masked_array(sstField(day, lats, lons, rng), mask=land)
+
+    file = nc.Dataset(filename, 'w')
+    file.createDimension('time', 1)
+    file.createDimension('lat', len(lats))
+    file.createDimension('lon', len(lons))
+
+    file_time = file.createVariable('time', 'i4', ('time',))
+    file_lat = file.createVariable('lat', 'f4', ('lat',))
+    file_lon = file.createVariable('lon', 'f4', ('lon',))
+    file_sst = file.createVariable('analysed_sst', 'i2', ('time', 'lat', 'lon'), fill_value=-32768, zlib=True)
+
+    file_time.units = 'seconds since 1981-01-01 00:00:00 UTC'
+    file_lat.units = 'degrees_north'
+    file_lon.units = 'degrees_east'
+    file_sst.units = 'kelvin'
+    file_sst.scale_factor = 0.001
+    file_sst.add_offset = 298.15
+
+    file_time[:] = int((datetime.strptime(date, '%Y-%m-%d') - datetime(1981, 1, 1)).total_seconds()) + 9 * 3600
+    file_lat[:] = lats
+    file_lon[:] = lons
+    file_sst[0] = sst
+
+    file.close()
+
+def makeMMM(filename, lats, lons):
+    # The maximum monthly mean (hrcs_mmm.nc): a grid of "variable" (Celsius) on a section of the sst grid
+    # around Bonaire, as createDHWs expects.
+    lat_idx = np.where((lats >= 12.0) & (lats <= 12.33))[0]
+    lon_idx = np.where((lons >= -68.44) & (lons <= -68.18))[0]
+    mmm_lats = lats[lat_idx]
+    mmm_lons = lons[lon_idx]
+
+    file = nc.Dataset(filename, 'w')
+    file.createDimension('lat', len(mmm_lats))
+    file.createDimension('lon', len(mmm_lons))
+    file.createVariable('lat', 'f4', ('lat',))[:] = mmm_lats
+    file.createVariable('lon', 'f4', ('lon',))[:] = mmm_lons
+    file.createVariable('variable', 'f4', ('lat', 'lon'))[:] = 29.0 + 0.1 * (mmm_lats[:, None] - mmm_lats.mean()) + 0 * mmm_lons[None, :]
+    file.close()
+
+def makeWorkspace(root, years, config_file = 'config.ini', extent = 'tile', start = '2002-06-01', seed = 0):
+    # A folder that BMNP_Data can run in: a copy of config_file and the shape folder, the empty data folders, hrcs_mmm.nc, and one synthetic
+    # granule per day (in root/granules/) for years years from start. Returns the list of dates.
+    config = ConfigParser()
+    config.read(config_file)
+
+    for folder in ['granules'] + [config['folders'][name] for name in config['folders'] if name != 'code']:
+        if not path.exists(path.join(root, folder)): makedirs(path.join(root, folder))
+    copy(config_file, path.join(root, 'config.ini'))
+
+    # The coastline, for the ocean masks.
+    shape_dir = path.join(path.dirname(path.abspath(config_file)), 'shape')
+    if path.exists(shape_dir): copytree(shape_dir, path.join(root, 'shape'), dirs_exist_ok=True)
+
+    lats, lons = murGrid(extent)
+    land = landMask(lats, lons)
+    rng = np.random.default_rng(seed)
+
+    first = datetime.strptime(start, '%Y-%m-%d')
+    dates = [(first + timedelta(days=day)).strftime('%Y-%m-%d') for day in range(int(round(years * 365.25)))]
+
+    makeMMM(path.join(root, config['folders']['data'], 'hrcs_mmm.nc'), lats, lons)
+    for date in dates:
+        makeGranule(path.join(root, 'granules', f"{date.replace('-', '')}090000-JPL-L4_GHRSST-SSTfnd-MUR-GLOB-v02.0-fv04.1.nc"),
+                    date, lats, lons, rng, land)
+
+    return dates
@@ -1,18 +1,41 @@
-import matplotlib.pyplot as plt
 import numpy as np
-from shiny import App, render, ui
+from shiny import App, reactive, render, ui
 from shinywidgets import output_widget, render_widget
 import shinyswatch
-import netCDF4 as nc
 import configparser
 from ipyleaflet import Map
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import os
+import pandas as pd
+import base64
+from datetime import datetime, timedelta
+from cache import GridCache, MonthlyCache
+from render import RenderCache, COLORMAPS, draw_map
+from playback import Playback
+from alert import ALERT_LEVELS
 
 # Read config "config.ini" file
 config = configparser.ConfigParser()
 config.read("config.ini")
 
+# Shared cache of the decoded daily grids (and their averages), warmed with the most recent days.
+cache = GridCache(config, max_items=config.getint("dashboard", "cache_items", fallback=256))
+cache.warm(config.getint("dashboard", "warm_days", fallback=30))
+
+# Cache of the rendered maps (as PNGs), shared by every session. BMNP_Data can save the newest day's maps ahead of time.
+renders = RenderCache(cache, max_bytes=config.getint("dashboard", "render_cache_mb", fallback=64) * 1024 * 1024,
+                      folder=config["folders"]["renders"])
+
+# Frames of a range of dates for playback, rendered ahead of time by a pool of threads.
+playback = Playback(config, cache, renders, workers=config.getint("dashboard", "playback_workers", fallback=4))
+
+# Every monthly grid and the monthly time series, loaded once and shared by every session.
+monthly = MonthlyCache(config)
+monthly.get()
+
+# Table of daily statistics (one row per date), written by BMNP_Data.
+statistics_file = f"{config['folders']['csv_dataframes']}daily_statistics.csv"
+
 # Find the most recent date in the nc_sst folder.
 def most_recent_date():
     # List data in folder
@@ -26,6 +49,10 @@ def most_recent_date():
     
     return str(date)
 
+# Show PNG bytes as an image.
+def png_image(png):
+    return ui.img(src=f"data:image/png;base64,{base64.b64encode(png).decode()}", style="width: 100%;")
+
 # Create a map UI that 
 app_ui = ui.page_fluid(
     ui.page_navbar(
@@ -38,7 +65,10 @@ app_ui = ui.page_fluid(
                                 # Colorbar Types, using input_select
                                 ui.input_select("colorbar_type",
                                                 "Select a Colorbar Type",
-                                                {"RdYlBu_r": "RdYlBu_r", "viridis": "viridis", "plasma": "plasma", "inferno": "inferno", "magma": "magma", "cividis": "cividis"},),
+                                                {cmap: cmap for cmap in COLORMAPS},),
+                                
+                                # Fixed colorbar range (otherwise the range of the day's data).
+                                ui.input_checkbox("cb_colorbars", "Fixed Colorbar Range", value=True),
                                 
                                 ),
                                 ui.layout_columns(
@@ -54,18 +84,73 @@ app_ui = ui.page_fluid(
                                         value = ui.output_ui("calculate_dhw"),
                                         theme=str(ui.output_ui("dhw_theme")),
                                     ),
+                                    ui.value_box(
+                                        title = "Bleaching Alert",
+                                        value = ui.output_ui("calculate_alert"),
+                                        theme=str(ui.output_ui("dhw_theme")),
+                                    ),
                                 ),
                                 ui.layout_columns(
-                                    ui.output_plot("plot_sst"),
-                                    ui.output_plot("plot_dhw"),
+                                    ui.output_ui("plot_sst"),
+                                    ui.output_ui("plot_dhw"),
+                                    ui.output_ui("plot_alert"),
                                 ),
+                                ui.output_plot("plot_series"),
                             ),
                         ),
                         
-        ui.nav_panel("Monthly", ui.page_fluid(
-            
-            ),
-        ),
+        ui.nav_panel("Monthly", ui.page_sidebar(
+                                # Sidebar
+                                ui.sidebar(
+                                # Month Selector, newest month first
+                                ui.input_select("month", "Month", monthly.get()["months"][::-1]),
+                                
+                                # Colorbar Types, using input_select
+                                ui.input_select("month_colorbar_type",
+                                                "Select a Colorbar Type",
+                                                {cmap: cmap for cmap in COLORMAPS},),
+                                
+                                # Fixed colorbar range (otherwise the range of the month's data).
+                                ui.input_checkbox("month_cb_colorbars", "Fixed Colorbar Range", value=True),
+                                
+                                ),
+                                ui.layout_columns(
+                                    ui.output_plot("plot_month_sst"),
+                                    ui.output_plot("plot_month_dhw"),
+                                ),
+                                ui.output_plot("plot_month_series"),
+                            ),
+                        ),
+        
+        ui.nav_panel("Playback", ui.page_sidebar(
+                                # Sidebar
+                                ui.sidebar(
+                                # Range of dates to play, ending at the most recent date
+                                ui.input_date_range("play_range", "Dates",
+                                                    start=(datetime.strptime(most_recent_date(), "%Y-%m-%d") - timedelta(days=84)).strftime("%Y-%m-%d"),
+                                                    end=most_recent_date()),
+                                
+                                # Variable to play
+                                ui.input_select("play_variable", "Variable", {"sst": "SST", "dhw": "DHW", "alert": "Bleaching Alert"}),
+                                
+                                # Colorbar Types, using input_select
+                                ui.input_select("play_colorbar_type",
+                                                "Select a Colorbar Type",
+                                                {cmap: cmap for cmap in COLORMAPS},),
+                                
+                                # Fixed colorbar range (otherwise the range of each day's data).
+                                ui.input_checkbox("play_cb_colorbars", "Fixed Colorbar Range", value=True),
+                                
+                                # Frames per second
+                                ui.input_slider("play_fps", "Frames per Second", min=1, max=10, value=4),
+                                
+                                ui.input_action_button("play", "Play"),
+                                ui.input_action_button("stop", "Stop"),
+                                
+                                ),
+                                ui.output_ui("play_frame"),
+                            ),
+                        ),
         title="Bonaire Dashboard",
         id="page",
         theme = shinyswatch.theme.litera()
@@ -73,169 +158,234 @@ app_ui = ui.page_fluid(
 )
 
 def server(input, output, session):
-    def load_data(vartype = None):
-        # Get the date from the input_date widget.
-        date = input.date()
-
-        if vartype == "dhw": location = f"{config['folders']['nc_dhw']}"
-        elif vartype == "sst": location = f"{config['folders']['nc_sst']}"
-        else:
-            print("Invalid radio type")
-            return
-
-        # Load data in location using netCDF4, as well as the date.nc
-        data = nc.Dataset(f'{location}{date}.nc')
-        
-        # Load the "lat" and "lon" variables from the data
-        lat = data.variables['lat'][:]
-        lon = data.variables['lon'][:]
-        
-        # Get the data for the date
-        if vartype == "dhw": data = data.variables['dhw']
-        elif vartype == "sst": data = data.variables['analysed_sst'][0, :, :] - 273.15
-        
-        # If the vartype is dhw, np.flip 0 it.
-        if vartype == "dhw": data = np.flip(data, 0)
+    # The daily statistics, reloaded whenever the file changes.
+    @reactive.file_reader(statistics_file)
+    def statistics():
+        if not os.path.exists(statistics_file): return pd.DataFrame()
+        return pd.read_csv(statistics_file, index_col="Date")
+    
+    # Average of the selected date from the daily statistics, or from the grid if the date is not in the table.
+    def average(vartype):
+        table = statistics()
+        column = f"{vartype}_mean"
+        date = str(input.date())
         
-        # If the vartype is sst, reverse order of latitude.
-        if vartype == "sst": lat = np.flip(lat, 0)
+        if column in table.columns and date in table.index and not pd.isna(table.at[date, column]):
+            return round(float(table.at[date, column]), 2)
         
-        return lat, lon, data, vartype.upper()
+        if vartype == "dhw": return dhw_entry()["average"]
+        else: return sst_entry()["average"]
+    
+    # The sst and dhw grids for the selected date, taken from the cache once per date change.
+    @reactive.calc
+    def sst_entry():
+        return cache.get("sst", input.date())
+    
+    @reactive.calc
+    def dhw_entry():
+        return cache.get("dhw", input.date())
+    
+    # Alert level of the area on the selected date (from the daily statistics, or from the alert file), or None.
+    @reactive.calc
+    def alert_level():
+        table = statistics()
+        date = str(input.date())
+        
+        if "alert_level" in table.columns and date in table.index and not pd.isna(table.at[date, "alert_level"]):
+            return int(table.at[date, "alert_level"])
+        
+        try:
+            return cache.get("alert", input.date())["level"]
+        except FileNotFoundError:
+            return None
     
     # Calculate the average DHW
     @render.text()
     def calculate_dhw():
-        # Get date input
-        date = input.date()
-        
-        # Load date from dhw
-        data = nc.Dataset(f'{config["folders"]["nc_dhw"]}{date}.nc')
-        
-        # Get the dhw data from this
-        data = data.variables['dhw'][:]
-        
-        # Calculate the average, from non-nan values
-        # Round average to 2 decimal places
-        average = round(np.nanmean(data), 2)
-        
-        return average
+        # Average from non-nan values, rounded to 2 decimal places
+        return average("dhw")
 
     # Calculate the average SST
     @render.text()
     def calculate_sst():
-        # Get date input
-        date = input.date()
-        
-        # Load date from dhw
-        data = nc.Dataset(f'{config["folders"]["nc_sst"]}{date}.nc')
-        
-        # Get the dhw data from this
-        data = data.variables['analysed_sst'][:]
-        
-        # Round average to 2 decimal places
-        average = round(float(np.nanmean(data))-273.15, 2)
-        
-        return f"{average}°C"
+        # Average from non-nan values, rounded to 2 decimal places
+        return f"{average('sst')}°C"
+    
+    @render.text()
+    def calculate_alert():
+        level = alert_level()
+        return "No Data" if level is None else ALERT_LEVELS[level]
     
     @render.text()
     def dhw_theme():
-        average = calculate_dhw()
+        # From the alert level: No Stress and Bleaching Watch, Bleaching Warning and Alert Level 1, then Alert Level 2 and up.
+        level = alert_level()
         
-        if average < 8:
+        if level is None or level <= 1:
             return "bg-green"
-        elif average < 12:
+        elif level <= 3:
             return "bg-orange"
         else:
             return "bg-red"
     
     @render.text()
     def sst_theme():
-        average = calculate_sst()
+        sst_average = average("sst")
         
-        if average < 27:
+        if sst_average < 27:
             return "bg-green"
-        elif average < 30:
+        elif sst_average < 30:
             return "bg-orange"
         else:
             return "bg-red"
     
+    # The monthly grids, checked for changes to the monthly files every 10 seconds.
+    @reactive.poll(monthly.signature, 10)
+    def monthly_data():
+        return monthly.get()
+    
+    # Keep the month choices up to date with the monthly files.
+    @reactive.effect
+    def update_months():
+        months = monthly_data()["months"][::-1]
+        with reactive.isolate():
+            selected = input.month() if input.month() in months else None
+        ui.update_select("month", choices=months, selected=selected)
+    
+    # Map of the selected month, taken from the preloaded monthly grids.
+    def month_map(vartype):
+        data = monthly_data()
+        month = input.month()
+        if data[vartype] is None or month not in data["months"]: return
+        
+        grids = data[vartype]
+        grid = grids["data"][data["months"].index(month)]
+        if np.all(np.isnan(grid)): return
+        
+        return draw_map(vartype, grids["lat"], grids["lon"], grid, f"Monthly {vartype.upper()} for {month} ",
+                        input.month_colorbar_type(), input.month_cb_colorbars())
+    
     @render.plot()
-    def plot_dhw():
-        # Load the data
-        lat, lon, data, vartype = load_data(vartype="dhw")
-        
-        if input.cb_colorbars():
-            vmin = 0
-            vmax = 30
-        else:
-            vmin = np.nanmin(data)
-            vmax = np.nanmax(data)
-        
-        fig, ax = plt.subplots()
-        cax = ax.imshow(data, cmap='RdYlBu_r', vmin=vmin, vmax=vmax)
-        
-        if input.cb_colorbars():
-            # Minimum 0 and maximum 30.
-            plt.colorbar(cax, ticks=[0, 5, 10, 15, 20, 25, 30])
-        else:
-            plt.colorbar(cax)
-        
-        # Set the x and y labels
-        ax.set_xlabel('Longitude')
-        ax.set_ylabel('Latitude')
-        
-        # Set the X and Y Ticks, based on lat and lon
-        ax.set_xticks(np.arange(0, len(lon), 5))
-        ax.set_xticklabels(lon[::5], rotation=45)
-        ax.set_yticks(np.arange(0, len(lat), 5))
-        ax.set_yticklabels(lat[::5])
-        
-        # Add the grid in the background
-        ax.grid(True)
-        
-        # Set the title based on the date and the radio type
-        ax.set_title(f"{vartype} for {input.date()} ")
-        
+    def plot_month_sst():
+        return month_map("sst")
+    
+    @render.plot()
+    def plot_month_dhw():
+        return month_map("dhw")
+    
+    @render.plot()
+    def plot_month_series():
+        # Monthly sst (mean, with the min to max range) and mean dhw over the whole record.
+        data = monthly_data()
+        if data["sst"] is None: return
+        months = pd.to_datetime(data["months"])
+        
+        fig = Figure()
+        ax = fig.subplots()
+        series = data["sst"]["series"]
+        ax.fill_between(months, series["min"], series["max"], color='tab:red', alpha=0.2, label='SST range')
+        ax.plot(months, series["mean"], color='tab:red', label='Mean SST')
+        ax.set_ylabel('SST (°C)')
+        
+        # dhw on a second y axis.
+        ax_dhw = ax.twinx()
+        if data["dhw"] is not None:
+            ax_dhw.plot(months, data["dhw"]["series"]["mean"], color='tab:blue', label='Mean DHW')
+        ax_dhw.set_ylabel('DHW')
+        
+        # Mark the selected month.
+        if input.month() in data["months"]:
+            ax.axvline(pd.to_datetime(input.month()), color='black', linestyle='--')
+        
+        ax.set_title("Monthly SST and DHW")
+        fig.legend(loc='upper left')
         
         return fig
+    
+    # Show a rendered map (from the render cache) as an image.
+    def render_image(vartype):
+        png = renders.get(vartype, input.date(), input.colorbar_type(), input.cb_colorbars())
+        return png_image(png)
+    
+    @render.ui()
+    def plot_dhw():
+        return render_image("dhw")
 
-    @render.plot()
+    @render.ui()
     def plot_sst():
-        # Load the data
-        lat, lon, data, vartype = load_data(vartype="sst")
-        
-        if input.cb_colorbars():
-            vmin = 25
-            vmax = 33
-        else:
-            vmin = np.nanmin(data)
-            vmax = np.nanmax(data)
-        
-        fig, ax = plt.subplots()
-        cax = ax.imshow(data, cmap='RdYlBu_r', vmin=vmin, vmax=vmax)
-        
-        # Check to see first if cb_colorbars is checked
-        if input.cb_colorbars():
-            # Set the minimum to 25 and maximum to 33
-            plt.colorbar(cax, ticks=[25, 26, 27, 28, 29, 30, 31, 32, 33])
-        else:
-            plt.colorbar(cax)
-        
-        # Set the x and y labels
-        ax.set_xlabel('Longitude')
-        ax.set_ylabel('Latitude')
-        
-        # Set the X and Y Ticks, based on lat and lon
-        ax.set_xticks(np.arange(0, len(lon), 5))
-        ax.set_xticklabels(lon[::5], rotation=45)
-        ax.set_yticks(np.arange(0, len(lat), 5))
-        ax.set_yticklabels(lat[::5])
-        
-        # Add the grid in the background
-        ax.grid(True)
+        return render_image("sst")
+    
+    @render.ui()
+    def plot_alert():
+        return render_image("alert")
+    
+    # Frames of the playback (as (date, future) pairs), the frame being shown, and whether it is playing.
+    play_frames = reactive.value([])
+    play_index = reactive.value(0)
+    playing = reactive.value(False)
+    
+    @reactive.effect
+    @reactive.event(input.play)
+    def start_playback():
+        # Read the range of dates at once, and start rendering its frames in the background.
+        start, end = input.play_range()
+        play_frames.set(playback.start(input.play_variable(), start, end, input.play_colorbar_type(), input.play_cb_colorbars()))
+        play_index.set(0)
+        playing.set(True)
+    
+    @reactive.effect
+    @reactive.event(input.stop)
+    def stop_playback():
+        playing.set(False)
+    
+    @reactive.effect
+    def advance_playback():
+        # Move to the next frame at the chosen frame rate, once it has been rendered.
+        if not playing.get(): return
+        reactive.invalidate_later(1 / input.play_fps())
+        
+        with reactive.isolate():
+            frames = play_frames.get()
+            index = play_index.get()
+            if index + 1 >= len(frames):
+                playing.set(False)
+            elif frames[index + 1][1].done():
+                play_index.set(index + 1)
+    
+    @render.ui()
+    def play_frame():
+        frames = play_frames.get()
+        if len(frames) == 0: return
         
-        # Set the title based on the date and the radio type
-        ax.set_title(f"{vartype} for {input.date()} ")
+        date, frame = frames[play_index.get()]
+        return png_image(frame.result())
+    
+    @render.plot()
+    def plot_series():
+        # Daily sst (mean, with the min to max range) and mean dhw for the year of the selected date.
+        table = statistics()
+        year = str(input.date())[0:4]
+        if len(table) == 0: return
+        table = table[table.index.str.startswith(year)]
+        dates = pd.to_datetime(table.index)
+        
+        fig = Figure()
+        ax = fig.subplots()
+        ax.fill_between(dates, table["sst_min"], table["sst_max"], color='tab:red', alpha=0.2, label='SST range')
+        ax.plot(dates, table["sst_mean"], color='tab:red', label='Mean SST')
+        ax.set_ylabel('SST (°C)')
+        
+        # dhw on a second y axis.
+        ax_dhw = ax.twinx()
+        if "dhw_mean" in table.columns:
+            ax_dhw.plot(dates, table["dhw_mean"], color='tab:blue', label='Mean DHW')
+        ax_dhw.set_ylabel('DHW')
+        
+        # Mark the selected date.
+        ax.axvline(pd.to_datetime(input.date()), color='black', linestyle='--')
+        
+        ax.set_title(f"Daily SST and DHW for {year}")
+        fig.legend(loc='upper left')
         
         return fig
 
@@ -0,0 +1,178 @@
+from collections import OrderedDict
+from threading import Lock
+import netCDF4 as nc
+import numpy as np
+import warnings
+import sys
+import os
+
+# Add the path ./main/ to the sys.path, for the ocean masks.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main'))
+from mask import BMNP_Mask
+from alert import areaLevel, ALERT_FILL
+
+class GridCache:
+    def __init__(self, config, max_items = 256):
+        # Decoded daily grids and their averages, keyed by (vartype, date). The least recently used entry is
+        # dropped once there are more than max_items. An entry is loaded again once its file changes (see version).
+        self.config = config
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+        # Ocean pixels of the sst and dhw grids (see BMNP_Mask), made the first time each one is loaded.
+        self.masks = {}
+
+    def filename(self, vartype, date):
+        if vartype == "dhw": location = f"{self.config['folders']['nc_dhw']}"
+        elif vartype == "sst": location = f"{self.config['folders']['nc_sst']}"
+        elif vartype == "alert": location = f"{self.config['folders']['nc_alert']}"
+        else:
+            raise ValueError(f"Invalid variable type: {vartype}")
+
+        return f'{location}{date}.nc'
+
+    def version(self, vartype, date):
+        # Modification time of the daily file (None if there is none). A file that is written again (e.g. a DHW
+        # rebuild, or a repaired sst day) gets a new version, so the grids and maps made from it are made again.
+        try:
+            return os.stat(self.filename(vartype, date)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self, vartype, date):
+        # Load data in location using netCDF4, as well as the date.nc (and close it straight away).
+        version = self.version(vartype, date)
+        with nc.Dataset(self.filename(vartype, date)) as data:
+            # Load the "lat" and "lon" variables from the data
+            lat = data.variables['lat'][:]
+            lon = data.variables['lon'][:]
+
+            # Get the data for the date, and its average over the ocean pixels (rounded to 2 decimal places).
+            if vartype == "dhw":
+                grid = data.variables['dhw'][:]
+            elif vartype == "sst":
+                grid = data.variables['analysed_sst'][0, :, :] - 273.15
+            elif vartype == "alert":
+                grid = data.variables['alert_area'][:]
+            average = round(self.oceanMask(vartype, lat, lon).mean(grid), 2)
+
+            # For the alert area, also the alert level of the whole area.
+            if vartype == "alert": level = areaLevel(np.ma.filled(self.oceanMask(vartype, lat, lon).compress(grid), ALERT_FILL))
+
+        # The alert area is kept as float (with nan for missing pixels), like the other grids.
+        if vartype == "alert": grid = np.ma.filled(grid.astype(float), np.nan)
+
+        # If the vartype is dhw (or alert, which is on the same grid), np.flip 0 it.
+        if vartype in ("dhw", "alert"): grid = np.flip(grid, 0)
+
+        # If the vartype is sst, reverse order of latitude.
+        if vartype == "sst": lat = np.flip(lat, 0)
+
+        entry = {"lat": lat, "lon": lon, "data": grid, "average": average, "version": version}
+        if vartype == "alert": entry["level"] = level
+
+        return entry
+
+    def oceanMask(self, vartype, lat, lon):
+        with self.lock:
+            if vartype not in self.masks:
+                self.masks[vartype] = BMNP_Mask(np.ma.getdata(lat), np.ma.getdata(lon),
+                                                self.config.get("mask", "shapefile", fallback="./shape/BON_Coastline.shp"),
+                                                self.config.get("folders", "masks", fallback="./data/masks/"))
+
+            return self.masks[vartype]
+
+    def get(self, vartype, date):
+        key = (vartype, str(date))
+
+        # Return the cached entry, marking it as the most recently used, unless its file has been written again since.
+        version = self.version(vartype, date)
+        with self.lock:
+            if key in self.items and self.items[key]["version"] == version:
+                self.items.move_to_end(key)
+                return self.items[key]
+
+        # Otherwise load it, and drop the least recently used entries if the cache is full.
+        entry = self.load(vartype, date)
+        with self.lock:
+            self.items[key] = entry
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+        return entry
+
+    def warm(self, days):
+        # Load the most recent "days" dates of both sst and dhw into the cache.
+        dates = sorted(file.replace(".nc", "") for file in os.listdir(self.config["folders"]["nc_sst"]))
+        for date in dates[-days:]:
+            for vartype in ("sst", "dhw"):
+                try:
+                    self.get(vartype, date)
+                except FileNotFoundError:
+                    continue
+
+class MonthlyCache:
+    def __init__(self, config):
+        # Every monthly sst and dhw grid, stacked into one array per variable, and the monthly time series.
+        # They are loaded once, and only loaded again when the monthly files change.
+        self.config = config
+        self.folders = {"sst": config["folders"]["monthly_nc_sst"], "dhw": config["folders"]["monthly_nc_dhw"]}
+        self.lock = Lock()
+        self.loaded = None
+        self.data = None
+
+    def signature(self):
+        # Name and modification time of every monthly file.
+        files = []
+        for vartype, folder in self.folders.items():
+            for file in sorted(os.listdir(folder)):
+                files.append((vartype, file, os.path.getmtime(f"{folder}{file}")))
+
+        return files
+
+    def load(self):
+        # Months that have an sst file (months without a dhw file are nan in the dhw grids and series).
+        months = sorted(file.replace(".nc", "") for file in os.listdir(self.folders["sst"]) if file.endswith(".nc"))
+        data = {"months": months}
+
+        for vartype, variable in (("sst", "analysed_sst"), ("dhw", "dhw")):
+            grids, lat, lon = None, None, None
+
+            for idx, month in enumerate(months):
+                if not os.path.exists(f"{self.folders[vartype]}{month}.nc"): continue
+
+                with nc.Dataset(f"{self.folders[vartype]}{month}.nc") as file:
+                    if grids is None:
+                        lat = file.variables['lat'][:]
+                        lon = file.variables['lon'][:]
+                        grids = np.full((len(months), len(lat), len(lon)), np.nan)
+                    grids[idx] = np.ma.filled(file.variables[variable][:], np.nan)
+
+            if grids is None:
+                data[vartype] = None
+                continue
+
+            # Same orientation as the daily grids: dhw data is flipped, sst latitude is reversed.
+            if vartype == "dhw": grids = np.flip(grids, 1)
+            if vartype == "sst": lat = np.flip(lat, 0)
+
+            # Monthly mean, min and max of each map (all nan where the month has no file).
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                series = {"mean": np.nanmean(grids, axis=(1, 2)), "min": np.nanmin(grids, axis=(1, 2)), "max": np.nanmax(grids, axis=(1, 2))}
+
+            data[vartype] = {"lat": lat, "lon": lon, "data": grids, "series": series}
+
+        return data
+
+    def get(self):
+        # Return the loaded months, loading them again if the files have changed since.
+        with self.lock:
+            signature = self.signature()
+            if signature != self.loaded:
+                self.data = self.load()
+                self.loaded = signature
+
+            return self.data
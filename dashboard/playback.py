@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+import numpy as np
+import sys
+import os
+from render import draw_map
+
+# The archives are read with BMNP_Archive, from the main folder.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main'))
+from archive import BMNP_Archive
+
+class Playback:
+    def __init__(self, config, grids, renders, workers = 4):
+        # Frames of a range of dates, rendered ahead of time by a pool of threads. The stacked grids are read from
+        # the sst and dhw archives in one read (and from the daily files, through grids, for dates they do not have).
+        # Finished frames are also added to renders, so the daily view can use them.
+        self.config = config
+        self.grids = grids
+        self.renders = renders
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.archives = {"sst": f"{config['folders']['data']}sst_bmnp.nc", "dhw": f"{config['folders']['data']}dhw_bmnp.nc"}
+
+    def dateRange(self, start, end):
+        # Every date from start to end (inclusive).
+        start = datetime.strptime(str(start), '%Y-%m-%d')
+        end = datetime.strptime(str(end), '%Y-%m-%d')
+
+        return [(start + timedelta(days=day)).strftime('%Y-%m-%d') for day in range((end - start).days + 1)]
+
+    def stack(self, vartype, start, end):
+        # Grids of every date from start to end, as a list of (date, lat, lon, data). Dates without data are left out.
+        # The part of the range the archive covers is read from it in one read. Dates outside the archive, or missing
+        # from it, are taken from the daily files (through grids). The alert levels only have daily files.
+        start, end = str(start), str(end)
+        archive = BMNP_Archive(self.archives[vartype], variable='analysed_sst' if vartype == 'sst' else 'dhw') if vartype in self.archives else None
+
+        frames = {}
+        if archive is not None and archive.exists() and archive.isValid() and max(start, archive.start_date) <= end:
+            # The latitude is reversed, the same as the daily grids in the dashboard.
+            lats, lons = archive.grid()
+            dates, data = archive.read(max(start, archive.start_date), end)
+            lats = np.flip(lats, 0)
+
+            for date, grid in zip(dates, data):
+                if np.ma.getmaskarray(grid).all(): continue
+                frames[date] = (date, lats, lons, np.ma.filled(grid.astype(float), np.nan))
+
+        for date in self.dateRange(start, end):
+            if date in frames: continue
+            try:
+                entry = self.grids.get(vartype, date)
+            except FileNotFoundError:
+                continue
+            frames[date] = (date, entry["lat"], entry["lon"], entry["data"])
+
+        return [frames[date] for date in self.dateRange(start, end) if date in frames]
+
+    def renderFrame(self, key, lat, lon, data):
+        # Render one frame to PNG bytes, and add it to the render cache.
+        vartype, date, cmap, fixed, _ = key
+        fig = draw_map(vartype, lat, lon, data, f"{vartype.upper()} for {date} ", cmap, fixed)
+
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png")
+        png = buffer.getvalue()
+        self.renders.add(key, png)
+
+        return png
+
+    def start(self, vartype, start, end, cmap = "RdYlBu_r", fixed = True):
+        # Start rendering every frame of the range. Returns a list of (date, future), in date order, where each
+        # future gives the PNG bytes of the frame. Frames that are already in the render cache are not rendered again.
+        frames = []
+        for date, lat, lon, data in self.stack(vartype, start, end):
+            key = self.renders.key(vartype, date, cmap, fixed)
+
+            with self.renders.lock:
+                png = self.renders.items.get(key)
+
+            if png is not None:
+                future = self.executor.submit(lambda png=png: png)
+            else:
+                future = self.executor.submit(self.renderFrame, key, lat, lon, data)
+
+            frames.append((date, future))
+
+        return frames
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from threading import Lock
+from io import BytesIO
+from matplotlib.figure import Figure
+from matplotlib.colors import ListedColormap
+import numpy as np
+import sys
+import os
+
+# The alert levels are defined with the alert product, in the main folder.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main'))
+from alert import ALERT_LEVELS
+
+# Colormaps that can be picked in the dashboard.
+COLORMAPS = ["RdYlBu_r", "viridis", "plasma", "inferno", "magma", "cividis"]
+
+# Colorbar range and ticks of each variable when the colorbar is fixed.
+FIXED_RANGES = {
+    "sst": (25, 33, [25, 26, 27, 28, 29, 30, 31, 32, 33]),
+    "dhw": (0, 30, [0, 5, 10, 15, 20, 25, 30]),
+    "alert": (-0.5, len(ALERT_LEVELS) - 0.5, list(range(len(ALERT_LEVELS)))),
+}
+
+# Colours of the alert levels (No Stress to Alert Level 5), after the NOAA Coral Reef Watch maps.
+ALERT_COLORS = ["#c8fafa", "#fff000", "#faaa0a", "#f00000", "#960000", "#640000", "#3c0000", "#1e0000"]
+
+def draw_map(vartype, lat, lon, data, title, cmap = "RdYlBu_r", fixed = True):
+    # Map of a grid, with the colorbar either fixed to the range of the variable or fitted to the data.
+    # The alert levels always have their own colours and a fixed colorbar, with the name of each level.
+    if vartype == "alert":
+        cmap = ListedColormap(ALERT_COLORS)
+        vmin, vmax, ticks = FIXED_RANGES[vartype]
+    elif fixed:
+        vmin, vmax, ticks = FIXED_RANGES[vartype]
+    else:
+        vmin, vmax, ticks = np.nanmin(data), np.nanmax(data), None
+
+    # Figure is used instead of pyplot, so that nothing is kept around once the figure is drawn.
+    fig = Figure()
+    ax = fig.subplots()
+    cax = ax.imshow(data, cmap=cmap, vmin=vmin, vmax=vmax)
+    colorbar = fig.colorbar(cax, ticks=ticks)
+    if vartype == "alert": colorbar.set_ticklabels(ALERT_LEVELS)
+
+    # Set the x and y labels
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+
+    # Set the X and Y Ticks, based on lat and lon
+    ax.set_xticks(np.arange(0, len(lon), 5))
+    ax.set_xticklabels(lon[::5], rotation=45)
+    ax.set_yticks(np.arange(0, len(lat), 5))
+    ax.set_yticklabels(lat[::5])
+
+    # Add the grid in the background
+    ax.grid(True)
+
+    # Set the title
+    ax.set_title(title)
+
+    return fig
+
+class RenderCache:
+    def __init__(self, grids, max_bytes = 64 * 1024 * 1024, folder = None):
+        # Encoded PNGs of the daily maps, keyed by (vartype, date, cmap, fixed, version), where version is that of the
+        # daily file (see GridCache.version), so a map is drawn again once its file is rewritten. grids is the
+        # GridCache the data is taken from. The least recently used PNGs are dropped once they take up more than max_bytes.
+        # If folder is given, the PNGs are also saved there (and kept below max_bytes), so that they can be
+        # rendered ahead of time by another process.
+        self.grids = grids
+        self.max_bytes = max_bytes
+        self.folder = folder
+        self.items = OrderedDict()
+        self.size = 0
+        self.lock = Lock()
+
+        if self.folder is not None: os.makedirs(self.folder, exist_ok=True)
+
+    def key(self, vartype, date, cmap = "RdYlBu_r", fixed = True):
+        return (vartype, str(date), cmap, bool(fixed), self.grids.version(vartype, date))
+
+    def prefix(self, key):
+        # Start of the file name of every version of the map.
+        vartype, date, cmap, fixed, _ = key
+        return f"{vartype}_{date}_{cmap}_{'fixed' if fixed else 'auto'}_"
+
+    def filename(self, key):
+        return os.path.join(self.folder, f"{self.prefix(key)}{key[4]}.png")
+
+    def render(self, vartype, date, cmap = "RdYlBu_r", fixed = True):
+        # Draw the map of the date, and return it as PNG bytes.
+        entry = self.grids.get(vartype, date)
+        fig = draw_map(vartype, entry["lat"], entry["lon"], entry["data"], f"{vartype.upper()} for {date} ", cmap, fixed)
+
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png")
+
+        return buffer.getvalue()
+
+    def add(self, key, png):
+        # Add the PNG to the cache (in place of older versions of the map), and drop the least recently used PNGs
+        # if the cache is too big.
+        with self.lock:
+            for stale in [item for item in self.items if item[:4] == key[:4] and item != key]:
+                self.size -= len(self.items.pop(stale))
+            if key in self.items: self.size -= len(self.items[key])
+            self.items[key] = png
+            self.items.move_to_end(key)
+            self.size += len(png)
+            while self.size > self.max_bytes and len(self.items) > 1:
+                _, dropped = self.items.popitem(last=False)
+                self.size -= len(dropped)
+
+    def get(self, vartype, date, cmap = "RdYlBu_r", fixed = True):
+        key = self.key(vartype, date, cmap, fixed)
+
+        # Return the cached PNG, marking it as the most recently used.
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                return self.items[key]
+
+        # Then look for a PNG that was saved in the folder.
+        if self.folder is not None and os.path.exists(self.filename(key)):
+            with open(self.filename(key), 'rb') as f:
+                png = f.read()
+        # Otherwise render it (and save it in the folder).
+        else:
+            png = self.render(*key[:4])
+            if self.folder is not None: self.save(key, png)
+
+        self.add(key, png)
+
+        return png
+
+    def save(self, key, png):
+        # Write the PNG to the folder (through a temporary file, so a half-written PNG is never read), and remove
+        # the older versions of the map.
+        filename = self.filename(key)
+        with open(f'{filename}.tmp', 'wb') as f:
+            f.write(png)
+        os.replace(f'{filename}.tmp', filename)
+        for file in os.listdir(self.folder):
+            if file.startswith(self.prefix(key)) and file.endswith('.png') and os.path.join(self.folder, file) != filename:
+                os.remove(os.path.join(self.folder, file))
+
+        # Remove the oldest PNGs once the folder is bigger than max_bytes.
+        files = [os.path.join(self.folder, file) for file in os.listdir(self.folder) if file.endswith('.png')]
+        files = sorted(files, key=os.path.getmtime)
+        size = sum(os.path.getsize(file) for file in files)
+        while size > self.max_bytes and len(files) > 1:
+            size -= os.path.getsize(files[0])
+            os.remove(files.pop(0))
+
+    def prerender(self, date, cmaps = ("RdYlBu_r",)):
+        # Render every variable of the date, with fixed and automatic colorbars, for each colormap. Maps whose file
+        # has been written again since they were saved are drawn again.
+        for vartype in ("sst", "dhw", "alert"):
+            for cmap in cmaps:
+                for fixed in (True, False):
+                    try:
+                        self.get(vartype, date, cmap, fixed)
+                    except FileNotFoundError:
+                        continue
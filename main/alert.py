@@ -0,0 +1,27 @@
+from numpy import where, digitize, percentile, uint8
+
+# NOAA Coral Reef Watch bleaching alert levels, stored as 0 to 7 (255 is missing).
+ALERT_LEVELS = ['No Stress', 'Bleaching Watch', 'Bleaching Warning', 'Alert Level 1', 'Alert Level 2', 'Alert Level 3', 'Alert Level 4', 'Alert Level 5']
+ALERT_FILL = 255
+
+# DHW at which each of Alert Level 1 to 5 starts.
+ALERT_DHW = [4, 8, 12, 16, 20]
+
+# HotSpot is stored as uint8 in steps of HOTSPOT_SCALE degrees (so up to 25.4).
+HOTSPOT_SCALE = 0.1
+
+def alertLevel(hotspot, dhw):
+    # Alert level of each pixel from the day's HotSpot (sst above the MMM, in Celsius) and DHW:
+    # No Stress when HotSpot is 0, Bleaching Watch when it is below 1, and from a HotSpot of 1 up, Bleaching Warning
+    # below 4 DHW, then Alert Level 1 to 5 from 4, 8, 12, 16 and 20 DHW.
+    levels = where(hotspot >= 1, 2 + digitize(dhw, ALERT_DHW), where(hotspot > 0, 1, 0))
+
+    return levels.astype(uint8)
+
+def areaLevel(levels, fraction = 0.1):
+    # Alert level of an area: the highest level reached by at least fraction of its (non-missing) pixels,
+    # so that a few pixels along the coast do not set the level of the whole area. None if there are none.
+    levels = levels[levels != ALERT_FILL]
+    if len(levels) == 0: return None
+
+    return int(percentile(levels, 100 * (1 - fraction), method='lower'))
@@ -0,0 +1,79 @@
+from os import path, makedirs, replace
+from hashlib import md5
+from numpy import asarray, around, argsort, searchsorted, clip, abs, diff, flatnonzero, where, ix_, savez, load, float64
+
+class BMNP_Align:
+    def __init__(self, source_lats, source_lons, lats, lons, tolerance = None, cache_dir = './data/alignments/'):
+        # Lines a source grid (e.g. the bleaching threshold of hrcs_mmm.nc) up with a target grid (the sst subset).
+        # The window is the part of the target grid inside the source grid, as (min_lat_idx, max_lat_idx, min_lon_idx,
+        # max_lon_idx), and rows / cols are the nearest source lat / lon of each target lat / lon in the window.
+        # The window must cover the whole source grid, and every target pixel of it must have a source pixel within
+        # tolerance (a quarter of the source spacing by default), or a ValueError is raised. Grids that only differ by
+        # floating point noise are lined up, but grids that are offset from each other are not matched silently.
+        # The alignment is made once per pair of grids and cached in cache_dir.
+        self.source_lats = asarray(source_lats, dtype=float64)
+        self.source_lons = asarray(source_lons, dtype=float64)
+        self.lats = asarray(lats, dtype=float64)
+        self.lons = asarray(lons, dtype=float64)
+        self.tolerance = tolerance
+
+        self.cache_file = f'{cache_dir}align_{self.fingerprint()}.npz'
+        self.window, self.rows, self.cols = self.cached(cache_dir)
+
+    def cached(self, cache_dir):
+        # The alignment from the cache, or made and saved to it (under a temporary name, then renamed).
+        if path.exists(self.cache_file):
+            cache = load(self.cache_file)
+            return tuple(int(idx) for idx in cache['window']), cache['rows'], cache['cols']
+
+        min_lat_idx, max_lat_idx, rows = self.axis(self.source_lats, self.lats, 'lat')
+        min_lon_idx, max_lon_idx, cols = self.axis(self.source_lons, self.lons, 'lon')
+        window = (min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx)
+
+        if not path.exists(cache_dir): makedirs(cache_dir)
+        savez(f'{self.cache_file}.tmp.npz', window=window, rows=rows, cols=cols)
+        replace(f'{self.cache_file}.tmp.npz', self.cache_file)
+
+        return window, rows, cols
+
+    def fingerprint(self):
+        # Both grids (to 6 decimal places) and the tolerance identify the alignment.
+        key = md5(around(self.source_lats, 6).tobytes() + around(self.source_lons, 6).tobytes())
+        key.update(around(self.lats, 6).tobytes() + around(self.lons, 6).tobytes())
+        key.update(repr(self.tolerance).encode())
+
+        return key.hexdigest()
+
+    def axis(self, source, target, name):
+        # Window of one axis of the target (start and stop index) and the nearest source index of each coordinate in it.
+        tolerance = self.tolerance
+        if tolerance is None:
+            tolerance = abs(diff(source)).min() / 4 if len(source) > 1 else 1e-6
+
+        # Target coordinates inside the source extent. The target is in order, so they are one slice.
+        inside = flatnonzero((target >= source.min() - tolerance) & (target <= source.max() + tolerance))
+        if len(inside) == 0:
+            raise ValueError(f'The {name} of the grids do not overlap ({source.min()} to {source.max()} and {target.min()} to {target.max()}).')
+        start, stop = int(inside[0]), int(inside[-1]) + 1
+        if target[start:stop].min() > source.min() + tolerance or target[start:stop].max() < source.max() - tolerance:
+            raise ValueError(f'The {name} of the grid ({target.min()} to {target.max()}) do not cover the source grid ({source.min()} to {source.max()}).')
+
+        # Nearest source coordinate of each target coordinate, searching the sorted source.
+        order = argsort(source)
+        ordered = source[order]
+        values = target[start:stop]
+        upper = clip(searchsorted(ordered, values), 0, len(ordered) - 1)
+        lower = clip(upper - 1, 0, None)
+        nearest = where(abs(values - ordered[lower]) <= abs(values - ordered[upper]), lower, upper)
+        distance = abs(values - ordered[nearest])
+
+        # Check the coverage: every target coordinate of the window needs a source coordinate close to it.
+        far = flatnonzero(distance > tolerance)
+        if len(far) > 0:
+            raise ValueError(f'{len(far)} {name} values of the grid have no source {name} within {tolerance} (e.g. {target[start + far[0]]}).')
+
+        return start, stop, order[nearest]
+
+    def align(self, source):
+        # The source grid on the window of the target grid.
+        return source[ix_(self.rows, self.cols)]
@@ -0,0 +1,143 @@
+from os import path
+from datetime import datetime, timedelta
+from threading import Lock
+import netCDF4 as nc
+from numpy import arange, ma
+from storage import createGrid
+
+# First day of the MUR record. Every archive counts its slots from here, whichever dates the run that made it had.
+EPOCH = '2002-06-01'
+
+class BMNP_Archive:
+    def __init__(self, filename, variable = 'analysed_sst', units = 'celsius', start_date = EPOCH, chunk_days = 365, storage = 'float'):
+        # The archive is a single NetCDF4 file, with one slot along the (unlimited) time dimension per day.
+        # The slot of a date is the number of days since start_date, so the days are always in order and a
+        # range of dates is always one contiguous read. storage is the profile a new archive is made with (see
+        # storage.py). Either way, the grids are read back as float32.
+        self.filename = filename
+        self.variable = variable
+        self.units = units
+        self.start_date = start_date
+        self.chunk_days = chunk_days
+        self.storage = storage
+
+        # Only one thread may write to the file at a time.
+        self.lock = Lock()
+
+        # If the archive already exists, its own start date is used.
+        if self.exists():
+            file = nc.Dataset(self.filename, 'r')
+            if 'start_date' in file.ncattrs(): self.start_date = file.start_date
+            file.close()
+
+    def exists(self):
+        return path.exists(self.filename)
+
+    def isValid(self):
+        # Check to see if the file was made by BMNP_Archive (older sst_bmnp.nc files have no start_date).
+        file = nc.Dataset(self.filename, 'r')
+        valid = 'start_date' in file.ncattrs() and self.variable in file.variables and 'time' in file.variables
+        file.close()
+
+        return valid
+
+    def dateSince(self, date):
+        # Calculate the number of days since 1981-01-01
+        since = datetime.strptime(date, '%Y-%m-%d') - datetime(1981, 1, 1)
+
+        return since.days
+
+    def slot(self, date):
+        # Number of days between the start of the archive and the date.
+        slot = (datetime.strptime(date, '%Y-%m-%d') - datetime.strptime(self.start_date, '%Y-%m-%d')).days
+
+        if slot < 0:
+            raise ValueError(f'The date {date} is before the start of the archive ({self.start_date}).')
+
+        return slot
+
+    def slotDate(self, slot):
+        # Date (YYYY-MM-DD) of a slot.
+        date = datetime.strptime(self.start_date, '%Y-%m-%d') + timedelta(days=int(slot))
+
+        return date.strftime('%Y-%m-%d')
+
+    def create(self, lats, lons):
+        # Create the file, with an unlimited time dimension.
+        file = nc.Dataset(self.filename, 'w')
+        file.createDimension('lon', len(lons))
+        file.createDimension('lat', len(lats))
+        file.createDimension('time', None)
+
+        # Create variables. The grids are compressed and chunked by chunk_days, so that reading a year is one read.
+        file_lons = file.createVariable('lon', 'f4', ('lon',))
+        file_lats = file.createVariable('lat', 'f4', ('lat',))
+        file_time = file.createVariable('time', 'f4', ('time',))
+        createGrid(file, self.variable, ('time', 'lat', 'lon'), self.units, self.storage, zlib=True, complevel=4,
+                   chunksizes=(self.chunk_days, len(lats), len(lons)))
+
+        # Add attributes
+        file_lons.units = 'degrees_east'
+        file_lats.units = 'degrees_north'
+        file_time.units = 'days since 1981-01-01 00:00:00'
+        file.start_date = self.start_date
+
+        # Add data
+        file_lons[:] = lons
+        file_lats[:] = lats
+
+        file.close()
+
+    def grid(self):
+        # Get the lat and lon of the archive.
+        file = nc.Dataset(self.filename, 'r')
+        lats = file.variables['lat'][:]
+        lons = file.variables['lon'][:]
+        file.close()
+
+        return lats, lons
+
+    def length(self):
+        # Number of slots in the archive (including days that have not been added).
+        file = nc.Dataset(self.filename, 'r')
+        length = len(file.dimensions['time'])
+        file.close()
+
+        return length
+
+    def dates(self):
+        # Get the dates that are in the archive. Slots that have not been written have a masked time.
+        if not self.exists(): return []
+
+        file = nc.Dataset(self.filename, 'r')
+        time = ma.getmaskarray(file.variables['time'][:])
+        file.close()
+
+        return [self.slotDate(slot) for slot in arange(len(time))[~time]]
+
+    def write(self, date, grid, lats = None, lons = None):
+        # Add a single day to the archive (as a masked stack of one day, so missing pixels stay masked).
+        self.writeMany(date, ma.stack([grid]), lats, lons)
+
+    def writeMany(self, date, cube, lats = None, lons = None):
+        # Add a block of consecutive days, starting at date, to the archive in one write.
+        # If the archive does not exist yet, it is created using lats and lons.
+        with self.lock:
+            if not self.exists(): self.create(lats, lons)
+
+            slot = self.slot(date)
+            file = nc.Dataset(self.filename, 'a')
+            file.variables[self.variable][slot:slot + len(cube)] = cube
+            file.variables['time'][slot:slot + len(cube)] = self.dateSince(date) + arange(len(cube))
+            file.close()
+
+    def read(self, start = None, end = None, lat_slice = slice(None), lon_slice = slice(None)):
+        # Read every slot from start to end (inclusive) in one contiguous read.
+        # Days that have not been added are masked. Returns the list of dates, and the grids.
+        file = nc.Dataset(self.filename, 'r')
+        first = 0 if start is None else self.slot(start)
+        last = len(file.dimensions['time']) - 1 if end is None else min(self.slot(end), len(file.dimensions['time']) - 1)
+        data = file.variables[self.variable][first:last + 1, lat_slice, lon_slice]
+        file.close()
+
+        return [self.slotDate(slot) for slot in range(first, last + 1)], data
@@ -3,16 +3,30 @@ from os import path, listdir, remove
 from pathlib import Path
 from datetime import datetime, timedelta
 from subprocess import run
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from threading import Lock, local
 import netCDF4 as nc
-from numpy import where, zeros, around, sort, rot90, flip, shape, nanmean
+from numpy import where, zeros, minimum, arange, uint8, around, sort, array_split, rot90, flip, shape, nanmean, ma, nan, isnan, concatenate, cumsum, percentile
 import os
-from pandas import DataFrame, concat
+import sys
+from pandas import DataFrame, concat, read_csv
+import json
+import requests
+from archive import BMNP_Archive, EPOCH
+from catalog import BMNP_Catalog
+from export import BMNP_Export
+from instrument import BMNP_Instrument
+from mask import BMNP_Mask
+from align import BMNP_Align
+from pipeline import BMNP_Pipeline
+from storage import createGrid, storageProfile
+from alert import alertLevel, areaLevel, ALERT_LEVELS, ALERT_FILL, HOTSPOT_SCALE
 
 import warnings
 warnings.filterwarnings('ignore')
 
 class BMNP_Download:
-    def __init__(self, dates=[], type = 'loop', manually = False):        
+    def __init__(self, dates=[], type = 'loop', manually = False, workers = 4, date_ranges = None, bulk_days = 30, archive = None, catalog = None, text_csvs = True, instrument = None, refined = None, fix_lock = None):        
         # Read config.ini file
         self.config = ConfigParser()
         self.config.read('config.ini')
@@ -23,6 +37,34 @@ class BMNP_Download:
         # Downloaded dates
         self.downloaded_dates = []
         
+        # Dates that failed to download (date: reason), and a lock for the lists when downloading in parallel.
+        self.failed_dates = {}
+        self.lock = Lock()
+        
+        # Per-thread storage (OPeNDAP sessions), and the lat / lon index window of the MUR grid once it is known.
+        self.local = local()
+        self.opendap_window = None
+        self.window_lock = Lock()
+        
+        # Only one download is refined at a time, as the netCDF library is not thread-safe. The lock can be shared
+        # with other threads that use netCDF files at the same time (see BMNP_Pipeline).
+        self.fix_lock = fix_lock if fix_lock is not None else Lock()
+        
+        # Queue (if given) that each date is put on once its download has finished, whether or not it worked.
+        self.refined = refined
+        
+        # Accumulated sst data (BMNP_Archive) that each refined day is added to, if given.
+        self.archive = archive
+        
+        # Catalog (BMNP_Catalog) that each refined day is recorded in, if given.
+        self.catalog = catalog
+        
+        # Whether each refined day is also written as a text csv.
+        self.text_csvs = text_csvs
+        
+        # Timings of the downloads and of FixData are added to instrument (BMNP_Instrument), if given.
+        self.instrument = instrument if instrument is not None else BMNP_Instrument()
+        
         # Read the config.ini file, specifically for [coordinates]
         # Read in the min_lat, max_lat, min_lon, max_lon
         self.min_lat = self.config['coordinates'].getfloat('min_lat')
@@ -38,6 +80,13 @@ class BMNP_Download:
         # Set temporary dates in the format YYYY-MM-DD
         self.date_list = dates
         
+        # Number of podaac-data-downloader processes to run at once for "parallel" downloads.
+        self.workers = workers
+        
+        # Contiguous (start, end) runs of dates for "bulk" downloads, and the most days to request at once.
+        self.date_ranges = date_ranges
+        self.bulk_days = bulk_days
+        
         if not manually:
             # Cycle through the dates list
             if type == 'loop':
@@ -54,18 +103,36 @@ class BMNP_Download:
                     
                     # Go through the cycle of downloading the data.
                     self.downloadData(date, self.command)
+                    self.report(date)
+            
+            elif type == 'parallel':
+                self.downloadParallel()
+            
+            elif type == 'opendap':
+                self.downloadParallel(self.downloadOPeNDAP)
                 
             elif type == 'bulk':
-                print(f'Not yet implemented. Please stick to "loop" download for now.')
+                self.downloadBulk()
     
-    def setCommand(self, date):
+    def getTime(self):
+        now = datetime.now()
+        now = now.strftime('%H:%M:%S')
+        return now
+    
+    def setCommand(self, date, download_dir = None, end_date = None):
+        # By default, download into the download directory itself.
+        if download_dir is None: download_dir = self.download_dir
+        
+        # By default, download a single date. Otherwise, every date from date to end_date.
+        if end_date is None: end_date = date
+        
         dataset = 'MUR-JPL-L4-GLOB-v4.1'
         command = [
             'podaac-data-downloader',
             '-c', dataset,
-            '-d', self.download_dir,
+            '-d', download_dir,
             '--start-date', f'{date}T20:00:00Z',
-            '--end-date', f'{date}T20:00:00Z'
+            '--end-date', f'{end_date}T20:00:00Z'
         ]
         
         return command
@@ -91,108 +158,380 @@ class BMNP_Download:
         # Set netrc_check to True
         self.netrc_check = True
 
-    def downloadData(self, date, command):
-        def getTime():
-            now = datetime.now()
-            now = now.strftime('%H:%M:%S')
-            return now
+    def downloadParallel(self, fetch = None):
+        # By default, each date is fetched by running podaac-data-downloader into its staging directory.
+        if fetch is None:
+            fetch = lambda date, staging_dir: self.downloadData(date, self.setCommand(date, staging_dir), staging_dir)
         
-        def FixData(date_sp, command_run):
-            # Check to see if the directory is empty, if so, return None.
-            if len(listdir(self.download_dir)) == 0:
-                # Print a statement stating that no files were downloaded.
-                print(f'[{getTime()}] No files were downloaded... Please ensure that the login credentials are correct.')
-                
-                # Print output of the command that was run.
-                # print(f'[{getTime()}] Command: {command_run}')
-                
-                return False
-            else:
-                # Print a statement stating that the files were downloaded.
-                print(f'[{getTime()}] Files for the date {date_sp} were downloaded. Now fixing the data...')
-                
-                # Add date to the downloaded_dates list
-                self.downloaded_dates.append(date_sp)
-            
-            # Check the directory and delete items that have ".txt" extensions
-            for filename in listdir(self.download_dir):
-                if filename.endswith('.txt'):
-                    remove(f'{self.download_dir}{filename}')
-            
-            # Open the only other item which is an .nc file
-            filename = listdir(self.download_dir)[0]
-            file = nc.Dataset(self.download_dir + filename, 'r')
-            
-            # Filter the data to the area of interest.
-            lons = file.variables['lon'][:]
-            lats = file.variables['lat'][:]
-            temp = file.variables['analysed_sst'][:]
-            time = file.variables['time'][:]
-            
-            lon_idx = where((lons >= self.min_lon) & (lons <= self.max_lon))[0]
-            lat_idx = where((lats >= self.min_lat) & (lats <= self.max_lat))[0]
-            
-            lons = lons[lon_idx]
-            lats = lats[lat_idx]
-            temp = temp[:, lat_idx, :][:, :, lon_idx]
+        # Check for the .netrc file before starting, so that only one prompt is given.
+        if not self.netrc_check:
+            self.checkNetRC()
+        
+        print(f'[{self.getTime()}] Downloading {len(self.date_list)} dates with {self.workers} downloads at a time...')
+        
+        def downloadDate(date):
+            # Each date gets its own staging directory, so that the downloads do not collide.
+            staging_dir = f'{self.download_dir}{date}/'
+            if not path.exists(staging_dir): os.mkdir(staging_dir)
             
-            # Take new "temp" data, convert to csv using pandas dataframe, and save it to refined_csv directory.
-            df = DataFrame(temp[0], index=lats, columns=lons)
-            df.to_csv(f'{self.refined_csv}{date_sp}.csv')
+            try:
+                fetch(date, staging_dir)
+            except Exception as e:
+                # Record the failure and move on to the next date.
+                with self.lock: self.failed_dates[date] = str(e)
+                print(f'[{self.getTime()}] Date: {date} failed. {e}')
+            finally:
+                # Clean up whatever is left in the staging directory.
+                for filename in listdir(staging_dir):
+                    remove(f'{staging_dir}{filename}')
+                os.rmdir(staging_dir)
+                self.report(date)
+        
+        # Run the downloads through a bounded pool of workers.
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(downloadDate, self.date_list))
+        
+        # Keep the downloaded dates in order, as they finish in any order.
+        self.downloaded_dates = sorted(self.downloaded_dates)
+        
+        # Print a summary of the downloads.
+        print(f'[{self.getTime()}] {len(self.downloaded_dates)} of {len(self.date_list)} dates were downloaded and refined.')
+        if len(self.failed_dates) > 0:
+            print(f'[{self.getTime()}] Dates that failed: {sorted(self.failed_dates)}')
+
+    def report(self, date):
+        # Pass the finished date on to the next stage, if there is one. This waits while the queue is full.
+        if self.refined is not None: self.refined.put(date)
+    
+    def indexWindow(self, lats, lons):
+        # Find the index range of the 1-D lat and lon coordinates that fall within the area of interest.
+        lat_idx = where((lats >= self.min_lat) & (lats <= self.max_lat))[0]
+        lon_idx = where((lons >= self.min_lon) & (lons <= self.max_lon))[0]
+        
+        return slice(int(lat_idx[0]), int(lat_idx[-1]) + 1), slice(int(lon_idx[0]), int(lon_idx[-1]) + 1)
+    
+    def requestOPeNDAP(self, url, constraint, filename):
+        # Every thread keeps its own session, which reuses the EarthData login (from .netrc) between requests.
+        if not hasattr(self.local, 'session'): self.local.session = requests.Session()
+        
+        # Request the constrained variables as a NetCDF4 file, and save it to filename.
+        with self.instrument.timer('opendap'):
+            response = self.local.session.get(f'{url}.dap.nc4', params={'dap4.ce': constraint}, timeout=300)
+        response.raise_for_status()
+        with open(filename, 'wb') as f:
+            f.write(response.content)
+    
+    def downloadOPeNDAP(self, date, download_dir):
+        # OPeNDAP url of the granule for this date.
+        granule = self.config['opendap']['granule'].format(date=date.replace('-', ''))
+        url = f"{self.config['opendap']['url']}{granule}"
+        
+        print(f'[{self.getTime()}] Requesting the Date: {date} from OPeNDAP. Please give this a moment...')
+        
+        try:
+            # The MUR grid is the same for every granule, so the lat and lon are only requested for the first date. The
+            # grid is opened under fix_lock, as FixData may be using the netCDF library at the same time. It has its own
+            # lock (not self.lock), as FixData takes self.lock while it holds fix_lock.
+            with self.window_lock:
+                if self.opendap_window is None:
+                    self.requestOPeNDAP(url, '/lat;/lon', f'{download_dir}grid.nc')
+                    with self.fix_lock:
+                        grid = nc.Dataset(f'{download_dir}grid.nc', 'r')
+                        self.opendap_window = self.indexWindow(grid.variables['lat'][:], grid.variables['lon'][:])
+                        grid.close()
+                    remove(f'{download_dir}grid.nc')
+            lat_slice, lon_slice = self.opendap_window
             
-            # Create a new netCDF file with the filtered data
-            new_file = nc.Dataset(f'{self.refined_dir}{date_sp}.nc', 'w')
+            # Request only the analysed_sst window (and its coordinates). OPeNDAP index ranges include the last index.
+            lat_range = f'[{lat_slice.start}:{lat_slice.stop - 1}]'
+            lon_range = f'[{lon_slice.start}:{lon_slice.stop - 1}]'
+            constraint = f'/analysed_sst[0]{lat_range}{lon_range};/lat{lat_range};/lon{lon_range};/time'
+            self.requestOPeNDAP(url, constraint, f'{download_dir}{granule}.nc')
+        except requests.RequestException as e:
+            with self.lock: self.failed_dates[date] = str(e)
+            print(f'[{self.getTime()}] The Date: {date} could not be requested from OPeNDAP. {e}')
+            return
+        
+        # Refine the (already small) file the same way as a full download.
+        with self.fix_lock, self.instrument.timer('fixdata'): day_downloaded = self.FixData(date, download_dir, f'{granule}.nc')
+        if day_downloaded:
+            print(f'[{self.getTime()}] Date: {date} has been downloaded and refined. [{len(self.downloaded_dates)} / {len(self.date_list)}]')
+
+    def downloadBulk(self):
+        # Check for the .netrc file before starting.
+        if not self.netrc_check:
+            self.checkNetRC()
+        
+        # If no runs of dates were given, group the dates into contiguous runs.
+        if self.date_ranges is None: self.date_ranges = BMNP_Data.groupDateRanges(self.date_list)
+        
+        # Split any run longer than bulk_days, so that the download directory never holds too many global files.
+        pending = []
+        for start, end in self.date_ranges:
+            start = datetime.strptime(start, '%Y-%m-%d')
+            end = datetime.strptime(end, '%Y-%m-%d')
+            while start <= end:
+                stop = min(start + timedelta(days=self.bulk_days - 1), end)
+                pending.append((start.strftime('%Y-%m-%d'), stop.strftime('%Y-%m-%d')))
+                start = stop + timedelta(days=1)
+        
+        print(f'[{self.getTime()}] Downloading {len(self.date_list)} dates in {len(pending)} requests...')
+        
+        # The dates asked for, as a set for the checks of every day of every request.
+        wanted = set(self.date_list)
+        
+        for start, end in pending:
+            # Each request gets its own staging directory.
+            staging_dir = f'{self.download_dir}{start}_{end}/'
+            if not path.exists(staging_dir): os.mkdir(staging_dir)
             
-            # Create dimensions
-            new_file.createDimension('lon', len(lons))
-            new_file.createDimension('lat', len(lats))
-            new_file.createDimension('time', None)
+            # Run one podaac-data-downloader call for the whole range.
+            print(f'[{self.getTime()}] Downloading the Dates: {start} to {end}. Please give this a moment...')
+            with self.instrument.timer('downloader'):
+                command_run = run(self.setCommand(start, staging_dir, end), capture_output=True, text=True)
             
-            #  Create variables
-            new_lons = new_file.createVariable('lon', 'f4', ('lon',))
-            new_lats = new_file.createVariable('lat', 'f4', ('lat',))
-            new_temp = new_file.createVariable('analysed_sst', 'f4', ('time', 'lat', 'lon'))
-            new_time = new_file.createVariable('time', 'f4', ('time',))
+            # Delete items that have ".txt" extensions, leaving the granules.
+            for filename in listdir(staging_dir):
+                if filename.endswith('.txt'):
+                    remove(f'{staging_dir}{filename}')
             
-            # Add attributes
-            new_lons.units = 'degrees_east'
-            new_lats.units = 'degrees_north'
-            new_temp.units = 'kelvin'
-            new_time.units = 'days since 1981-01-01 00:00:00'
+            # Fan each granule out through FixData. Granule names start with the date (YYYYMMDD).
+            for filename in sorted(listdir(staging_dir)):
+                try:
+                    date = datetime.strptime(filename[0:8], '%Y%m%d').strftime('%Y-%m-%d')
+                except ValueError:
+                    print(f'[{self.getTime()}] The file {filename} does not start with a date. Skipping this file.')
+                    remove(f'{staging_dir}{filename}')
+                    continue
+                
+                with self.fix_lock, self.instrument.timer('fixdata'): day_downloaded = self.FixData(date, staging_dir, filename)
+                if day_downloaded:
+                    print(f'[{self.getTime()}] Date: {date} has been downloaded and refined. [{len(self.downloaded_dates)} / {len(self.date_list)}]')
             
-            # Add data
-            new_lons[:] = lons
-            new_lats[:] = lats
-            new_temp[:] = temp
-            new_file.variables['time'][:] = time
+            # Any date in the range without a granule failed. The downloaded dates grow with every request, so their set
+            # is made once per request.
+            downloaded = set(self.downloaded_dates)
+            day, last = datetime.strptime(start, '%Y-%m-%d'), datetime.strptime(end, '%Y-%m-%d')
+            while day <= last:
+                date = day.strftime('%Y-%m-%d')
+                if date in wanted and date not in downloaded:
+                    reason = command_run.stderr.strip().split('\n')[-1] if command_run.returncode != 0 else 'No files were downloaded.'
+                    self.failed_dates[date] = reason
+                if date in wanted: self.report(date)
+                day += timedelta(days=1)
             
-            # Close the files
-            file.close()
-            new_file.close()
+            # Clean up the staging directory.
+            for filename in listdir(staging_dir):
+                remove(f'{staging_dir}{filename}')
+            os.rmdir(staging_dir)
+        
+        # Print a summary of the downloads.
+        print(f'[{self.getTime()}] {len(self.downloaded_dates)} of {len(self.date_list)} dates were downloaded and refined.')
+        if len(self.failed_dates) > 0:
+            print(f'[{self.getTime()}] Dates that failed: {sorted(self.failed_dates)}')
+
+    def FixData(self, date_sp, download_dir = None, filename = None):
+        # By default, the downloaded file is in the download directory itself.
+        if download_dir is None: download_dir = self.download_dir
+        
+        # Check to see if the directory is empty, if so, return None.
+        if len(listdir(download_dir)) == 0:
+            # Print a statement stating that no files were downloaded.
+            print(f'[{self.getTime()}] No files were downloaded for {date_sp}... Please ensure that the login credentials are correct.')
             
-            # Remove the old file
-            remove(self.download_dir + filename)
+            # Record the failure.
+            with self.lock: self.failed_dates[date_sp] = 'No files were downloaded.'
             
-            return True
+            return False
+        else:
+            # Print a statement stating that the files were downloaded.
+            print(f'[{self.getTime()}] Files for the date {date_sp} were downloaded. Now fixing the data...')
+        
+        # Check the directory and delete items that have ".txt" extensions
+        for item in listdir(download_dir):
+            if item.endswith('.txt'):
+                remove(f'{download_dir}{item}')
+        
+        # Open the only other item which is an .nc file, unless the file was given.
+        if filename is None: filename = listdir(download_dir)[0]
+        file = nc.Dataset(download_dir + filename, 'r')
+        
+        # Filter the data to the area of interest. The index window is found from the 1-D lat and lon first, so
+        # that only that section of analysed_sst is ever read from the file.
+        lons = file.variables['lon'][:]
+        lats = file.variables['lat'][:]
+        time = file.variables['time'][:]
+        
+        lat_slice, lon_slice = self.indexWindow(lats, lons)
+        
+        lons = lons[lon_slice]
+        lats = lats[lat_slice]
+        temp = file.variables['analysed_sst'][:, lat_slice, lon_slice]
+        
+        # Create a new netCDF file with the filtered data
+        new_file = nc.Dataset(f'{self.refined_dir}{date_sp}.nc', 'w')
+        
+        # Create dimensions
+        new_file.createDimension('lon', len(lons))
+        new_file.createDimension('lat', len(lats))
+        new_file.createDimension('time', None)
+        
+        #  Create variables
+        new_lons = new_file.createVariable('lon', 'f4', ('lon',))
+        new_lats = new_file.createVariable('lat', 'f4', ('lat',))
+        new_temp = createGrid(new_file, 'analysed_sst', ('time', 'lat', 'lon'), 'kelvin', storageProfile(self.config))
+        new_time = new_file.createVariable('time', 'f4', ('time',))
+        
+        # Add attributes
+        new_lons.units = 'degrees_east'
+        new_lats.units = 'degrees_north'
+        new_time.units = 'days since 1981-01-01 00:00:00'
+        
+        # Add data
+        new_lons[:] = lons
+        new_lats[:] = lats
+        new_temp[:] = temp
+        new_file.variables['time'][:] = time
+        
+        # Close the files
+        file.close()
+        new_file.close()
+        
+        # Take new "temp" data, convert to csv using pandas dataframe, and save it to refined_csv directory. This is done
+        # after the nc file is closed, so the csv file is never older than it (see recreateCSVs).
+        if self.text_csvs:
+            df = DataFrame(temp[0], index=lats, columns=lons)
+            df.to_csv(f'{self.refined_csv}{date_sp}.csv')
+        
+        # Add the day (in Celsius) to the accumulated sst data. If that fails, the day is still recorded, and
+        # databaseSetup adds it to the archive later (it adds every catalogued day that the archive does not have).
+        if self.archive is not None:
+            try:
+                self.archive.write(date_sp, temp[0] - 273.15, lats, lons)
+            except Exception as e:
+                print(f'[{self.getTime()}] The Date: {date_sp} could not be added to the database, it will be added later. {e}')
+        
+        # Record the day, and the granule it came from, in the catalog.
+        if self.catalog is not None: self.catalog.record(date_sp, 'sst', filename)
+        
+        # Remove the old file
+        remove(download_dir + filename)
+        
+        # Add date to the downloaded_dates list
+        with self.lock: self.downloaded_dates.append(date_sp)
         
+        return True
+
+    def downloadData(self, date, command, download_dir = None):
         # Run the command
-        print(f'[{getTime()}] Downloading the Date: {date}. Please give this a moment...')
+        print(f'[{self.getTime()}] Downloading the Date: {date}. Please give this a moment...')
         
         # Run subprocess run
-        command_run = run(command, capture_output=True, text=True)
+        with self.instrument.timer('downloader'): command_run = run(command, capture_output=True, text=True)
         
         # Run the FixData Function
-        day_downloaded = FixData(date, command_run)
+        with self.fix_lock, self.instrument.timer('fixdata'): day_downloaded = self.FixData(date, download_dir)
         
         # Print new statement stating it was downloaded.
-        if day_downloaded: print(f'[{getTime()}] Date: {date} has been downloaded and refined.')
+        if day_downloaded: print(f'[{self.getTime()}] Date: {date} has been downloaded and refined. [{len(self.downloaded_dates)} / {len(self.date_list)}]')
+        
+        # If the downloader itself failed, keep its error message for the date.
+        elif command_run.returncode != 0:
+            with self.lock: self.failed_dates[date] = command_run.stderr.strip().split('\n')[-1]
+
+class BMNP_DHWWindow:
+    def __init__(self, bleaching_threshold, days = 84, alert_days = 7):
+        # Bleaching threshold (MMM, in Celsius), the number of days in the window, and the number of days of
+        # alert levels kept for the alert area (the highest level of the last alert_days days).
+        self.bleaching_threshold = bleaching_threshold
+        self.days = days
+        self.alert_days = alert_days
+
+        # Start with an empty window.
+        self.reset()
+
+    def reset(self):
+        # Ring buffer of the clipped daily HotSpots, and the running sum over the buffer.
+        self.buffer = None
+        self.total = None
+        self.count = 0
+        
+        # HotSpot of the newest day, and a ring buffer of the alert levels of the last alert_days days.
+        self.latest = None
+        self.levels = None
+
+        # Pixels with no sst (or no threshold) on the newest day, which are masked in the DHW.
+        self.mask = None
+
+    def hotspot(self, sst_data):
+        # Do sst_data - bleaching_threshold
+        sst_data_dailydhw = sst_data - self.bleaching_threshold
+
+        # Keep the missing pixels of the day (land), then count them as 0.
+        self.mask = ma.getmaskarray(sst_data_dailydhw)
+        sst_data_dailydhw = ma.filled(sst_data_dailydhw, 0)
+
+        # Replace all negative values with 0
+        return where(sst_data_dailydhw < 0, 0, sst_data_dailydhw)
+
+    def push(self, sst_data):
+        # A day that could not be read adds nothing to the window.
+        if sst_data is None:
+            if self.buffer is None: return
+            daily = zeros(self.total.shape)
+        else:
+            daily = self.hotspot(sst_data)
+
+        # Create the ring buffer on the first day, with the shape of the grid.
+        if self.buffer is None:
+            self.buffer = zeros((self.days,) + shape(daily))
+            self.total = zeros(shape(daily))
+            self.levels = zeros((self.alert_days,) + shape(daily), dtype=uint8)
+
+        # Subtract the day that drops out of the window, then add the newest day in its place.
+        slot = self.count % self.days
+        self.total -= self.buffer[slot]
+        self.buffer[slot] = daily
+        self.total += daily
+        
+        # The alert level of the day, from its HotSpot and the DHW that it brings the window to.
+        self.latest = daily
+        self.levels[self.count % self.alert_days] = alertLevel(daily, around(self.total / 7.0, 2))
+        self.count += 1
+
+    def dhw(self):
+        # Sum of the HotSpots in degree heating weeks, rounded to 2 decimal places.
+        return ma.masked_array(around(self.total / 7.0, 2), mask=self.mask)
+    
+    def alerts(self):
+        # HotSpot, alert level and alert area (the highest alert level of the last alert_days days) of the newest day.
+        return {'hotspot': ma.masked_array(self.latest, mask=self.mask),
+                'alert': ma.masked_array(self.levels[(self.count - 1) % self.alert_days], mask=self.mask),
+                'alert_area': ma.masked_array(self.levels.max(axis=0), mask=self.mask)}
 
 class BMNP_Data:
-    def __init__(self, startdate, enddate, downloadnew = False, downloadtype = 'loop', create_databases = False, delete_singles = False, delete_bulk = False, manually = False, recreate_csvs = False):
+    def __init__(self, startdate, enddate, downloadnew = False, downloadtype = 'loop', create_databases = False, delete_singles = False, delete_bulk = False, manually = False, recreate_csvs = False, download_workers = 4, prerender = False, export_format = None, text_csvs = True, report = False, profile = None, dhw_workers = 1, pipeline = False, queue_size = 16):
         # Read config.ini file
         self.config = ConfigParser()
         self.config.read('config.ini')
         
+        # Timings, file and I/O counts and peak memory of each stage. With report (or profile) on, they are written to a
+        # JSON report in the reports folder at the end of the run.
+        self.instrument = BMNP_Instrument(self.config['folders']['reports'] if report or profile else None, profile)
+        
+        # netCDF files are only opened by one thread at a time (the pipeline shares its lock here, see BMNP_Pipeline).
+        self.nc_lock = Lock()
+        
+        # Run every stage. The instrument is closed even if a stage fails, so that it stops counting and
+        # netCDF4.Dataset is put back (the report is only written when the run finishes).
+        try:
+            self.runStages(startdate, enddate, downloadnew, downloadtype, create_databases, delete_singles, delete_bulk, manually,
+                           recreate_csvs, download_workers, prerender, export_format, text_csvs, dhw_workers, pipeline, queue_size)
+        finally:
+            self.instrument.close()
+    
+    def runStages(self, startdate, enddate, downloadnew, downloadtype, create_databases, delete_singles, delete_bulk, manually,
+                  recreate_csvs, download_workers, prerender, export_format, text_csvs, dhw_workers, pipeline, queue_size):
         # Directories
         self.download_dir = f"{self.config['folders']['nc_download']}"
         self.refined_dir = f"{self.config['folders']['nc_sst']}"
@@ -200,6 +539,7 @@ class BMNP_Data:
         self.csv_sst = f"{self.config['folders']['csv_sst']}"
         self.nc_dhw = f"{self.config['folders']['nc_dhw']}"
         self.csv_dhw = f"{self.config['folders']['csv_dhw']}"
+        self.nc_alert = f"{self.config['folders']['nc_alert']}"
         
         self.csv_month_sst = f"{self.config['folders']['monthly_csv_sst']}"
         self.nc_month_sst = f"{self.config['folders']['monthly_nc_sst']}"
@@ -208,14 +548,26 @@ class BMNP_Data:
         
         self.pandas_dir = f"{self.config['folders']['csv_dataframes']}"
         
+        # Coastline used for the ocean masks, and the folder where the masks are cached.
+        self.shapefile = self.config.get('mask', 'shapefile', fallback='./shape/BON_Coastline.shp')
+        self.masks_dir = self.config.get('folders', 'masks', fallback=f'{self.data_dir}masks/')
+        
+        # Folder where the alignments of the bleaching threshold with the sst grid are cached.
+        self.alignments_dir = self.config.get('folders', 'alignments', fallback=f'{self.data_dir}alignments/')
+        
         # Make a list of the directories that were just listed.
-        self.dirs = [self.pandas_dir, self.download_dir, self.refined_dir, self.data_dir, self.csv_sst, self.nc_dhw, self.csv_dhw, self.csv_month_sst, self.nc_month_sst, self.csv_month_dhw, self.nc_month_dhw]
+        self.dirs = [self.pandas_dir, self.download_dir, self.refined_dir, self.data_dir, self.csv_sst, self.nc_dhw, self.csv_dhw, self.nc_alert, self.csv_month_sst, self.nc_month_sst, self.csv_month_dhw, self.nc_month_dhw]
         
         # Check to see if the directories exist. If not, create them.
         for directory in self.dirs:
             if not path.exists(directory): os.mkdir(directory)
         
-        # NOTE: downloadtype is either loop or bulk. Loop will download each file individually. Bulk will download all files at once.
+        # NOTE: downloadtype is either loop, parallel, bulk or opendap. Loop will download each file individually. Parallel will download
+        # download_workers files at a time. Bulk will download all files at once. OPeNDAP will only request the area of interest.
+        # NOTE: dhw_workers is the number of processes that create the single-day DHW files (1 creates them in this process).
+        # NOTE: export_format is None, npy or parquet (see BMNP_Export). With text_csvs off, the daily and monthly csv grids are not written.
+        # NOTE: With pipeline on, the new dates are downloaded, made into DHWs and summarised at the same time (see BMNP_Pipeline),
+        # with at most queue_size dates waiting between two stages.
         # Get the start end dates
         self.start_date = self.changeDateLayout(startdate)
         self.end_date = self.changeDateLayout(enddate)
@@ -223,84 +575,146 @@ class BMNP_Data:
         # Get other parameters
         self.downloadnew = downloadnew
         self.downloadtype = downloadtype
+        self.download_workers = download_workers
         self.create_databases = create_databases
         self.delete_singles = delete_singles
         self.delete_bulk = delete_bulk
+        self.text_csvs = text_csvs
+        self.dhw_workers = dhw_workers
         
         # Make list of dates between start and end date
         self.dates = self.makeDateList()
         
-        # List of missing dates from 2002-06-01 to today.
-        self.missing_dates = self.checkMissingDates()
+        # Accumulated sst data (sst_bmnp.nc). When the databases are on, FixData adds each new day to it directly.
+        self.archive = self.openArchive() if self.create_databases else None
+        
+        # Catalog of which dates have sst and dhw files. Every stage reads and updates this instead of listing the folders.
+        with self.instrument.stage('catalog'):
+            self.catalog = BMNP_Catalog(f'{self.data_dir}bmnp_catalog.db', {'sst': self.refined_dir, 'dhw': self.nc_dhw, 'alert': self.nc_alert})
+            
+            # List of missing dates from 2002-06-01 to today.
+            self.missing_dates = self.checkMissingDates()
         print(f'[{self.getHrMnSc()}] Dates Missing from SST Database: {self.missing_dates}')
         
         # Dates Missing boolean
         self.dates_missing = True
         
+        # Whether the DHWs and summaries were already made by the pipeline.
+        streamed = False
+        
         # From missing dates, check to see what dates in self.dates are missing.
         # if type(self.missing_dates) != None: self.missing_dates = [date for date in self.dates if date in self.missing_dates]
         # If self.missing_dates is not empty:
         if len(self.missing_dates) > 0:
+            # Stream the missing dates through the download, DHW and summary stages at once.
+            if self.downloadnew and pipeline and not manually:
+                # The single files are deleted first, so that the pipeline makes them again.
+                if self.delete_singles: self.deleteSingles()
+                with self.instrument.stage('pipeline'):
+                    self.download = BMNP_Pipeline(self, BMNP_Download, queue_size=queue_size).run(self.missing_dates)
+                streamed = True
+            
             # Create instance of BMNP_Download here
-            if self.downloadnew:
+            elif self.downloadnew:
                 print(f'[{self.getHrMnSc()}] Setting Up the Download for Missing Dates...')
-                self.download = BMNP_Download(dates=self.missing_dates, type=self.downloadtype)
+                with self.instrument.stage('download'):
+                    self.download = BMNP_Download(dates=self.missing_dates, type=self.downloadtype, workers=self.download_workers,
+                                                  date_ranges=self.groupDateRanges(self.missing_dates), archive=self.archive,
+                                                  catalog=self.catalog, text_csvs=self.text_csvs, instrument=self.instrument)
         else:
             self.dates_missing = False
         
         if manually:
             # Create a self.download object.
-            self.download = BMNP_Download(dates=self.dates, type=self.downloadtype, manually=True)
+            self.download = BMNP_Download(dates=self.dates, type=self.downloadtype, manually=True, catalog=self.catalog,
+                                          text_csvs=self.text_csvs)
         
         #################################################
         ##             Database Creation               ##
         #################################################
-        # if self.create_databases:
-        #     # Run the database function
-        #     self.databaseSetup(self.missing_dates)
+        if self.create_databases and not manually:
+            # Add any refined files that are not in the database yet (new downloads were already added by FixData).
+            with self.instrument.stage('database_sst'): self.databaseSetup(self.missing_dates)
             
-        #     # Run the database reordering function.
-        #     print(f'[{self.getHrMnSc()}] Reordering the database...')
-        #     self.databaseReorder()
-            
-        #     # Now we need to remake the DHW data into a new netCDF file.
-        #     print(f'[{self.getHrMnSc()}] Calculating DHW...')
-        #     self.dhwDatabase(self.missing_dates)
-        # else:
-        #     print(f'[{self.getHrMnSc()}] Database creation is turned off. Please turn on to create the databases.')
+            # Now we need to remake the DHW data into a new netCDF file.
+            print(f'[{self.getHrMnSc()}] Calculating DHW...')
+            with self.instrument.stage('database_dhw'): self.dhwDatabase(self.missing_dates)
         
         # Delete the single files in the csv_sst, csv_dhw and nc_dhw folders.
-        if self.delete_singles and not manually:
-            print(f'[{self.getHrMnSc()}] Deleting non-downloadable single-day files...')
-            # for file in listdir(self.csv_sst):
-            #     remove(f'{self.csv_sst}{file}')
-            for file in listdir(self.csv_dhw):
-                remove(f'{self.csv_dhw}{file}')
-            for file in listdir(self.nc_dhw):
-                remove(f'{self.nc_dhw}{file}')
+        if self.delete_singles and not manually and not streamed:
+            self.deleteSingles()
         
         # Create individual DHW files
-        if not manually:
+        if not manually and not streamed:
             print(f'[{self.getHrMnSc()}] Creating DHW files...')
-            self.createDHWs()
+            with self.instrument.stage('dhw'): self.createDHWs()
         
         # Create CSV files from the refined netCDF files.
-        if not manually and recreate_csvs: self.recreateCSVs()
+        if not manually and recreate_csvs:
+            with self.instrument.stage('recreate_csvs'): self.recreateCSVs()
         
         # Run the monthly calculations
-        if not manually: self.monthlyCalculations()
+        if not manually and not streamed:
+            with self.instrument.stage('monthly'): self.monthlyCalculations()
+        
+        # Update the table of daily statistics
+        if not manually and not streamed:
+            with self.instrument.stage('daily_statistics'): self.dailyStatistics()
+        
+        # Export the daily grids in a binary format (npy or parquet).
+        if not manually and export_format is not None:
+            with self.instrument.stage('export'):
+                BMNP_Export(self.config['folders']['export'], self.catalog, export_format).export()
+        
+        # Render the dashboard maps of the newest day ahead of time.
+        if not manually and prerender:
+            with self.instrument.stage('prerender'): self.prerenderNewest()
         
         # Print a statement stating that everything is in order.
         if not manually:
             print(f'[{self.getHrMnSc()}] Everything is in order.')
+            
+            # Write the run report (if it is turned on).
+            report_file = self.instrument.finish(start_date=self.start_date, end_date=self.end_date, downloadtype=self.downloadtype,
+                                                 missing_dates=len(self.missing_dates), downloaded_dates=len(self.download.downloaded_dates) if hasattr(self, 'download') else 0)
+            if report_file is not None: print(f'[{self.getHrMnSc()}] The run report has been saved to {report_file}.')
+    
+    def deleteSingles(self):
+        # Delete the single files in the csv_dhw, nc_dhw and nc_alert folders.
+        print(f'[{self.getHrMnSc()}] Deleting non-downloadable single-day files...')
+        # for file in listdir(self.csv_sst):
+        #     remove(f'{self.csv_sst}{file}')
+        for file in listdir(self.csv_dhw):
+            remove(f'{self.csv_dhw}{file}')
+        for file in listdir(self.nc_dhw):
+            remove(f'{self.nc_dhw}{file}')
+        for file in listdir(self.nc_alert):
+            remove(f'{self.nc_alert}{file}')
+        self.catalog.forget('dhw')
+        self.catalog.forget('alert')
     
     def getHrMnSc(self):
         now = datetime.now()
         return now.strftime('%H:%M:%S')
     
-    def checkMissingDates(self):
-        # Make a list of items of refined nc files.
-        files = listdir(f'{self.refined_dir}')
+    @staticmethod
+    def groupDateRanges(dates):
+        # Group a list of YYYY-MM-DD dates into contiguous (start, end) runs.
+        ranges = []
+        for date in sorted(dates):
+            day = datetime.strptime(date, '%Y-%m-%d')
+            
+            # Extend the last run if this date follows on from it. Otherwise start a new run.
+            if len(ranges) > 0 and datetime.strptime(ranges[-1][1], '%Y-%m-%d') + timedelta(days=1) == day:
+                ranges[-1][1] = date
+            else:
+                ranges.append([date, date])
+        
+        return [tuple(run) for run in ranges]
+    
+    def checkMissingDates(self, ranges = False):
+        # Get the set of dates that have refined nc files, from the catalog.
+        files = self.catalog.dates('sst')
         
         # Make a list of "start" and "end", which the start and end are self.start_date and self.end_date
         start = datetime.strptime(self.start_date, '%Y-%m-%d')
@@ -313,15 +727,18 @@ class BMNP_Data:
         
         # Cycle through all_dates. Check to see if it is in "files". If not, add to missing_dates.
         for date in all_dates:
-            if f'{date}.nc' not in files:
+            if date not in files:
                 missing_dates.append(date)
         
+        # Return the missing dates as contiguous (start, end) runs if asked.
+        if ranges: return self.groupDateRanges(missing_dates)
+        
         return missing_dates
     
-    def makeDateList(self):
-        # Make list of dates from self.start_date to self.end_date
-        start = datetime.strptime(self.start_date, '%Y-%m-%d')
-        end = datetime.strptime(self.end_date, '%Y-%m-%d')
+    def makeDateList(self, start = None, end = None):
+        # Make list of dates from start to end (by default self.start_date to self.end_date)
+        start = datetime.strptime(self.start_date if start is None else start, '%Y-%m-%d')
+        end = datetime.strptime(self.end_date if end is None else end, '%Y-%m-%d')
         
         # Make list of dates between start and end date
         dates = [start + timedelta(n) for n in range(int((end-start).days)+1)]
@@ -382,240 +799,66 @@ class BMNP_Data:
             printStatement(date, nd=True)
             return 'nd'
 
+    def openArchive(self):
+        # The accumulated sst data lives in sst_bmnp.nc in the data folder, with one slot per day (in Celsius).
+        # Its slots start at the beginning of the MUR record (EPOCH), so any date can be added to it later.
+        archive = BMNP_Archive(f'{self.data_dir}sst_bmnp.nc', storage=storageProfile(self.config))
+        
+        # Check to see if the file was made in an older layout (sorted by time, no start date, or slots starting after
+        # EPOCH). If so, delete it. databaseSetup adds every catalogued day to the new one.
+        if archive.exists() and (not archive.isValid() or archive.start_date != EPOCH):
+            print(f'[{self.getHrMnSc()}] The ".nc" file is not correctly formatted. Deleting and creating a new one.')
+            remove(archive.filename)
+            archive = BMNP_Archive(f'{self.data_dir}sst_bmnp.nc', storage=storageProfile(self.config))
+        
+        return archive
+
     def databaseSetup(self, missing_dates):
-        def dateSince(date):
-            date = datetime.strptime(date, '%Y-%m-%d')
-            
-            # Calculate the number of days since 1981-01-01
-            since = date - datetime(1981, 1, 1)
-            
-            return since.days
+        # Open the accumulated sst data (if it was not already opened for the download).
+        archive = self.archive if self.archive is not None else self.openArchive()
         
-        # Check to see if the database and nc files named the following are in the config['folders']['data'] directory
-        # 1. sst_bmnp.nc
-        data_folder = listdir(f"{self.config['folders']['data']}")
+        if not archive.exists():
+            print(f'[{self.getHrMnSc()}] No ".nc" file with accumulated data was found. A new file will be created in the directory "{self.data_dir}" called "sst_bmnp.nc".')
         
-        # Checks, True/False for each:
-        # db_exists = 'bmnp.db' in data
-        nc_exists = 'sst_bmnp.nc' in data_folder
+        # Find the dates in the refined folder that are not in the accumulated file yet (new downloads are added by FixData).
+        files = self.catalog.dates('sst')
+        dates = sorted(files - set(archive.dates()))
         
-        if nc_exists:
-            nc_accumulated = nc.Dataset(f'{self.config["folders"]["data"]}sst_bmnp.nc', 'r')
-            
-            # Check to see if the "time" variable exists, if not, set nc_exists to False and delete that file.
-            if 'time' not in nc_accumulated.variables:
-                print(f'[{self.getHrMnSc()}] The ".nc" file is not correctly formatted. Deleting and creating a new one.')
-                nc_exists = False
-                remove(f'{self.config["folders"]["data"]}sst_bmnp.nc')
-        
-        # If nc_exists, open the file and check the last date.
-        if nc_exists:
-            # Get the last date in nc_accumulated.
-            last_date_nc = nc_accumulated.variables['time'][-1]
-            last_date_nc = datetime(1981, 1, 1) + timedelta(days=int(last_date_nc))
-            last_date_nc = last_date_nc.strftime('%Y-%m-%d')
-            
-            # Find the last date in the refined folder
-            last_date_acc = listdir(self.refined_dir)[-1][0:10]
-            
-            # Check to see if the last date is the same as the last date in the refined folder.
-            if last_date_nc == last_date_acc or len(missing_dates) == 0:
-                print(f'[{self.getHrMnSc()}] The ".nc" file with accumulated data is up to date. No new data is needed.')
-            else:
-                # Calculate the number of days between the last date in nc and the last date in the refined folder.
-                last_date_nc = datetime.strptime(last_date_nc, '%Y-%m-%d')
-                last_date_acc = datetime.strptime(last_date_acc, '%Y-%m-%d')
-                days = (last_date_acc - last_date_nc).days
-                
-                # Check to see if the number of days is greater than 0.
-                if days > 0:
-                    # Print message stating that the nc file needs to be updated.
-                    print(f'[{self.getHrMnSc()}] The ".nc" file with accumulated data is not up to date. A total of {days} files need to be added to the database.')
-                    
-                    # Take the last number of "days" in the last_refined files and add them to the nc file.
-                    if len(missing_dates) > 0:
-                        for idx, file in enumerate(files[-days:]):
-                            # Open the file
-                            data = nc.Dataset(self.refined_dir + file, 'r')
-                            
-                            # Retrieve the data
-                            lons = data.variables['lon'][:]
-                            lats = data.variables['lat'][:]
-                            temp = data.variables['analysed_sst'][:]
-                            time = data.variables['time'][:]
-                            
-                            # Add the data to the nc file
-                            nc_accumulated.variables['analysed_sst'][idx] = temp - 273.14
-                            nc_accumlation.variables['time'][idx] = dateSince(file[0:10])
-                            
-                            # Close the file
-                            data.close()
-                            
-                            # If the index is divisible by 50, print a message stating that the file is being added, out of the total.
-                            if idx % 50 == 0 and idx != 0:
-                                print(f'[{self.getHrMnSc()}] File [{idx} / {days}] is being added to the database.')
-                else:
-                    # Print that we need to add specific dates to the nc file.
-                    print(f'[{self.getHrMnSc()}] The ".nc" file with accumulated data is not up to date. Specific dates need to be added to the database.')
-                    
-                    # We need to add specific dates to the nc file.
-                    for date in missing_dates:
-                        # Open the file
-                        data = nc.Dataset(self.refined_dir + date + '.nc', 'r')
-                        
-                        # Retrieve the data
-                        lons = data.variables['lon'][:]
-                        lats = data.variables['lat'][:]
-                        temp = data.variables['analysed_sst'][:]
-                        time = data.variables['time'][:]
-                        
-                        # Add the data to the nc file
-                        nc_accumulated.variables['analysed_sst'][idx] = temp - 273.14
-                        nc_accumlation.variables['time'][idx] = dateSince(date)
-                        
-                        # Close the file
-                        data.close()
-                        
-                        # If the index is divisible by 50, print a message stating that the file is being added, out of the total.
-                        if idx % 50 == 0 and idx != 0:
-                            print(f'[{self.getHrMnSc()}] File [{idx} / {len(missing_dates)}] is being added to the database.')
-                
-                print(f'[{self.getHrMnSc()}] All files have been added to the database.')
-                # Close the nc file
-                nc_accumlation.close()
-        else:
-            # Print message stating that the nc file does not exist and that it will be created.
-            print(f'[{self.getHrMnSc()}] No ".nc" file with accumulated data was found. A new file will be created in the directory "{self.config["folders"]["data"]}" called "sst_bmnp.nc".')
-            
-            # We need to create the nc file that is an accumulation of all nc files in config['folders']['nc_sst']
-            nc_accumlation = nc.Dataset(f"{self.config['folders']['data']}sst_bmnp.nc", 'w')
-            
-            # Create a list of files in the nc_sst directory
-            files = listdir(self.refined_dir)
-            
-            # Print a messages stating how many files there are. If there is over 1,000 files, then state there are many files and this may take some time.
-            if len(files) > 1000:
-                print(f'[{self.getHrMnSc()}] There are {len(files)} files that need to be added. This may take some time.')
+        if len(dates) == 0:
+            print(f'[{self.getHrMnSc()}] The ".nc" file with accumulated data is up to date. No new data is needed.')
+            return
+        
+        # Print a messages stating how many files there are. If there is over 1,000 files, then state there are many files and this may take some time.
+        if len(dates) > 1000:
+            print(f'[{self.getHrMnSc()}] There are {len(dates)} files that need to be added. This may take some time.')
+        
+        # Add the files one run of consecutive dates at a time, with a single write for each run.
+        added = 0
+        for start, end in self.groupDateRanges(dates):
+            run_dates = self.makeDateList(start, end)
+            cube = []
             
-            # Cycle through the files and add them to the nc_accumlation file, with their respective dates.
-            # For the first files, create dimensions using the the variable "lat" and "lon" from the file.
-            # "analysed_sst" will be the data. Subtract 273.14 from the data to convert to Celsius.
-            # Also, using datetime library, convert retrieved date to a number of days since 1981-01-01 00:00:00
-            # Add the data to the nc_accumlation file.
-            for idx, file in enumerate(files):
+            for date in run_dates:
                 # Open the file
-                data = nc.Dataset(self.refined_dir + file, 'r')
+                data = nc.Dataset(f'{self.refined_dir}{date}.nc', 'r')
                 
-                # Get the data
+                # Get the data, converted to Celsius
                 lons = data.variables['lon'][:]
                 lats = data.variables['lat'][:]
-                temp = data.variables['analysed_sst'][:]
-                time = data.variables['time'][:]
-                
-                # Create the dimensions
-                if idx == 0:
-                    nc_accumlation.createDimension('lon', len(lons))
-                    nc_accumlation.createDimension('lat', len(lats))
-                    nc_accumlation.createDimension('time', None)
-                    
-                    # Create the variables
-                    nc_lons = nc_accumlation.createVariable('lon', 'f4', ('lon',))
-                    nc_lats = nc_accumlation.createVariable('lat', 'f4', ('lat',))
-                    nc_time = nc_accumlation.createVariable('time', 'f4', ('time',))
-                    nc_temp = nc_accumlation.createVariable('analysed_sst', 'f4', ('time', 'lat', 'lon'))
-                    
-                    # Add attributes
-                    nc_lons.units = 'degrees_east'
-                    nc_lats.units = 'degrees_north'
-                    nc_time.units = 'days since 1981-01-01 00:00:00'
-                    nc_temp.units = 'celsius'
-                    
-                    # Add data
-                    nc_lons[:] = lons
-                    nc_lats[:] = lats
-                    nc_time[:] = dateSince(file[0:10])
-                    nc_temp[:] = temp - 273.14
-                else:
-                    # Add the data to the nc file
-                    nc_accumlation.variables['analysed_sst'][idx] = temp - 273.14
-                    nc_accumlation.variables['time'][idx] = dateSince(file[0:10])
-                
-                # If the index is divisible by 250, print a message stating that the file is being added, out of the total.
-                lof = len(files)
-                if lof > 5000:
-                    if idx % 1000 == 0:
-                        print(f'[{self.getHrMnSc()}] File [{idx} / {lof}] is being added to the database.')
-                elif lof > 1000:
-                    if idx % 250 == 0:
-                        print(f'[{self.getHrMnSc()}] File [{idx} / {lof}] is being added to the database.')
-                else:
-                    if idx % 50 == 0:
-                        print(f'[{self.getHrMnSc()}] File [{idx} / {lof}] is being added to the database.')
+                cube.append(data.variables['analysed_sst'][0] - 273.15)
                 
                 # Close the file
                 data.close()
             
-            # Print a message stating that all files have been added to the database.
-            print(f'[{self.getHrMnSc()}] All files have been added to the database.')
-            
-            # Close the nc file
-            nc_accumlation.close()
-
-    def databaseReorder(self):
-        # Open the nc file containing all of the data.
-        nc_file = nc.Dataset(f'{self.config["folders"]["data"]}sst_bmnp.nc', 'r')
-        
-        # Sort the data by time in ascending order.
-        time = nc_file.variables['time'][:]
-        time_sort = time.argsort()
-        
-        # Create a temp directory in the data folder, if it does not exist, using the os library.
-        if not path.exists(f'{self.config["folders"]["data"]}/temp'): os.mkdir(f'{self.config["folders"]["data"]}/temp')
-        
-        # Create a new nc file with the sorted data.
-        nc_file_sorted = nc.Dataset(f'{self.config["folders"]["data"]}/temp/sst_bmnp.nc', 'w')
+            # Add the run to the database.
+            archive.writeMany(start, ma.stack(cube), lats, lons)
+            added += len(run_dates)
+            print(f'[{self.getHrMnSc()}] File [{added} / {len(dates)}] have been added to the database.')
         
-        # Create dimensions
-        nc_file_sorted.createDimension('lon', len(nc_file.variables['lon'][:]))
-        nc_file_sorted.createDimension('lat', len(nc_file.variables['lat'][:]))
-        nc_file_sorted.createDimension('time', len(time))
-        
-        # Create variables
-        nc_lons = nc_file_sorted.createVariable('lon', 'f4', ('lon',))
-        nc_lats = nc_file_sorted.createVariable('lat', 'f4', ('lat',))
-        nc_time = nc_file_sorted.createVariable('time', 'f4', ('time',))
-        nc_temp = nc_file_sorted.createVariable('analysed_sst', 'f4', ('time', 'lat', 'lon'))
-        
-        # Add attributes
-        nc_lons.units = 'degrees_east'
-        nc_lats.units = 'degrees_north'
-        nc_time.units = 'days since 1981-01-01 00:00:00'
-        nc_temp.units = 'celsius'
-        
-        # Add data
-        nc_lons[:] = nc_file.variables['lon'][:]
-        nc_lats[:] = nc_file.variables['lat'][:]
-        nc_time[:] = time
-        nc_temp[:] = nc_file.variables['analysed_sst'][time_sort]
-        
-        # Close the files so that the sst_bmnp.nc can be deleted and replaced with the one in temp.
-        nc_file.close()
-        nc_file_sorted.close()
-        
-        # Deleted the bmnp.nc file in data folder, then move the one in temp to the data folder. Then delete temp directory
-        remove(f'{self.config["folders"]["data"]}sst_bmnp.nc')
-        os.rename(f'{self.config["folders"]["data"]}/temp/sst_bmnp.nc', f'{self.config["folders"]["data"]}sst_bmnp.nc')
-        os.rmdir(f'{self.config["folders"]["data"]}/temp')
+        # Print a message stating that all files have been added to the database.
+        print(f'[{self.getHrMnSc()}] All files have been added to the database.')
 
-    def dhwDatabase(self, missing_dates):
-        def dateSince(date):
-            date = datetime.strptime(date, '%Y-%m-%d')
-            
-            # Calculate the number of days since 1981-01-01
-            since = date - datetime(1981, 1, 1)
-            
-            return since.days
-        
+    def dhwDatabase(self, missing_dates, chunk_days = 1000):
         # Check to see if "dhw_bmnp.nc" exists in the data folder.
         data_folder = listdir(self.data_dir)
         dhw_exists = 'dhw_bmnp.nc' in data_folder
@@ -636,434 +879,353 @@ class BMNP_Data:
             remove(f'{self.data_dir}dhw_bmnp.nc')
             print(f'[{self.getHrMnSc()}] The file "dhw_bmnp.nc" exists in the data folder. This file will be deleted and recreated.')
         
-        # Add 1 to the hrcs file to make bleaching_threshold
-        bleaching_threshold = hrcs.variables['variable'][:] # + 0.6
+        # Load the sst_bmnp.nc file. Its days are already in ascending order, one slot per day.
+        sst = BMNP_Archive(f'{self.data_dir}sst_bmnp.nc')
+        days = sst.length()
+        
+        # Line the bleaching threshold up with the sst grid, and take the part of the sst grid it covers.
+        sst_lat, sst_lon = sst.grid()
+        (min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx), bleaching_threshold = self.bleachingThreshold(hrcs, sst_lat, sst_lon)
+        new_lat = around(sst_lat[min_lat_idx:max_lat_idx], 2)
+        new_lon = around(sst_lon[min_lon_idx:max_lon_idx], 2)
+        
+        # The dhw_bmnp.nc file uses the same slots (days) as sst_bmnp.nc.
+        dhw = BMNP_Archive(f'{self.data_dir}dhw_bmnp.nc', variable='dhw', units='degree heating weeks', start_date=sst.start_date,
+                           storage=storageProfile(self.config))
+        dhw.create(new_lat, new_lon)
+        
+        # Only the ocean pixels are calculated. Take the bleaching threshold once, with missing values as nan.
+        ocean = self.oceanMask(new_lat, new_lon)
+        bleaching_threshold = ocean.compress(ma.filled(ma.asarray(bleaching_threshold, dtype='f8'), nan))
+        
+        # Compute the DHW frames in chunks of "chunk_days". Each chunk needs the 83 days before it as well.
+        # The first 84 days are skipped, the same as the single-day DHW files.
+        for start in range(84, days, chunk_days):
+            end = min(start + chunk_days, days)
+            first = start - 83
+            
+            # Load the chunk of sst data in one read. Days that are missing from the database count as 0.
+            chunk_dates, sst_data = sst.read(sst.slotDate(first), sst.slotDate(end - 1), slice(min_lat_idx, max_lat_idx), slice(min_lon_idx, max_lon_idx))
+            sst_data = ocean.compress(ma.filled(ma.asarray(sst_data, dtype='f8'), nan))
+            
+            # Daily HotSpot, with all negative values (and missing pixels) replaced with 0
+            sst_data_dailydhw = sst_data - bleaching_threshold
+            sst_data_dailydhw = where(sst_data_dailydhw > 0, sst_data_dailydhw, 0)
+            
+            # Sum each 84-day window as the difference of two cumulative sums.
+            cumulative = concatenate([zeros((1,) + sst_data_dailydhw.shape[1:]), cumsum(sst_data_dailydhw, axis=0)])
+            total_dhw = around((cumulative[84:] - cumulative[:-84]) / 7.0, 2)
+            
+            # Mask the pixels that have no sst on the day itself (land, or a missing day).
+            total_dhw = ma.masked_where(isnan(sst_data[83:]), total_dhw)
+            
+            # Add the chunk to the dhw file in one write (land pixels are masked).
+            dhw.writeMany(chunk_dates[83], ocean.expand(total_dhw))
+            
+            print(f'[{self.getHrMnSc()}] DHW completed for [{end} / {days}] days.')
         
-        # Do np.flip 0 on the bleaching_threshold
-        # bleaching_threshold = flip(bleaching_threshold, 0)
+        # Close the files
+        hrcs.close()
+
+    def dhwGridSetup(self, files_nc):
+        # Load first file to get lat and lon
+        data = nc.Dataset(f"{self.refined_dir}{files_nc[0]}", 'r')
         
-        # Print the bleaching threshold
-        # print(f'[{self.getHrMnSc()}] Bleaching Threshold: {bleaching_threshold}')
+        # Get thge data
+        lons = data.variables['lon'][:]
+        lats = data.variables['lat'][:]
         
-        # Load the sst_bmnp.nc file
-        sst = nc.Dataset(f'{self.data_dir}sst_bmnp.nc', 'r')
+        # Line the bleaching threshold up with the sst grid, and take the part of the sst grid it covers.
+        hrcs = nc.Dataset(f'{self.data_dir}hrcs_mmm.nc', 'r')
+        window, bleaching_threshold = self.bleachingThreshold(hrcs, lats, lons)
+        min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx = window
         
-        # Sort the sst file by time in ascending order.
-        time = sst.variables['time'][:]
-        time_sort = sort(time)
+        # Lat and lon of that part, to 2 decimal places, with lat in descending order.
+        new_lat = around(ma.getdata(lats)[min_lat_idx:max_lat_idx], 2)[::-1]
+        new_lon = around(ma.getdata(lons)[min_lon_idx:max_lon_idx], 2)
         
-        # Gather the lat and lon in both hrcs and sst files, rounding each item in list to 2 decimal places.
-        hrcs_lat = hrcs.variables['lat'][:]
-        hrcs_lon = hrcs.variables['lon'][:]
-        sst_lat = sst.variables['lat'][:]
-        sst_lon = sst.variables['lon'][:]
-        hrcs_lat = [round(lat, 2) for lat in hrcs_lat]
-        hrcs_lon = [round(lon, 2) for lon in hrcs_lon]
-        sst_lat = [round(lat, 2) for lat in sst_lat]
-        sst_lon = [round(lon, 2) for lon in sst_lon]
+        # Close data
+        data.close()
+        hrcs.close()
         
-        # Give me the minimum and maximum in both lat and lon for the hrcs file
-        hrcs_min_lat = min(hrcs_lat)
-        hrcs_max_lat = max(hrcs_lat)
-        hrcs_min_lon = min(hrcs_lon)
-        hrcs_max_lon = max(hrcs_lon)
+        return window, new_lat, new_lon, bleaching_threshold
+    
+    def bleachingThreshold(self, hrcs, lats, lons):
+        # The window of the sst grid (lats, lons) that the bleaching threshold of hrcs covers, and the threshold on
+        # that window. The alignment is made once per grid (then read from the alignments folder).
+        align = BMNP_Align(ma.getdata(hrcs.variables['lat'][:]), ma.getdata(hrcs.variables['lon'][:]), ma.getdata(lats), ma.getdata(lons),
+                           cache_dir=self.alignments_dir)
         
-        # Based on the min and max lat and lon, find the indices in the sst file.
-        min_lat_idx = where(sst_lat == hrcs_min_lat)[0][0]
-        max_lat_idx = where(sst_lat == hrcs_max_lat)[0][0]+1
-        min_lon_idx = where(sst_lon == hrcs_min_lon)[0][0]
-        max_lon_idx = where(sst_lon == hrcs_max_lon)[0][0]+1
+        return align.window, align.align(hrcs.variables['variable'][:])
+    
+    def oceanMask(self, lats, lons):
+        # Ocean pixels of a grid, from the coastline (made once per grid, then read from the masks folder).
+        return BMNP_Mask(ma.getdata(lats), ma.getdata(lons), self.shapefile, self.masks_dir)
+    
+    def loadDHWSST(self, date, window):
+        # Unpack the lat and lon indices of the bleaching threshold grid.
+        min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx = window
+        
+        # Open the file and get sst data from the file, with the new lat and lon indices (in Celsius).
+        try:
+            with self.nc_lock:
+                data = nc.Dataset(f"{self.config['folders']['nc_sst']}{date}.nc", 'r')
+                sst_data = data.variables['analysed_sst'][0, min_lat_idx:max_lat_idx, min_lon_idx:max_lon_idx] - 273.15
+                data.close()
+        except:
+            print(f'[{self.getHrMnSc()}] There was an issue with the file {date}.nc. Skipping this file.')
+            return None
         
-        # Create a list of new lat and lons based on the min and max lat and lon indices FROM SST FILE
-        new_lat = sst_lat[min_lat_idx:max_lat_idx]
-        new_lon = sst_lon[min_lon_idx:max_lon_idx]
+        return sst_data
+    
+    def rollingDHWs(self, files, targets, window, bleaching_threshold, ocean):
+        # Streams the SST files needed for each target index exactly once. Every target needs the 84 files
+        # ending at (and including) itself, so consecutive targets share all but one file of their windows.
+        # The window only holds the ocean pixels (see BMNP_Mask), which are put back on the grid for each DHW.
+        # Yields the DHW and the alert grids (see BMNP_DHWWindow.alerts) of each target.
+        dhw_window = BMNP_DHWWindow(ocean.compress(bleaching_threshold))
+        
+        # Index of the last file pushed into dhw_window.
+        position = None
+        
+        for target in targets:
+            start = target - (dhw_window.days - 1)
+            
+            # If there is a gap between this window and the last file read, start a fresh window.
+            if position is None or position < start - 1:
+                dhw_window.reset()
+                position = start - 1
+            
+            # Push every file up to (and including) the target into the window.
+            for idx in range(position + 1, target + 1):
+                with self.instrument.stage('read_sst'): sst_data = self.loadDHWSST(files[idx], window)
+                with self.instrument.stage('window'): dhw_window.push(None if sst_data is None else ocean.compress(sst_data))
+                position = idx
+            
+            alerts = {name: ocean.expand(grid) for name, grid in dhw_window.alerts().items()}
+            yield target, files[target], ocean.expand(dhw_window.dhw()), alerts
+    
+    def writeDHW(self, date_name, total_dhw, new_lat, new_lon):
+        # Flip total_dhw over the y=x axis
+        total_dhw = flip(total_dhw, 0)
         
-        # Create a new nc file called "dhw_bmnp.nc" in the data folder.
-        dhw = nc.Dataset(f'{self.data_dir}dhw_bmnp.nc', 'w')
+        # Create a new nc file in the nc_dhw directory, with the name of the date. The files are written under a
+        # temporary name and then renamed, so a file that is there is always complete.
+        nc_file = f"{self.config['folders']['nc_dhw']}{date_name}.nc"
+        csv_file = f"{self.config['folders']['csv_dhw']}{date_name}.csv"
+        dhw = nc.Dataset(f'{nc_file}.tmp', 'w')
         
         # Create dimensions
         dhw.createDimension('lon', len(new_lon))
         dhw.createDimension('lat', len(new_lat))
-        dhw.createDimension('time', None)
         
         # Create variables
         dhw_lons = dhw.createVariable('lon', 'f4', ('lon',))
         dhw_lats = dhw.createVariable('lat', 'f4', ('lat',))
-        dhw_time = dhw.createVariable('time', 'f4', ('time',))
-        dhw_dhw = dhw.createVariable('dhw', 'f4', ('time', 'lat', 'lon'))
+        dhw_dhw = createGrid(dhw, 'dhw', ('lat', 'lon'), 'degree heating weeks', storageProfile(self.config))
         
         # Add attributes
         dhw_lons.units = 'degrees_east'
         dhw_lats.units = 'degrees_north'
-        dhw_time.units = 'days since 1981-01-01 00:00:00'
-        dhw_dhw.units = 'degree heating weeks'
         
         # Add data
         dhw_lons[:] = new_lon
         dhw_lats[:] = new_lat
+        dhw_dhw[:] = total_dhw
         
-        # Cycle through each dame in time_sort.
-        for idx, date in enumerate(time_sort):
-            # If the date is one of the first 84 days, skip the iteration.
-            if idx < 84: continue
-            
-            # Create an np array of zeros, with the shape of the new_lat and new_lon
-            total_dhw = zeros((len(new_lat), len(new_lon)))
-            
-            date = 0
-            
-            for i in range(84):
-                # Get the idx - i date in time_sort
-                date = time_sort[idx-i]
-                
-                # Find idx of "date" in "time" variable for sst file
-                date_idx = where(sst.variables['time'][:] == date)[0][0]
-                
-                # Load the sst data for the date
-                sst_data = sst.variables['analysed_sst'][date_idx, min_lat_idx:max_lat_idx, min_lon_idx:max_lon_idx]
-                
-                # Do sst_date - bleaching_threshold
-                sst_data_dailydhw = sst_data - bleaching_threshold
-                
-                # Replace all negative values with 0
-                sst_data_dailydhw = where(sst_data_dailydhw < 0, 0, sst_data_dailydhw)
-            
-            # Add the daily dhw to the total dhw
-            total_dhw += sst_data_dailydhw
-            
-            # Round the total_dhw to 2 decimal places
-            total_dhw = around(total_dhw, 2)
-            
-            # Add the total_dhw to the dhw file, at idx associated with date.
-            dhw_dhw[int(idx)] = total_dhw
-            
-            if idx % 250 == 0:
-                print(f'[{self.getHrMnSc()}] DHW completed for [{idx} / {len(time_sort)}] days.')
-                
-        # Close the files
+        # Create a csv file from the dhw file, with the lat and lon included in the index and columns.
+        if self.text_csvs:
+            df = DataFrame(total_dhw, index=new_lat, columns=new_lon)
+            df.to_csv(f'{csv_file}.tmp')
+            os.replace(f'{csv_file}.tmp', csv_file)
+        
+        # Close the file
         dhw.close()
-        sst.close()
-        hrcs.close()
+        os.replace(f'{nc_file}.tmp', nc_file)
 
-    def createDHWs(self):
-        def dateSince(date):
-            date = datetime.strptime(date, '%Y-%m-%d')
-            
-            # Calculate the number of days since 1981-01-01
-            since = date - datetime(1981, 1, 1)
-            
-            return since.days
+    def writeAlert(self, date_name, alerts, new_lat, new_lon):
+        # Write the HotSpot, alert level and alert area of a day to the nc_alert directory, flipped the same as the DHW.
+        # Every grid is stored as uint8 (HotSpot in steps of HOTSPOT_SCALE), with ALERT_FILL for missing pixels.
+        nc_file = f"{self.config['folders']['nc_alert']}{date_name}.nc"
+        alert = nc.Dataset(f'{nc_file}.tmp', 'w')
+        
+        # Create dimensions
+        alert.createDimension('lon', len(new_lon))
+        alert.createDimension('lat', len(new_lat))
+        
+        # Create variables
+        alert_lons = alert.createVariable('lon', 'f4', ('lon',))
+        alert_lats = alert.createVariable('lat', 'f4', ('lat',))
+        alert_hotspot = alert.createVariable('hotspot', 'u1', ('lat', 'lon'), fill_value=ALERT_FILL, zlib=True)
+        alert_alert = alert.createVariable('alert', 'u1', ('lat', 'lon'), fill_value=ALERT_FILL, zlib=True)
+        alert_area = alert.createVariable('alert_area', 'u1', ('lat', 'lon'), fill_value=ALERT_FILL, zlib=True)
         
-        # Create a list of items that are in nc_sst directory.
-        files = listdir(f"{self.refined_dir}")
+        # Add attributes
+        alert_lons.units = 'degrees_east'
+        alert_lats.units = 'degrees_north'
+        alert_hotspot.units = 'celsius'
+        alert_hotspot.scale_factor = HOTSPOT_SCALE
+        alert_alert.long_name = 'bleaching alert level'
+        alert_area.long_name = 'bleaching alert area (highest alert level of the last 7 days)'
+        for variable in (alert_alert, alert_area):
+            variable.flag_values = arange(len(ALERT_LEVELS), dtype=uint8)
+            variable.flag_meanings = ' '.join(level.replace(' ', '_') for level in ALERT_LEVELS)
+        
+        # Add data (HotSpot is capped at the largest value that fits).
+        alert_lons[:] = new_lon
+        alert_lats[:] = new_lat
+        alert_hotspot[:] = flip(minimum(alerts['hotspot'], (ALERT_FILL - 1) * HOTSPOT_SCALE), 0)
+        alert_alert[:] = flip(alerts['alert'], 0)
+        alert_area[:] = flip(alerts['alert_area'], 0)
+        
+        # Close the file
+        alert.close()
+        os.replace(f'{nc_file}.tmp', nc_file)
+    
+    def createDHWs(self):
+        # Create a list of dates that are in nc_sst directory, from the catalog.
+        files = self.catalog.dates('sst')
         
         # Order files by date
-        files = [file[0:10] for file in files]
-        files = list(set(files))
-        files = sort(files)
+        files = sort(list(files))
         files_nc = [f'{file}.nc' for file in files]
         
-        # Load first file to get lat and lon
-        data = nc.Dataset(f"{self.refined_dir}{files_nc[0]}", 'r')
+        # Find the section of the SST grid covered by the bleaching threshold (hrcs_mmm.nc).
+        window, new_lat, new_lon, bleaching_threshold = self.dhwGridSetup(files_nc)
         
-        # Get thge data
-        lons = data.variables['lon'][:]
-        lats = data.variables['lat'][:]
-        
-        # Add 1 to the hrcs file to make bleaching_threshold
-        hrcs = nc.Dataset(f'{self.data_dir}hrcs_mmm.nc', 'r')
-        bleaching_threshold = hrcs.variables['variable'][:] # + 1.0
-        
-        # flip bleaching_threshold over the y=x axis
-        # bleaching_threshold = flip(bleaching_threshold, 0)
-        
-        # Gather the lat and lon in both hrcs and sst files, rounding each item in list to 2 decimal places.
-        hrcs_lat = hrcs.variables['lat'][:]
-        hrcs_lon = hrcs.variables['lon'][:]
-        sst_lat = lats
-        sst_lon = lons
-        hrcs_lat = [round(lat, 2) for lat in hrcs_lat]
-        hrcs_lon = [round(lon, 2) for lon in hrcs_lon]
-        sst_lat = [round(lat, 2) for lat in sst_lat]
-        sst_lon = [round(lon, 2) for lon in sst_lon]
-        
-        # Order in ascending order
-        hrcs_lat = sort(hrcs_lat)
-        hrcs_lon = sort(hrcs_lon)
-        sst_lat = sort(sst_lat)
-        sst_lon = sort(sst_lon)
-        
-        # Give me the minimum and maximum in both lat and lon for the hrcs file
-        hrcs_min_lat = min(hrcs_lat)
-        hrcs_max_lat = max(hrcs_lat)
-        hrcs_min_lon = min(hrcs_lon)
-        hrcs_max_lon = max(hrcs_lon)
-        
-        # Based on the min and max lat and lon, find the indices in the sst file.
-        min_lat_idx = where(sst_lat == hrcs_min_lat)[0][0]
-        max_lat_idx = where(sst_lat == hrcs_max_lat)[0][0]+1
-        min_lon_idx = where(sst_lon == hrcs_min_lon)[0][0]
-        max_lon_idx = where(sst_lon == hrcs_max_lon)[0][0]+1
-        
-        # Print the indices:
-        # print(f'[{self.getHrMnSc()}] Min Lat Idx: {min_lat_idx}')
-        # print(f'[{self.getHrMnSc()}] Max Lat Idx: {max_lat_idx}')
-        # print(f'[{self.getHrMnSc()}] Min Lon Idx: {min_lon_idx}')
-        # print(f'[{self.getHrMnSc()}] Max Lon Idx: {max_lon_idx}')
-        
-        # Create a list of new lat and lons based on the min and max lat and lon indices FROM SST FILE
-        new_lat = sst_lat[min_lat_idx:max_lat_idx]
-        new_lon = sst_lon[min_lon_idx:max_lon_idx]
-        
-        # Reverse order of new_lat list
-        new_lat = new_lat[::-1]
+        # Ocean pixels of the section (the sst files have latitude ascending, new_lat is reversed).
+        ocean = self.oceanMask(new_lat[::-1], new_lon)
         
-        # Close data
-        data.close()
-        
-        # Cycle through files, with idx and file name
+        # Work out which dates (as indices into files) need a single-day DHW. The first 84 days never do.
         if self.delete_singles:
-            for idx, file in enumerate(files_nc):
-                # Check to see if the file is already in the nc_dhw directory. If so, skip the iteration. (Also skip if first 84)
-                if path.exists(f"{self.config['folders']['nc_dhw']}{file[0:10]}.nc") or (idx < 84): continue
-                
-                # Check to see if the file has "2010" in its name, if not, skip.
-                # if '2010-06' not in file: continue
-                
-                # Triggers date_change to True, so that the date is changed to the date of the file.
-                date_change = True
-                date_name = ""
-                
-                # Loop through 84 days, starting from the current idx
-                for i in range(84):
-                    # Get the idx - i date in files
-                    date = files_nc[idx-i]
-                    
-                    # Subtract i from idx to get the date
-                    if date_change:
-                        date_name = date[0:10]
-                        date_change = False
-                    
-                    # Open the file
-                    data = nc.Dataset(f"{self.config['folders']['nc_sst']}{date}", 'r')
-                    
-                    # Get sst data from the file, with the new lat and lon indices
-                    try:
-                        sst_data = data.variables['analysed_sst'][0, min_lat_idx:max_lat_idx, min_lon_idx:max_lon_idx] - 273.15
-                    except:
-                        print(f'[{self.getHrMnSc()}] There was an issue with the file {date}. Skipping this file.')
-                        continue
-                    
-                    # Do sst_data - bleaching_threshold
-                    sst_data_dailydhw = sst_data - bleaching_threshold
-                    
-                    # Replace all negative values with 0
-                    sst_data_dailydhw = where(sst_data_dailydhw < 0, 0, sst_data_dailydhw)
-                    
-                    # Add the daily dhw to the total dhw
-                    if i == 0:
-                        total_dhw = sst_data_dailydhw
-                    else:
-                        total_dhw += sst_data_dailydhw
-                
-                # Round the total_dhw to 2 decimal places
-                total_dhw = around(total_dhw/7.0, 2)
-                
-                # Flip total_dhw over the y=x axis
-                total_dhw = flip(total_dhw, 0)
-                
-                # Create a new nc file in the nc_dhw directory, with the name of the date.
-                dhw = nc.Dataset(f"{self.config['folders']['nc_dhw']}{date_name}.nc", 'w')
-                
-                # Create dimensions
-                dhw.createDimension('lon', len(new_lon))
-                dhw.createDimension('lat', len(new_lat))
-                
-                # Create variables
-                dhw_lons = dhw.createVariable('lon', 'f4', ('lon',))
-                dhw_lats = dhw.createVariable('lat', 'f4', ('lat',))
-                dhw_dhw = dhw.createVariable('dhw', 'f4', ('lat', 'lon'))
-                
-                # Add attributes
-                dhw_lons.units = 'degrees_east'
-                dhw_lats.units = 'degrees_north'
-                dhw_dhw.units = 'degree heating weeks'
-                
-                # Add data
-                dhw_lons[:] = new_lon
-                dhw_lats[:] = new_lat
-                dhw_dhw[:] = total_dhw
-                
-                # Create a csv file from the dhw file, with the lat and lon included in the index and columns.
-                df = DataFrame(total_dhw, index=new_lat, columns=new_lon)
-                df.to_csv(f"{self.config['folders']['csv_dhw']}{date_name}.csv")
-                
-                # Close the files
-                dhw.close()
-                data.close()
-                
-                # If the file is divisible by 250, print a message stating that the file is being added, out of the total.
-                if idx % 1000 == 0:
-                    print(f'[{self.getHrMnSc()}] File [{idx} / {len(files)}] has been created for single-day DHWs.')
-        elif self.dates_missing and not self.delete_singles:
-            # Cycle through each of the self.downlod.downloaded_dates and do the same as above, but for the missing dates.
-            for idx, date in enumerate(self.download.downloaded_dates):
-                # Find idx of the date in files list
-                date_idx = where(files == date)[0][0]
-                # Print idx
-                # print(f'[{self.getHrMnSc()}] Date Index: {date_idx}')
-                
-                # If this date is in the first 84 days, skip the iteration.
-                if date_idx < 84: continue
-                
-                # Triggers date_change to True, so that the date is changed to the date of the file.
-                date_change = True
-                date_name = ""
-                
-                # Loop through 84 days, starting from the current idx
-                for i in range(84):
-                    # Get the idx - i date in files_nc
-                    date = files[date_idx-i]
-                    
-                    # Subtract i from idx to get the date
-                    if date_change:
-                        date_name = date
-                        date_change = False
-                    
-                    # Open the file
-                    data = nc.Dataset(f"{self.config['folders']['nc_sst']}{date}.nc", 'r')
-                    
-                    # Get sst data from the file, with the new lat and lon indices
-                    try:
-                        sst_data = data.variables['analysed_sst'][0, min_lat_idx:max_lat_idx, min_lon_idx:max_lon_idx] - 273.14
-                    except:
-                        print(f'[{self.getHrMnSc()}] There was an issue with the file {date}. Skipping this file.')
-                        continue
-                    
-                    # Do sst_data - bleaching_threshold
-                    sst_data_dailydhw = sst_data - bleaching_threshold
-                    
-                    # Replace all negative values with 0
-                    sst_data_dailydhw = where(sst_data_dailydhw < 0, 0, sst_data_dailydhw)
-                    
-                    # Add the daily dhw to the total dhw
-                    if i == 0:
-                        total_dhw = sst_data_dailydhw
-                    else:
-                        total_dhw += sst_data_dailydhw
-                
-                # Round the total_dhw to 2 decimal places
-                total_dhw = around(total_dhw, 2)
-                
-                # Flip total_dhw over the y=x axis
-                total_dhw = flip(total_dhw, 0)
-                
-                # Create a new nc file in the nc_dhw directory, with the name of the date.
-                dhw = nc.Dataset(f"{self.config['folders']['nc_dhw']}{date_name}.nc", 'w')
-            
-                # Create dimensions
-                dhw.createDimension('lon', len(new_lon))
-                dhw.createDimension('lat', len(new_lat))
-                
-                # Create variables
-                dhw_lons = dhw.createVariable('lon', 'f4', ('lon',))
-                dhw_lats = dhw.createVariable('lat', 'f4', ('lat',))
-                dhw_dhw = dhw.createVariable('dhw', 'f4', ('lat', 'lon'))
-                
-                # Add attributes
-                dhw_lons.units = 'degrees_east'
-                dhw_lats.units = 'degrees_north'
-                dhw_dhw.units = 'degree heating weeks'
-                
-                # Add data
-                dhw_lons[:] = new_lon
-                dhw_lats[:] = new_lat
-                dhw_dhw[:] = total_dhw
-                
-                # Create a csv file from the dhw file, with the lat and lon included in the index and columns.
-                df = DataFrame(total_dhw, index=new_lat, columns=new_lon)
-                df.to_csv(f"{self.config['folders']['csv_dhw']}{date_name[0:10]}.csv")
-                
-                # Close the files
-                dhw.close()
-                data.close()
-                
-                # If the length of self.download.downloaded_dates is less than 25, print every file that is created.
-                if len(self.download.downloaded_dates) < 25:
-                    print(f'[{self.getHrMnSc()}] The date {date_name[0:10]} has been added to single-day DHW files.')
-                # Otherwise print every 100.
-                elif idx % 100 == 0:
-                    print(f'[{self.getHrMnSc()}] File [{idx} / {len(self.download.downloaded_dates)}] has been created for single-day DHWs.')
+            # Every date that is not already in both the nc_dhw and nc_alert directories.
+            existing = self.catalog.dates('dhw') & self.catalog.dates('alert')
+            targets = [idx for idx, file in enumerate(files) if idx >= 84 and file not in existing]
+        elif self.dates_missing and hasattr(self, 'download'):
+            # Only the dates that were just downloaded.
+            targets = [where(files == date)[0][0] for date in self.download.downloaded_dates]
+            targets = sorted(set(int(idx) for idx in targets if idx >= 84))
         else:
             print(f'[{self.getHrMnSc()}] No new dates have been downloaded. No new DHWs need to be created.')
+            return
+        
+        # With more than one worker, split the targets between processes.
+        if self.dhw_workers > 1 and len(targets) > 1:
+            self.parallelDHWs(files, targets, window, new_lat, new_lon, bleaching_threshold, ocean)
+            return
+        
+        # Stream through the SST files, reading each one once, and write the DHW for each target date.
+        for count, (idx, date_name, total_dhw, alerts) in enumerate(self.rollingDHWs(files, targets, window, bleaching_threshold, ocean)):
+            with self.instrument.stage('write'):
+                self.writeDHW(date_name, total_dhw, new_lat, new_lon)
+                self.writeAlert(date_name, alerts, new_lat, new_lon)
+            
+            # Record the new dhw and alert files in the catalog.
+            self.catalog.record(date_name, 'dhw')
+            self.catalog.record(date_name, 'alert')
+            
+            # If there are less than 25 dates, print every file that is created. Otherwise print every 1000.
+            if len(targets) < 25:
+                print(f'[{self.getHrMnSc()}] The date {date_name} has been added to single-day DHW files.')
+            elif count % 1000 == 0:
+                print(f'[{self.getHrMnSc()}] File [{idx} / {len(files)}] has been created for single-day DHWs.')
 
-    def recreateCSVs(self):
-        # Get a list of all the files in the nc_sst directory
-        files = listdir(self.refined_dir)
-        
-        # Order files by date
-        files = [file[0:10] for file in files]
-        files = list(set(files))
-        files = sort(files)
+    def parallelDHWs(self, files, targets, window, new_lat, new_lon, bleaching_threshold, ocean, block_days = 200):
+        # Split the targets into contiguous blocks and run each block in its own process (see dhwBlock). Each block
+        # reads its own 84-day warm-up, so blocks of at least block_days keep the extra reading small.
+        blocks = min(self.dhw_workers * 2, max(1, len(targets) // block_days))
+        blocks = [list(block) for block in array_split(targets, blocks) if len(block) > 0]
+        print(f'[{self.getHrMnSc()}] Creating {len(targets)} DHW files in {len(blocks)} blocks with {self.dhw_workers} processes...')
+        
+        with ProcessPoolExecutor(max_workers=self.dhw_workers) as executor:
+            futures = [executor.submit(dhwBlock, list(files), block, window, bleaching_threshold, ocean, new_lat, new_lon, self.text_csvs)
+                       for block in blocks]
+            
+            # Record each block's files in the catalog as the block finishes.
+            for future in as_completed(futures):
+                dates = future.result()
+                for date_name in dates:
+                    self.catalog.record(date_name, 'dhw')
+                    self.catalog.record(date_name, 'alert')
+                print(f'[{self.getHrMnSc()}] A block of {len(dates)} DHW files ({dates[0]} to {dates[-1]}) has been created.')
+    
+    def recreateCSVs(self, workers = None):
+        # Convert the sst files that have no csv file, or whose csv file is older than the nc file, to csv.
+        # Both folders are listed once (with modification times), and the files are converted in workers processes
+        # (by default, one per core).
+        csv_dir = f"{self.config['folders']['csv_sst']}"
+        
+        # Dates in the catalog, and the modification time of their nc and csv files.
+        dates = self.catalog.dates('sst')
+        nc_times = {entry.name[0:10]: entry.stat().st_mtime for entry in os.scandir(self.refined_dir) if entry.name.endswith('.nc')}
+        csv_times = {entry.name[0:10]: entry.stat().st_mtime for entry in os.scandir(csv_dir) if entry.name.endswith('.csv')}
+        
+        # Missing csv files, and stale ones (the nc file was changed after the csv file was made).
+        missing = dates - set(csv_times)
+        stale = set(date for date in dates & set(csv_times) if date in nc_times and nc_times[date] > csv_times[date])
+        convert = sorted(missing | stale)
+        
+        # If there is nothing to convert, print a message stating that the files are already converted.
+        if len(convert) == 0:
+            print(f'[{datetime.now().strftime("%H:%M:%S")}] All SST files have been converted to csv. No files need to be converted.')
+            return
         
-        # Add .nc to the end of each file
-        files = [f'{file}.nc' for file in files]
+        print(f'[{datetime.now().strftime("%H:%M:%S")}] {len(missing)} missing and {len(stale)} out of date csv files will be converted.')
+        jobs = [(f'{self.refined_dir}{date}.nc', f'{csv_dir}{date}.csv') for date in convert]
         
-        # Check to see if length of both csv_sst and nc_sst are the same. If so, print a message stating that the files are already converted.
-        if len(listdir(f"{self.config['folders']['csv_sst']}")) == len(files):
-            print(f'[{datetime.now().strftime("%H:%M:%S")}] All SST files have been converted to csv. No files need to be converted.')
+        # A few files are converted here. Otherwise they are shared between the processes, in chunks.
+        if workers is None: workers = os.cpu_count() or 1
+        if workers == 1 or len(jobs) < 50:
+            for job in jobs:
+                sstToCSV(*job)
         else:
-            # If the length of files is greater than 2500, state this will take a while. Mention the number of files.
-            if len(files) > 2500:
-                print(f'[{datetime.now().strftime("%H:%M:%S")}] This will take a while. There are {len(files)} files to convert to csv.')
-            
-            # Load each file and convert to csv, in csv_sst directory.
-            # Ensure each has the correct name, as well as lat / lon included in the index and columns.
-            for idx, file in enumerate(files):
-                # Check to see if the file is already in the csv_sst directory. If so, skip the iteration.
-                if path.exists(f"{self.config['folders']['csv_sst']}{file[0:10]}.csv"): continue
-                
-                # Open the file
-                data = nc.Dataset(f"{self.refined_dir}{file}", 'r')
-                
-                # Get the data
-                lons = data.variables['lon'][:]
-                lats = data.variables['lat'][:]
-                temp = data.variables['analysed_sst'][:]
-                
-                # Create a DataFrame
-                df = DataFrame(temp[0], index=lats, columns=lons)
-                
-                # Save the DataFrame to a csv file
-                df.to_csv(f"{self.config['folders']['csv_sst']}{file[0:10]}.csv")
-                
-                # Close the file
-                data.close()
-                
-                # If the index is divisible by 1000, print a message stating that the file is being added, out of the total.
-                if idx % 1000 == 0:
-                    print(f'[{datetime.now().strftime("%H:%M:%S")}] File [{idx} / {len(files)}] was converted to a .csv file.')
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for idx, _ in enumerate(executor.map(sstToCSV, *zip(*jobs), chunksize=max(1, len(jobs) // (workers * 4)))):
+                    # If the index is divisible by 1000, print a message stating that the file is being added, out of the total.
+                    if idx % 1000 == 0:
+                        print(f'[{datetime.now().strftime("%H:%M:%S")}] File [{idx} / {len(jobs)}] was converted to a .csv file.')
+        
+        print(f'[{datetime.now().strftime("%H:%M:%S")}] {len(jobs)} SST files have been converted to csv.')
 
-    def monthlyCalculations(self):
-        # Delete the files in the pandas, csv_month_sst, nc_month_sst, csv_month_dhw, and nc_month_dhw directories.
-        for file in listdir(self.pandas_dir):
-            remove(f'{self.pandas_dir}{file}')
-        for file in listdir(self.csv_month_sst):
-            remove(f'{self.csv_month_sst}{file}')
-        for file in listdir(self.nc_month_sst):
-            remove(f'{self.nc_month_sst}{file}')
-        for file in listdir(self.csv_month_dhw):
-            remove(f'{self.csv_month_dhw}{file}')
-        for file in listdir(self.nc_month_dhw):
-            remove(f'{self.nc_month_dhw}{file}')
+    def monthlyCalculations(self, rebuild = False):
+        # The manifest records the daily files (name and checksums) that went into each month the last time it
+        # was calculated, so that only the months with new or changed daily files are recalculated.
+        manifest_file = f'{self.pandas_dir}monthly_manifest.json'
+        sst_averages = f"{self.pandas_dir}sst_monthly_averages.csv"
+        dhw_averages = f"{self.pandas_dir}dhw_monthly_averages.csv"
+        
+        if rebuild:
+            # Delete the monthly outputs: the manifest and averages in the pandas directory (other files there, such
+            # as daily_statistics.csv, are kept), and the files in the csv_month_sst, nc_month_sst, csv_month_dhw, and
+            # nc_month_dhw directories.
+            for file in [manifest_file, sst_averages, dhw_averages]:
+                if path.exists(file): remove(file)
+            for file in listdir(self.csv_month_sst):
+                remove(f'{self.csv_month_sst}{file}')
+            for file in listdir(self.nc_month_sst):
+                remove(f'{self.nc_month_sst}{file}')
+            for file in listdir(self.csv_month_dhw):
+                remove(f'{self.csv_month_dhw}{file}')
+            for file in listdir(self.nc_month_dhw):
+                remove(f'{self.nc_month_dhw}{file}')
         
         printMessages = False
-        # Create 2 pandas dataframes for sst and dhw. Columns will be "Year-Month" and "Average"
-        dhw_df = DataFrame(columns=['Year-Month', 'Average'])
-        sst_df = DataFrame(columns=['Year-Month', 'Average'])
+        # Load the 2 pandas dataframes for sst and dhw from the last run. Columns will be "Year-Month" and "Average"
+        if path.exists(manifest_file) and path.exists(sst_averages) and path.exists(dhw_averages):
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+            sst_df = read_csv(sst_averages, index_col=0, dtype={'Year-Month': str})
+            dhw_df = read_csv(dhw_averages, index_col=0, dtype={'Year-Month': str})
+        # Otherwise, start from empty ones and calculate every month.
+        else:
+            manifest = {}
+            dhw_df = DataFrame(columns=['Year-Month', 'Average'])
+            sst_df = DataFrame(columns=['Year-Month', 'Average'])
         
-        # Create a list of items in nc_sst directory.
-        files_sst = listdir(f"{self.refined_dir}")
+        # Create a list of items in nc_sst directory, and the checksums of the sst and dhw files, from the catalog.
+        sst_checksums = self.catalog.checksums('sst')
+        dhw_checksums = self.catalog.checksums('dhw')
+        files_sst = [f'{date}.nc' for date in sorted(sst_checksums)]
         
         # Create a list of unique dates, specifically for YYYY-MM from files_sst list.
         dates = [file[0:7] for file in files_sst]
@@ -1072,46 +1234,70 @@ class BMNP_Data:
         dates = list(set(dates))
         dates = sort(dates)
         
-        # Loop through dates.
-        for year_mon in dates:
+        # Find the current files of each month: name, and the checksums of both the sst and dhw file.
+        signatures = {year_mon: [] for year_mon in dates}
+        for file in files_sst:
+            signatures[file[0:7]].append([file, sst_checksums[file[0:10]], dhw_checksums.get(file[0:10])])
+        
+        # Only recalculate the months that have changed (or have never been calculated).
+        changed = [year_mon for year_mon in dates if manifest.get(year_mon) != signatures[year_mon]]
+        print(f'[{datetime.now().strftime("%H:%M:%S")}] {len(changed)} of {len(dates)} months have new or changed daily files.')
+        
+        # Remove the rows of the changed months (and of months that no longer have any files). They are added back below.
+        sst_df = sst_df[sst_df['Year-Month'].isin(dates) & ~sst_df['Year-Month'].isin(changed)]
+        dhw_df = dhw_df[dhw_df['Year-Month'].isin(dates) & ~dhw_df['Year-Month'].isin(changed)]
+        
+        # Ocean pixels of the sst and dhw grids. The grids are the same every month, so the masks are made once.
+        ocean_sst, ocean_dhw = None, None
+        
+        # Loop through the changed dates.
+        for year_mon in changed:
             # Create a list of files that have the same year_mon in their name from files_sst.
             files = [file for file in files_sst if year_mon in file]
             
-            if not path.exists(f"{self.nc_dhw}{files[0]}"): doDHW = False
+            if files[0][0:10] not in dhw_checksums: doDHW = False
             else: doDHW = True
             
             # Load the first file from the nc_sst directory, then the nc_dhw directory.
             data_sst = nc.Dataset(f"{self.refined_dir}{files[0]}", 'r')
             if doDHW: data_dhw = nc.Dataset(f"{self.nc_dhw}{files[0]}", 'r')
             
-            # Create new numpy arrays for the sst and dhw data.
-            sst_data_tot = zeros(data_sst.variables['analysed_sst'][0, :, :].shape)
-            if doDHW: dhw_data_tot = zeros(data_dhw.variables['dhw'][:].shape)
-            else: dhw_data_tot = zeros(data_sst.variables['analysed_sst'][0, :, :].shape)
+            if ocean_sst is None: ocean_sst = self.oceanMask(data_sst.variables['lat'][:], data_sst.variables['lon'][:])
+            if doDHW and ocean_dhw is None: ocean_dhw = self.oceanMask(data_dhw.variables['lat'][:], data_dhw.variables['lon'][:])
+            
+            # Create new numpy arrays for the sst and dhw data, with only the ocean pixels.
+            sst_data_tot = zeros(len(ocean_sst.index))
+            if doDHW: dhw_data_tot = zeros(len(ocean_dhw.index))
             
             # Loop through each day and add data to the total data.
             if printMessages: print(f'[{datetime.now().strftime("%H:%M:%S")}] Doing the calculations for {year_mon}...')
-            for file in files:
-                # Open the file
-                data_sst = nc.Dataset(f"{self.refined_dir}{file}", 'r')
-                if doDHW:  data_dhw = nc.Dataset(f"{self.nc_dhw}{file}", 'r')
-                
-                # Add the data to the total data
-                sst_data_tot += data_sst.variables['analysed_sst'][0, :, :] - 273.15
-                if doDHW: dhw_data_tot += data_dhw.variables['dhw'][:]
-                
-                # Close the files
-                data_sst.close()
-                if doDHW: data_dhw.close()
+            with self.instrument.stage('read'):
+                for file in files:
+                    # Open the file (days without a dhw file yet, e.g. while the pipeline is running, only add their sst).
+                    hasDHW = doDHW and file[0:10] in dhw_checksums
+                    data_sst = nc.Dataset(f"{self.refined_dir}{file}", 'r')
+                    if hasDHW: data_dhw = nc.Dataset(f"{self.nc_dhw}{file}", 'r')
+                    
+                    # Add the data to the total data. Missing pixels (land) are added as nan, so they stay out of the averages.
+                    sst_data_tot += ma.filled(ocean_sst.compress(data_sst.variables['analysed_sst'][0, :, :] - 273.15), nan)
+                    if hasDHW: dhw_data_tot += ma.filled(ocean_dhw.compress(data_dhw.variables['dhw'][:]), nan)
+                    
+                    # Close the files
+                    data_sst.close()
+                    if hasDHW: data_dhw.close()
             
             # Divide the total data by the number of days to get the average.
             sst_data_tot /= len(files)
-            if doDHW: dhw_data_tot /= len(files)
+            if doDHW: dhw_data_tot /= len([file for file in files if file[0:10] in dhw_checksums])
             
             # Calculate the average of the sst and dhw data using non-nan values.
             sst_avg = nanmean(sst_data_tot)
             if doDHW: dhw_avg = nanmean(dhw_data_tot)
             
+            # Put the ocean pixels back on the grids, with land as nan.
+            sst_data_tot = ma.filled(ocean_sst.expand(sst_data_tot), nan)
+            if doDHW: dhw_data_tot = ma.filled(ocean_dhw.expand(dhw_data_tot), nan)
+            
             # Create a dictionary with the year_mon and average, then concatenate to the dataframes.
             sst_dict = {'Year-Month': year_mon, 'Average': sst_avg}
             if doDHW: dhw_dict = {'Year-Month': year_mon, 'Average': dhw_avg}
@@ -1121,7 +1307,7 @@ class BMNP_Data:
             # Create a new nc file in self.nc_month_sst, self.nc_month_dhw, and self.csv_month_sst, self.csv_month_dhw, with the corresponding data. Ensure names are correct.
             if printMessages: print(f'[{datetime.now().strftime("%H:%M:%S")}] Creating the nc and csv files for {year_mon}...')
             nc_sst = nc.Dataset(f"{self.nc_month_sst}{year_mon}.nc", 'w')
-            nc_dhw = nc.Dataset(f"{self.nc_month_dhw}{year_mon}.nc", 'w')
+            if doDHW: nc_dhw = nc.Dataset(f"{self.nc_month_dhw}{year_mon}.nc", 'w')
             
             # Load the first file from the nc_sst directory, then the nc_dhw directory.
             data_sst = nc.Dataset(f"{self.refined_dir}{files[0]}", 'r')
@@ -1136,34 +1322,32 @@ class BMNP_Data:
             # Create variables
             nc_sst_lons = nc_sst.createVariable('lon', 'f4', ('lon',))
             nc_sst_lats = nc_sst.createVariable('lat', 'f4', ('lat',))
-            nc_sst_sst = nc_sst.createVariable('analysed_sst', 'f4', ('lat', 'lon'))
+            nc_sst_sst = createGrid(nc_sst, 'analysed_sst', ('lat', 'lon'), 'celsius', storageProfile(self.config))
             if doDHW: nc_dhw_lons = nc_dhw.createVariable('lon', 'f4', ('lon',))
             if doDHW: nc_dhw_lats = nc_dhw.createVariable('lat', 'f4', ('lat',))
-            if doDHW: nc_dhw_dhw = nc_dhw.createVariable('dhw', 'f4', ('lat', 'lon'))
+            if doDHW: nc_dhw_dhw = createGrid(nc_dhw, 'dhw', ('lat', 'lon'), 'degree heating weeks', storageProfile(self.config))
             
             # Add attributes
             nc_sst_lons.units = 'degrees_east'
             nc_sst_lats.units = 'degrees_north'
-            nc_sst_sst.units = 'celsius'
             if doDHW: nc_dhw_lons.units = 'degrees_east'
             if doDHW: nc_dhw_lats.units = 'degrees_north'
-            if doDHW: nc_dhw_dhw.units = 'degree heating weeks'
             
             if printMessages: print(f'[{datetime.now().strftime("%H:%M:%S")}] Adding data to the nc files...')
-            # Add data
+            # Add data (nan pixels are written as missing, as a compact grid cannot store nan)
             nc_sst_lons[:] = data_sst.variables['lon'][:]
             nc_sst_lats[:] = data_sst.variables['lat'][:]
-            nc_sst_sst[:] = sst_data_tot
+            nc_sst_sst[:] = ma.masked_invalid(sst_data_tot)
             if doDHW: nc_dhw_lons[:] = data_dhw.variables['lon'][:]
             if doDHW: nc_dhw_lats[:] = data_dhw.variables['lat'][:]
-            if doDHW: nc_dhw_dhw[:] = dhw_data_tot
+            if doDHW: nc_dhw_dhw[:] = ma.masked_invalid(dhw_data_tot)
             
             if printMessages: print(f'[{datetime.now().strftime("%H:%M:%S")}] Creating the csv files...')
             # Create a csv file from the nc file, with the lat and lon included in the index and columns.
             df_sst = DataFrame(sst_data_tot, index=data_sst.variables['lat'][:], columns=data_sst.variables['lon'][:])
             if doDHW: df_dhw = DataFrame(dhw_data_tot, index=data_dhw.variables['lat'][:], columns=data_dhw.variables['lon'][:])
-            df_sst.to_csv(f"{self.csv_month_sst}{year_mon}.csv")
-            if doDHW: df_dhw.to_csv(f"{self.csv_month_dhw}{year_mon}.csv")
+            if self.text_csvs: df_sst.to_csv(f"{self.csv_month_sst}{year_mon}.csv")
+            if self.text_csvs and doDHW: df_dhw.to_csv(f"{self.csv_month_dhw}{year_mon}.csv")
             
             if printMessages: print(f'[{datetime.now().strftime("%H:%M:%S")}] Closing the nc files...')
             # Close the files
@@ -1174,13 +1358,165 @@ class BMNP_Data:
             if year_mon[-2:] == '12':
                 print(f'[{datetime.now().strftime("%H:%M:%S")}] Average calculations have been completed for {year_mon[0:4]}.')
         
+        # Put the months back in order.
+        sst_df = sst_df.sort_values('Year-Month').reset_index(drop=True)
+        dhw_df = dhw_df.sort_values('Year-Month').reset_index(drop=True)
+        
         # Create a csv file from the dataframes, with the year_mon and average included in the index and columns.
-        sst_df.to_csv(f"{self.pandas_dir}sst_monthly_averages.csv")
-        dhw_df.to_csv(f"{self.pandas_dir}dhw_monthly_averages.csv")
+        sst_df.to_csv(sst_averages)
+        dhw_df.to_csv(dhw_averages)
+        
+        # Save the manifest of the files used for each month.
+        with open(manifest_file, 'w') as f:
+            json.dump(signatures, f)
         
         # Print a message stating that the monthly calculations have been completed.
         print(f'[{datetime.now().strftime("%H:%M:%S")}] Monthly calculations have been completed.')
+    
+    def gridStatistics(self, prefix, grid):
+        # Summary of the valid (non-masked, non-nan) pixels of a grid, with the column names starting with prefix.
+        values = ma.compressed(ma.masked_invalid(grid))
+        if len(values) == 0: return {f'{prefix}_count': 0}
+        
+        p10, p50, p90 = percentile(values, [10, 50, 90])
+        stats = {'min': values.min(), 'mean': values.mean(), 'max': values.max(), 'p10': p10, 'p50': p50, 'p90': p90}
+        
+        stats = {f'{prefix}_{name}': round(float(value), 3) for name, value in stats.items()}
+        stats[f'{prefix}_count'] = len(values)
         
+        return stats
+    
+    def dailyStatistics(self, rebuild = False):
+        # One row per date with the min, mean, max and percentiles of the sst and dhw grids, the number of pixels
+        # above the bleaching threshold, and the alert level of the area. Only the dates whose sst or dhw file changed (by checksum) are recalculated.
+        statistics_file = f'{self.pandas_dir}daily_statistics.csv'
+        
+        if path.exists(statistics_file) and not rebuild:
+            statistics = read_csv(statistics_file, index_col='Date', dtype={'sst_checksum': str, 'dhw_checksum': str})
+            statistics = statistics.fillna({'sst_checksum': '', 'dhw_checksum': ''})
+        else:
+            statistics = DataFrame(columns=['sst_checksum', 'dhw_checksum'])
+            statistics.index.name = 'Date'
+        
+        # Current checksums of every sst and dhw file, from the catalog.
+        sst_checksums = self.catalog.checksums('sst')
+        dhw_checksums = self.catalog.checksums('dhw')
+        
+        # Dates that are new, or whose sst or dhw file is different from the one last used.
+        changed = []
+        for date in sorted(sst_checksums):
+            if date not in statistics.index or statistics.at[date, 'sst_checksum'] != sst_checksums[date] \
+                    or statistics.at[date, 'dhw_checksum'] != dhw_checksums.get(date, ''):
+                changed.append(date)
+        
+        # Remove the rows of dates that no longer have an sst file.
+        statistics = statistics[statistics.index.isin(list(sst_checksums))]
+        print(f'[{self.getHrMnSc()}] {len(changed)} of {len(sst_checksums)} dates need their daily statistics updated.')
+        if len(changed) == 0: return
+        
+        # The section of the sst grid covered by the bleaching threshold (MMM + 1).
+        window, new_lat, new_lon, mmm = self.dhwGridSetup([f'{date}.nc' for date in sorted(sst_checksums)])
+        min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx = window
+        
+        # Only the ocean pixels count: of the whole sst grid, of the section, and of the dhw grid (made on the first use).
+        data = nc.Dataset(f'{self.refined_dir}{changed[0]}.nc', 'r')
+        ocean_sst = self.oceanMask(data.variables['lat'][:], data.variables['lon'][:])
+        data.close()
+        ocean_window = self.oceanMask(new_lat[::-1], new_lon)
+        ocean_dhw = None
+        bleaching_threshold = ocean_window.compress(mmm + 1.0)
+        alert_dates = self.catalog.dates('alert')
+        
+        rows = []
+        for date in changed:
+            # sst statistics over the whole grid, and the pixels above the bleaching threshold.
+            data = nc.Dataset(f'{self.refined_dir}{date}.nc', 'r')
+            sst_data = data.variables['analysed_sst'][0, :, :] - 273.15
+            data.close()
+            
+            row = {'Date': date, 'sst_checksum': sst_checksums[date], 'dhw_checksum': dhw_checksums.get(date, '')}
+            row.update(self.gridStatistics('sst', ocean_sst.compress(sst_data)))
+            
+            above = ma.filled(ocean_window.compress(sst_data[min_lat_idx:max_lat_idx, min_lon_idx:max_lon_idx]) > bleaching_threshold, False)
+            row['sst_above_threshold'] = int(above.sum())
+            
+            # dhw statistics, and the pixels at or above 4 (significant bleaching) and 8 (severe bleaching).
+            if date in dhw_checksums:
+                data = nc.Dataset(f'{self.nc_dhw}{date}.nc', 'r')
+                if ocean_dhw is None: ocean_dhw = self.oceanMask(data.variables['lat'][:], data.variables['lon'][:])
+                dhw_data = ocean_dhw.compress(data.variables['dhw'][:])
+                data.close()
+                
+                row.update(self.gridStatistics('dhw', dhw_data))
+                row['dhw_above_4'] = int(ma.filled(dhw_data >= 4, False).sum())
+                row['dhw_above_8'] = int(ma.filled(dhw_data >= 8, False).sum())
+                
+                # Alert level of the area (see areaLevel), from the alert area of the day (on the same grid as the dhw).
+                if date in alert_dates:
+                    data = nc.Dataset(f'{self.nc_alert}{date}.nc', 'r')
+                    row['alert_level'] = areaLevel(ma.filled(ocean_dhw.compress(data.variables['alert_area'][:]), ALERT_FILL))
+                    data.close()
+            
+            rows.append(row)
+        
+        # Replace the changed rows, and put the dates back in order.
+        statistics = statistics.drop(index=changed, errors='ignore')
+        statistics = concat([statistics, DataFrame(rows).set_index('Date')]).sort_index()
+        
+        # Keep the pixel counts as whole numbers (dates without a dhw file have none), and the checksums at the end.
+        counts = ['sst_count', 'sst_above_threshold', 'dhw_count', 'dhw_above_4', 'dhw_above_8', 'alert_level']
+        statistics[counts] = statistics.reindex(columns=counts).astype('Int64')
+        columns = [column for column in statistics.columns if not column.endswith('_checksum')]
+        statistics = statistics[columns + ['sst_checksum', 'dhw_checksum']]
+        statistics.to_csv(statistics_file)
+        
+        print(f'[{self.getHrMnSc()}] Daily statistics have been updated.')
+    
+    def prerenderNewest(self):
+        # Save the dashboard's PNGs of the newest day in the renders folder, so that the dashboard does not need
+        # to render them itself. The rendering code lives with the dashboard (and needs matplotlib).
+        sys.path.append(path.join(path.dirname(path.dirname(path.abspath(__file__))), 'dashboard'))
+        from cache import GridCache
+        from render import RenderCache
+        
+        dates = sorted(self.catalog.dates('sst'))
+        if len(dates) == 0: return
+        
+        renders = RenderCache(GridCache(self.config, max_items=2),
+                              max_bytes=self.config.getint('dashboard', 'render_cache_mb', fallback=64) * 1024 * 1024,
+                              folder=self.config['folders']['renders'])
+        renders.prerender(dates[-1])
+        
+        print(f'[{self.getHrMnSc()}] The dashboard maps of {dates[-1]} have been rendered.')
+        
+def sstToCSV(nc_file, csv_file):
+    # Write the sst grid (Kelvin) of a refined nc file to a csv file, with lat / lon included in the index and columns.
+    # The csv file is written under a temporary name and then renamed, so a csv file that is there is always complete.
+    data = nc.Dataset(nc_file, 'r')
+    df = DataFrame(data.variables['analysed_sst'][0], index=data.variables['lat'][:], columns=data.variables['lon'][:])
+    data.close()
+    
+    df.to_csv(f'{csv_file}.tmp')
+    os.replace(f'{csv_file}.tmp', csv_file)
+
+def dhwBlock(files, targets, window, bleaching_threshold, ocean, new_lat, new_lon, text_csvs):
+    # Runs in a worker process of BMNP_Data.parallelDHWs: write the DHW and alert files of a contiguous block of targets,
+    # and return their dates. Only rollingDHWs and writeDHW are used, so the BMNP_Data is not set up (no catalog).
+    data = BMNP_Data.__new__(BMNP_Data)
+    data.config = ConfigParser()
+    data.config.read('config.ini')
+    data.text_csvs = text_csvs
+    data.instrument = BMNP_Instrument()
+    data.nc_lock = Lock()
+    
+    dates = []
+    for idx, date_name, total_dhw, alerts in data.rollingDHWs(files, targets, window, bleaching_threshold, ocean):
+        data.writeDHW(date_name, total_dhw, new_lat, new_lon)
+        data.writeAlert(date_name, alerts, new_lat, new_lon)
+        dates.append(date_name)
+    
+    return dates
+
 if __name__ == '__main__':
     startdate = '2002-06-01'
     enddate = datetime.today().strftime('%Y-%m-%d')
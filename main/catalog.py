@@ -0,0 +1,80 @@
+from os import listdir
+from datetime import datetime
+from hashlib import md5
+import sqlite3
+
+class BMNP_Catalog:
+    # Version of the processing that made the files. Increase this when a change means old files should be remade.
+    version = 1
+
+    def __init__(self, filename, folders):
+        # The catalog is a small SQLite database, with one row per date and product (e.g. "sst" or "dhw").
+        # folders gives the directory of each product's daily .nc files.
+        self.filename = filename
+        self.folders = folders
+
+        # Create the tables, if they do not exist.
+        with self.connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS products (date TEXT, product TEXT, path TEXT, checksum TEXT, granule TEXT, version INTEGER, updated TEXT, PRIMARY KEY (date, product))')
+            db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            synced = db.execute("SELECT value FROM meta WHERE key = 'synced'").fetchone()
+
+        # The first time the catalog is used, fill it in from the files that already exist.
+        if synced is None: self.sync()
+
+    def connect(self):
+        return sqlite3.connect(self.filename, timeout=60)
+
+    def checksum(self, filename):
+        # md5 checksum of the file.
+        with open(filename, 'rb') as f:
+            return md5(f.read()).hexdigest()
+
+    def sync(self):
+        # Compare the catalog with the files in each product's folder: add files that are missing from the catalog,
+        # and remove rows whose files no longer exist.
+        for product, folder in self.folders.items():
+            files = set(file[0:10] for file in listdir(folder) if file.endswith('.nc'))
+            dates = self.dates(product)
+
+            for date in sorted(files - dates):
+                self.record(date, product)
+            self.forget(product, dates - files)
+
+        with self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('synced', ?)", (datetime.now().isoformat(timespec='seconds'),))
+
+    def record(self, date, product, granule = None):
+        # Add (or update) the row for the date and product, using the file in the product's folder.
+        filename = f'{self.folders[product]}{date}.nc'
+        with self.connect() as db:
+            db.execute('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       (date, product, filename, self.checksum(filename), granule, self.version, datetime.now().isoformat(timespec='seconds')))
+
+    def forget(self, product, dates = None):
+        # Remove the rows of the given dates for the product (by default, every date).
+        with self.connect() as db:
+            if dates is None:
+                db.execute('DELETE FROM products WHERE product = ?', (product,))
+            else:
+                db.executemany('DELETE FROM products WHERE product = ? AND date = ?', [(product, date) for date in dates])
+
+    def dates(self, product):
+        # Set of the dates that have the product.
+        with self.connect() as db:
+            rows = db.execute('SELECT date FROM products WHERE product = ?', (product,)).fetchall()
+
+        return set(row[0] for row in rows)
+
+    def checksums(self, product):
+        # Dictionary of date: checksum for the product.
+        with self.connect() as db:
+            rows = db.execute('SELECT date, checksum FROM products WHERE product = ?', (product,)).fetchall()
+
+        return dict(rows)
+
+    def has(self, date, product):
+        with self.connect() as db:
+            row = db.execute('SELECT 1 FROM products WHERE product = ? AND date = ?', (product, date)).fetchone()
+
+        return row is not None
@@ -0,0 +1,104 @@
+from os import path, makedirs, replace
+from datetime import datetime
+import netCDF4 as nc
+from numpy import lib, ma, nan, flip, save, float32, repeat, tile, isnan
+from pandas import DataFrame, concat
+import json
+
+class BMNP_Export:
+    # Formats that can be exported. "npy" gives one memory-mappable stack per product and year, and "parquet" gives
+    # one file per product and year in a long (date, lat, lon, value) layout.
+    formats = ('npy', 'parquet')
+
+    def __init__(self, folder, catalog, format = 'npy'):
+        # The daily sst (Celsius) and dhw grids of the catalog are exported to folder, always with latitude ascending.
+        # The manifest records the checksum of each daily file that was exported, so only changed dates are exported.
+        if format not in self.formats:
+            raise ValueError(f'Invalid export format: {format}. Use one of {self.formats}.')
+
+        self.folder = folder
+        self.catalog = catalog
+        self.format = format
+        self.manifest_file = f'{folder}manifest_{format}.json'
+
+        if not path.exists(folder): makedirs(folder)
+
+    def loadGrid(self, date, product):
+        # The grid of a day (as float32 with nan for missing pixels), its latitude and longitude, with latitude ascending.
+        file = nc.Dataset(f'{self.catalog.folders[product]}{date}.nc', 'r')
+        lats = ma.getdata(file.variables['lat'][:])
+        lons = ma.getdata(file.variables['lon'][:])
+        if product == 'sst': grid = file.variables['analysed_sst'][0, :, :] - 273.15
+        else: grid = file.variables['dhw'][:]
+        file.close()
+
+        if lats[0] > lats[-1]:
+            lats = flip(lats, 0)
+            grid = flip(grid, 0)
+
+        return ma.filled(grid.astype(float32), nan), lats, lons
+
+    def dayOfYear(self, date):
+        # Slot of the date in the stack of its year.
+        return datetime.strptime(date, '%Y-%m-%d').timetuple().tm_yday - 1
+
+    def stackFile(self, product, year):
+        return f'{self.folder}{product}_{year}.npy'
+
+    def writeNpy(self, product, year, dates):
+        # Write each day into its slot of the year's stack (366, lat, lon), creating the stack (all nan) if needed.
+        # The latitude and longitude of the product are saved next to the stacks.
+        stack = None
+        for date in dates:
+            grid, lats, lons = self.loadGrid(date, product)
+
+            if stack is None:
+                if path.exists(self.stackFile(product, year)):
+                    stack = lib.format.open_memmap(self.stackFile(product, year), mode='r+')
+                else:
+                    stack = lib.format.open_memmap(self.stackFile(product, year), mode='w+', dtype=float32, shape=(366,) + grid.shape)
+                    stack[:] = nan
+                    save(f'{self.folder}{product}_lat.npy', lats)
+                    save(f'{self.folder}{product}_lon.npy', lons)
+
+            stack[self.dayOfYear(date)] = grid
+
+        if stack is not None: stack.flush()
+
+    def writeParquet(self, product, year, dates):
+        # Parquet files can not be added to, so the whole year is written again (through a temporary file).
+        frames = []
+        for date in dates:
+            grid, lats, lons = self.loadGrid(date, product)
+            frame = DataFrame({'date': date, 'lat': repeat(lats, len(lons)).astype(float32),
+                               'lon': tile(lons, len(lats)).astype(float32), 'value': grid.ravel()})
+            frames.append(frame[~isnan(frame['value'])])
+
+        filename = f'{self.folder}{product}_{year}.parquet'
+        concat(frames, ignore_index=True).to_parquet(f'{filename}.tmp', index=False)
+        replace(f'{filename}.tmp', filename)
+
+    def export(self, products = ('sst', 'dhw')):
+        # Export every date whose file is new or has changed since the last export.
+        manifest = {}
+        if path.exists(self.manifest_file):
+            with open(self.manifest_file, 'r') as f:
+                manifest = json.load(f)
+
+        for product in products:
+            checksums = self.catalog.checksums(product)
+            exported = manifest.get(product, {})
+            changed = [date for date in sorted(checksums) if exported.get(date) != checksums[date]]
+
+            for year in sorted(set(date[0:4] for date in changed)):
+                if self.format == 'npy':
+                    self.writeNpy(product, year, [date for date in changed if date[0:4] == year])
+                else:
+                    self.writeParquet(product, year, [date for date in sorted(checksums) if date[0:4] == year])
+
+            # Save the manifest after each product, so an interrupted export is picked up where it stopped.
+            manifest[product] = {date: checksums[date] for date in checksums}
+            with open(self.manifest_file, 'w') as f:
+                json.dump(manifest, f)
+
+            print(f'[{datetime.now().strftime("%H:%M:%S")}] {len(changed)} {product} dates have been exported as {self.format}.')
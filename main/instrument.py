@@ -0,0 +1,171 @@
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from threading import Lock, local
+from os import path, makedirs
+import sys
+import json
+import netCDF4 as nc
+
+# Peak memory is only available where the resource module is (not on Windows).
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Instruments that are recording. Audit hooks can not be removed, so the hook is only added once per process
+# (the first time an instrument starts recording), and counts the opens for whichever instruments are recording.
+recording = []
+hooked = False
+
+def auditOpens(event, args):
+    if event == 'open' and len(recording) > 0 and args[0] != '/proc/self/io':
+        mode = args[1] if len(args) > 1 and isinstance(args[1], str) else 'r'
+        for instrument in list(recording):
+            instrument.count('file_opens_write' if any(flag in mode for flag in 'wax+') else 'file_opens_read')
+
+class BMNP_Instrument:
+    def __init__(self, report_dir = None, profile = None):
+        # Records how long each stage of a run takes, how many files it opens, how much it reads and writes, and the
+        # peak memory of the process at the end of the stage. If report_dir is given, a JSON report of the run is written there.
+        # profile is None, "cprofile" or "pyinstrument", to profile the whole run (saved next to the report).
+        self.report_dir = report_dir
+        self.profile = profile
+        self.enabled = report_dir is not None
+        self.started = datetime.now()
+        self.stages = {}
+        self.counters = {}
+        self.lock = Lock()
+        self.profiler = None
+
+        # Stages that are running in each thread, so a stage inside another one is recorded as "outer/inner".
+        self.local = local()
+
+        if self.enabled: self.start()
+
+    def start(self):
+        # Count the files opened by Python (csv, json, catalog checksums) with an audit hook, and the netCDF files
+        # by swapping netCDF4.Dataset for a function that counts each open (until close is called).
+        global hooked
+        if not path.exists(self.report_dir): makedirs(self.report_dir)
+        if not hooked:
+            sys.addaudithook(auditOpens)
+            hooked = True
+        recording.append(self)
+
+        original = nc.Dataset
+        def countedDataset(filename, mode = 'r', *args, **kwargs):
+            self.count('netcdf_opens_write' if mode in ('w', 'a', 'r+', 'ws') else 'netcdf_opens_read')
+            return original(filename, mode, *args, **kwargs)
+        self.original_dataset = original
+        self.counted_dataset = countedDataset
+        nc.Dataset = countedDataset
+
+        if self.profile == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif self.profile == 'pyinstrument':
+            from pyinstrument import Profiler
+            self.profiler = Profiler()
+            self.profiler.start()
+
+    def count(self, name, amount = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def io(self):
+        # Bytes read and written by this process (Linux only). rchar / wchar include everything that was read or
+        # written, read_bytes / write_bytes only what reached the disk.
+        if not path.exists('/proc/self/io'): return {}
+
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.strip().split(': ') for line in f if ': ' in line)
+
+        return {name: int(fields[name]) for name in ('rchar', 'wchar', 'syscr', 'syscw', 'read_bytes', 'write_bytes') if name in fields}
+
+    def peakRSS(self):
+        # Peak resident memory of the process (and of any finished child processes, like the downloader) in MB.
+        if resource is None: return None
+
+        # ru_maxrss is in kilobytes on Linux, and bytes on macOS.
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return {'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+                'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)}
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        counters.update(self.io())
+
+        return perf_counter(), counters
+
+    @contextmanager
+    def timer(self, name):
+        # Add the seconds taken to the counter "name_seconds". Unlike stage, this can be used from any thread.
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            self.count(f'{name}_seconds', round(perf_counter() - start_time, 4))
+
+    @contextmanager
+    def stage(self, name):
+        # Time a stage (or a part of one). A stage that runs more than once (e.g. inside a loop) is added up.
+        # The deltas of the counters are only measured for stages that are not inside another one, as the counters
+        # are shared by every thread (so a stage in one thread also counts what the other threads do meanwhile).
+        if not hasattr(self.local, 'running'): self.local.running = []
+        self.local.running.append(name)
+        full_name = '/'.join(self.local.running)
+        outer = len(self.local.running) == 1
+        start_time, start_counters = self.snapshot() if outer else (perf_counter(), None)
+
+        try:
+            yield
+        finally:
+            self.local.running.pop()
+            end_time = perf_counter()
+
+            with self.lock:
+                stage = self.stages.setdefault(full_name, {'seconds': 0.0, 'calls': 0})
+                stage['seconds'] = round(stage['seconds'] + end_time - start_time, 4)
+                stage['calls'] += 1
+
+            # Peak memory is that of the whole process so far (the operating system only keeps one peak per process),
+            # so it shows the stage where the peak was reached, not how much memory each stage used.
+            if outer and self.enabled:
+                _, end_counters = self.snapshot()
+                stage['io'] = {name: end_counters[name] - start_counters.get(name, 0) for name in end_counters}
+                stage['process_peak_rss_mb'] = self.peakRSS()
+
+    def close(self):
+        # Stop counting and profiling, and put netCDF4.Dataset back. This is called even if the run fails (it does
+        # nothing the second time), so that the rest of the process is not counted.
+        if not self.enabled: return
+        self.enabled = False
+        if self in recording: recording.remove(self)
+        if nc.Dataset is self.counted_dataset: nc.Dataset = self.original_dataset
+
+        if self.profile == 'cprofile': self.profiler.disable()
+        elif self.profile == 'pyinstrument': self.profiler.stop()
+
+    def finish(self, **details):
+        # Stop counting and profiling, and write the report (run_YYYYmmdd_HHMMSS.json) to report_dir.
+        if not self.enabled: return None
+        self.close()
+
+        name = f"{self.report_dir}run_{self.started.strftime('%Y%m%d_%H%M%S')}"
+        if self.profile == 'cprofile':
+            self.profiler.dump_stats(f'{name}.prof')
+        elif self.profile == 'pyinstrument':
+            with open(f'{name}.html', 'w') as f:
+                f.write(self.profiler.output_html())
+
+        report = {'started': self.started.isoformat(timespec='seconds'),
+                  'seconds': round((datetime.now() - self.started).total_seconds(), 4),
+                  'details': details, 'stages': self.stages, 'counters': self.counters, 'peak_rss_mb': self.peakRSS()}
+
+        with open(f'{name}.json', 'w') as f:
+            json.dump(report, f, indent=4)
+
+        return f'{name}.json'
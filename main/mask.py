@@ -0,0 +1,73 @@
+from os import path, makedirs, replace
+from hashlib import md5
+from numpy import asarray, around, meshgrid, flatnonzero, ones, zeros, savez, load, ma, nan, float64
+
+class BMNP_Mask:
+    def __init__(self, lats, lons, shapefile = './shape/BON_Coastline.shp', cache_dir = './data/masks/'):
+        # Ocean pixels of a grid: a pixel is ocean if its centre is not on land in the coastline shapefile.
+        # The mask is made once per grid (and shapefile) and cached in cache_dir. Each stage can then work on the
+        # 1-D vector of ocean pixels (compress), and put it back on the grid when writing (expand).
+        # Without the shapefile, every pixel counts as ocean.
+        self.lats = asarray(lats, dtype=float64)
+        self.lons = asarray(lons, dtype=float64)
+        self.shape = (len(self.lats), len(self.lons))
+        self.shapefile = shapefile
+
+        if shapefile is None or not path.exists(shapefile):
+            self.cache_file = None
+            self.ocean = ones(self.shape, dtype=bool)
+        else:
+            self.cache_file = f'{cache_dir}ocean_{self.fingerprint()}.npz'
+            self.ocean = self.cached(cache_dir)
+
+        # Flat indices of the ocean pixels.
+        self.index = flatnonzero(self.ocean)
+
+    def cached(self, cache_dir):
+        # The mask from the cache, or rasterized and saved to it (under a temporary name, then renamed).
+        if path.exists(self.cache_file):
+            return load(self.cache_file)['ocean']
+
+        ocean = self.build()
+        if not path.exists(cache_dir): makedirs(cache_dir)
+        savez(f'{self.cache_file}.tmp.npz', ocean=ocean, lats=self.lats, lons=self.lons)
+        replace(f'{self.cache_file}.tmp.npz', self.cache_file)
+
+        return ocean
+
+    def fingerprint(self):
+        # The grid (to 4 decimal places) and the shapefile identify the mask.
+        key = md5(around(self.lats, 4).tobytes() + around(self.lons, 4).tobytes())
+        with open(self.shapefile, 'rb') as f:
+            key.update(f.read())
+
+        return key.hexdigest()
+
+    def build(self):
+        # Rasterize the coastline onto the grid, using the centre of each pixel. geopandas is only needed here.
+        import geopandas
+        import shapely
+
+        land = geopandas.read_file(self.shapefile).to_crs(epsg=4326).union_all()
+        lon, lat = meshgrid(self.lons, self.lats)
+
+        return ~shapely.contains_xy(land, lon, lat)
+
+    def compress(self, grid):
+        # 1-D (masked) vector of the ocean pixels of a grid (or of a stack of grids, on the last two axes).
+        grid = ma.asarray(grid)
+        return grid.reshape(grid.shape[:-2] + (-1,))[..., self.index]
+
+    def expand(self, vector):
+        # Put a vector of ocean pixels (or a stack of them) back on the grid. Land pixels are masked. The data under
+        # the mask is 0 (not left uninitialised), so the grid can be cast when it is written.
+        vector = ma.asarray(vector)
+        grid = ma.masked_array(zeros(vector.shape[:-1] + (self.shape[0] * self.shape[1],), dtype=vector.dtype), mask=True)
+        grid[..., self.index] = ma.masked_array(ma.filled(vector, 0), mask=ma.getmaskarray(vector))
+
+        return grid.reshape(vector.shape[:-1] + self.shape)
+
+    def mean(self, grid):
+        # Average of the ocean pixels of a grid (ignoring missing pixels), or nan if there are none.
+        values = ma.masked_invalid(self.compress(grid))
+        return float(values.mean()) if values.count() > 0 else nan
@@ -0,0 +1,139 @@
+from datetime import datetime
+from threading import Thread, Lock
+from queue import Queue
+
+class BMNP_Pipeline:
+    def __init__(self, data, downloader, queue_size = 16, summary_days = 30):
+        # Streams the missing dates of a BMNP_Data through its stages at the same time, instead of one stage after
+        # the other: download and subset (BMNP_Download, which also writes the sst file), the single-day DHW and
+        # alert files, and the summaries (daily statistics and monthly averages). Each stage runs in its own thread
+        # and passes dates to the next through a queue of at most queue_size dates, so a fast stage waits for a
+        # slow one instead of running ahead of it. The summaries are updated every summary_days dates.
+        # downloader is BMNP_Download. The netCDF library is not thread-safe, so every stage opens its netCDF files
+        # under one shared lock.
+        self.data = data
+        self.downloader = downloader
+        self.queue_size = queue_size
+        self.summary_days = summary_days
+        self.nc_lock = Lock()
+        self.errors = []
+
+        # Queues that a stage has taken the last date (None) from.
+        self.closed = set()
+
+    def getTime(self):
+        return datetime.now().strftime('%H:%M:%S')
+
+    def run(self, missing_dates):
+        # Download missing_dates, and create the DHWs of every date that needs one (see dhwStage), as each date
+        # arrives. Returns the BMNP_Download, and raises the first error of any stage once every stage has stopped.
+        refined = Queue(self.queue_size)
+        updated = Queue(self.queue_size)
+        self.data.nc_lock = self.nc_lock
+        results = {}
+
+        def download():
+            data = self.data
+            results['download'] = self.downloader(dates=missing_dates, type=data.downloadtype, workers=data.download_workers,
+                                                date_ranges=data.groupDateRanges(missing_dates), archive=data.archive,
+                                                catalog=data.catalog, text_csvs=data.text_csvs, instrument=data.instrument,
+                                                refined=refined, fix_lock=self.nc_lock)
+
+        stages = [Thread(target=self.stage, args=('pipeline_download', download, None, refined)),
+                  Thread(target=self.stage, args=('pipeline_dhw', lambda: self.dhwStage(missing_dates, refined, updated), refined, updated)),
+                  Thread(target=self.stage, args=('pipeline_summary', lambda: self.summaryStage(updated), updated, None))]
+
+        print(f'[{self.getTime()}] Streaming {len(missing_dates)} dates through the download, DHW and summary stages...')
+        for thread in stages: thread.start()
+        for thread in stages: thread.join()
+
+        if len(self.errors) > 0: raise self.errors[0]
+
+        return results.get('download')
+
+    def take(self, source):
+        # The next date from a queue (None once there are no more).
+        date = source.get()
+        if date is None: self.closed.add(id(source))
+
+        return date
+
+    def drain(self, source):
+        # Take (and drop) the rest of the dates of a queue.
+        while id(source) not in self.closed: self.take(source)
+
+    def stage(self, name, work, source, sink):
+        # Run a stage. If it fails, keep taking (and dropping) dates from source so the stage before it is not
+        # left waiting on a full queue. Either way, tell the next stage that there are no more dates (None).
+        try:
+            with self.data.instrument.stage(name): work()
+        except Exception as e:
+            self.errors.append(e)
+            print(f'[{self.getTime()}] The stage {name} failed. {e}')
+            if source is not None: self.drain(source)
+        finally:
+            if sink is not None: sink.put(None)
+
+    def dhwStage(self, missing_dates, refined, updated):
+        # Create the DHWs in date order, with rollingDHWs. The list of sst files it reads from grows as the dates
+        # arrive, so a target is only started once every date up to it has been through the download stage.
+        # Targets are the same as createDHWs: every date (after the first 84 files) without both a dhw and an alert file.
+        data = self.data
+        existing = data.catalog.dates('sst')
+        finished = data.catalog.dates('dhw') & data.catalog.dates('alert')
+        pending = set(missing_dates)
+        dates = sorted(existing | pending)
+
+        # The dates that have come through the download stage (in any order).
+        arrived = set()
+
+        # The grid is taken from the first sst file, so wait for one if there are none yet.
+        while len(existing) == 0:
+            date = self.take(refined)
+            if date is None: return
+            arrived.add(date)
+            existing = data.catalog.dates('sst')
+
+        with self.nc_lock:
+            window, new_lat, new_lon, bleaching_threshold = data.dhwGridSetup(sorted(f'{date}.nc' for date in existing))
+            ocean = data.oceanMask(new_lat[::-1], new_lon)
+
+        # The dates with an sst file, in order, as far as the stage has got.
+        files = []
+
+        def ready():
+            for date in dates:
+                # Wait for the download stage to get to the date.
+                while date in pending and date not in arrived and id(refined) not in self.closed:
+                    arrived.add(self.take(refined))
+
+                # A date whose download failed has no sst file, so it is left out (the same as createDHWs).
+                if date in pending and not data.catalog.has(date, 'sst'): continue
+
+                files.append(date)
+                if len(files) > 84 and (date in pending or date not in finished): yield len(files) - 1
+
+        for idx, date_name, total_dhw, alerts in data.rollingDHWs(files, ready(), window, bleaching_threshold, ocean):
+            with data.instrument.stage('write'), self.nc_lock:
+                data.writeDHW(date_name, total_dhw, new_lat, new_lon)
+                data.writeAlert(date_name, alerts, new_lat, new_lon)
+            data.catalog.record(date_name, 'dhw')
+            data.catalog.record(date_name, 'alert')
+            updated.put(date_name)
+
+        # Let the download stage finish.
+        self.drain(refined)
+
+    def summaryStage(self, updated):
+        # Update the daily statistics and the monthly averages every summary_days new DHWs, and once more at the end.
+        # Both only recalculate the dates and months whose files changed.
+        count = 0
+        while True:
+            date = self.take(updated)
+            if date is not None: count += 1
+            if count >= self.summary_days or (date is None and len(self.data.catalog.dates('sst')) > 0):
+                with self.nc_lock:
+                    self.data.dailyStatistics()
+                    self.data.monthlyCalculations()
+                count = 0
+            if date is None: break
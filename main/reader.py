@@ -0,0 +1,137 @@
+from configparser import ConfigParser
+from os import path
+from datetime import datetime, timedelta
+from numpy import load, full, nan, float32, concatenate, searchsorted, abs as np_abs, ma
+from archive import BMNP_Archive
+
+class BMNP_Reader:
+    def __init__(self, config = None):
+        # Reads ranges of the sst (Celsius) and dhw grids without opening the daily files. The npy stacks written by
+        # BMNP_Export are used when they exist (memory-mapped, so a slice of a year is not copied). Otherwise the
+        # archives sst_bmnp.nc and dhw_bmnp.nc are read, one contiguous read per range.
+        # Every result has latitude ascending, and nan for missing days and pixels.
+        if config is None:
+            config = ConfigParser()
+            config.read('config.ini')
+
+        self.export_dir = config['folders']['export']
+        self.archives = {'sst': BMNP_Archive(f"{config['folders']['data']}sst_bmnp.nc"),
+                         'dhw': BMNP_Archive(f"{config['folders']['data']}dhw_bmnp.nc", variable='dhw')}
+
+    def useStacks(self, product):
+        return path.exists(f'{self.export_dir}{product}_lat.npy')
+
+    def grid(self, product):
+        # Latitude and longitude of the product.
+        if self.useStacks(product):
+            return load(f'{self.export_dir}{product}_lat.npy'), load(f'{self.export_dir}{product}_lon.npy')
+
+        if not self.archives[product].exists():
+            raise FileNotFoundError(f'There is no {product} data to read. Run BMNP_Data with export_format="npy" or create_databases=True.')
+
+        lats, lons = self.archives[product].grid()
+        return ma.getdata(lats), ma.getdata(lons)
+
+    def window(self, product, bbox = None):
+        # Slices of latitude and longitude covering bbox (min_lat, max_lat, min_lon, max_lon). None is the whole grid.
+        lats, lons = self.grid(product)
+        if bbox is None: return slice(None), slice(None), lats, lons
+
+        # The edges are widened by a small tolerance, as the coordinates are stored as float32.
+        min_lat, max_lat, min_lon, max_lon = bbox
+        lat_slice = slice(searchsorted(lats, min_lat - 1e-4), searchsorted(lats, max_lat + 1e-4, side='right'))
+        lon_slice = slice(searchsorted(lons, min_lon - 1e-4), searchsorted(lons, max_lon + 1e-4, side='right'))
+
+        return lat_slice, lon_slice, lats[lat_slice], lons[lon_slice]
+
+    def dateList(self, start, end):
+        start = datetime.strptime(start, '%Y-%m-%d')
+        end = datetime.strptime(end, '%Y-%m-%d')
+
+        return [(start + timedelta(days=day)).strftime('%Y-%m-%d') for day in range((end - start).days + 1)]
+
+    def readStacks(self, product, start, end, lat_slice, lon_slice, shape):
+        # Slice each year's stack. A range inside one year is a view of the memory-mapped file.
+        blocks = []
+        for year in range(int(start[0:4]), int(end[0:4]) + 1):
+            first = max(datetime.strptime(start, '%Y-%m-%d'), datetime(year, 1, 1))
+            last = min(datetime.strptime(end, '%Y-%m-%d'), datetime(year, 12, 31))
+            first_slot = first.timetuple().tm_yday - 1
+            last_slot = last.timetuple().tm_yday
+
+            stack_file = f'{self.export_dir}{product}_{year}.npy'
+            if path.exists(stack_file):
+                blocks.append(load(stack_file, mmap_mode='r')[first_slot:last_slot, lat_slice, lon_slice])
+            else:
+                blocks.append(full((last_slot - first_slot,) + shape, nan, dtype=float32))
+
+        return blocks[0] if len(blocks) == 1 else concatenate(blocks)
+
+    def readArchive(self, product, start, end, lat_slice, lon_slice, shape):
+        # One read from the archive. Days before the start (or after the end) of the archive are nan.
+        archive = self.archives[product]
+        dates = self.dateList(start, end)
+        data = full((len(dates),) + shape, nan, dtype=float32)
+
+        first = max(start, archive.start_date)
+        if first > end: return data
+
+        archive_dates, grids = archive.read(first, end, lat_slice, lon_slice)
+        if len(archive_dates) == 0: return data
+
+        offset = dates.index(archive_dates[0])
+        data[offset:offset + len(archive_dates)] = ma.filled(grids.astype(float32), nan)
+
+        return data
+
+    def read(self, product, start, end, bbox = None):
+        # Grids of the product from start to end (inclusive). Returns the dates, latitude, longitude and
+        # the data, shaped (date, lat, lon).
+        lat_slice, lon_slice, lats, lons = self.window(product, bbox)
+        dates = self.dateList(start, end)
+        shape = (len(lats), len(lons))
+
+        if self.useStacks(product):
+            data = self.readStacks(product, start, end, lat_slice, lon_slice, shape)
+        else:
+            data = self.readArchive(product, start, end, lat_slice, lon_slice, shape)
+
+        return dates, lats, lons, data
+
+    def pixelSeries(self, product, lat, lon, start = None, end = None):
+        # Time series of the pixel nearest to (lat, lon). By default from 2002-06-01 to yesterday.
+        if start is None: start = '2002-06-01'
+        if end is None: end = (datetime.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+        lats, lons = self.grid(product)
+        lat_idx = int(np_abs(lats - lat).argmin())
+        lon_idx = int(np_abs(lons - lon).argmin())
+        pixel = (slice(lat_idx, lat_idx + 1), slice(lon_idx, lon_idx + 1))
+
+        if self.useStacks(product):
+            data = self.readStacks(product, start, end, *pixel, (1, 1))
+        else:
+            data = self.readArchive(product, start, end, *pixel, (1, 1))
+
+        return self.dateList(start, end), data[:, 0, 0]
+
+# Reader used by the functions below, made the first time one of them is used.
+reader = None
+
+def getReader():
+    global reader
+    if reader is None: reader = BMNP_Reader()
+
+    return reader
+
+def get_sst(start, end, bbox = None):
+    # sst (Celsius) from start to end, within bbox (min_lat, max_lat, min_lon, max_lon). Returns dates, lats, lons, data.
+    return getReader().read('sst', start, end, bbox)
+
+def get_dhw(start, end, bbox = None):
+    # dhw from start to end, within bbox (min_lat, max_lat, min_lon, max_lon). Returns dates, lats, lons, data.
+    return getReader().read('dhw', start, end, bbox)
+
+def get_pixel_series(lat, lon, product = 'sst', start = None, end = None):
+    # Time series of one pixel, as the list of dates and the values.
+    return getReader().pixelSeries(product, lat, lon, start, end)
@@ -0,0 +1,38 @@
+from numpy import float32
+
+# Storage profiles of the refined grids (set with "profile" in the [storage] section of config.ini):
+# "float" stores them as float32, "compact" as int16 packed with a scale factor and offset (like the MUR files),
+# with a fill value for missing pixels, zlib / shuffle compression and one chunk per day.
+PROFILES = ('float', 'compact')
+
+# Packing of the compact profile for each kind of grid (by its units): (scale_factor, add_offset). The int16 range
+# (-32767 to 32767, as -32768 is the fill value) covers 265.4 to 330.9 Kelvin, -7.8 to 57.8 Celsius, and 0 to 327 DHW.
+# The attributes are float32, so the grids are read back as float32, the same as with the float profile.
+PACKING = {'kelvin': (float32(0.001), float32(298.15)),
+           'celsius': (float32(0.001), float32(25.0)),
+           'degree heating weeks': (float32(0.01), float32(0.0))}
+FILL_VALUE = -32768
+
+def storageProfile(config):
+    # The storage profile of config.ini ("float" if it is not set).
+    profile = config.get('storage', 'profile', fallback='float')
+    if profile not in PROFILES:
+        raise ValueError(f'Invalid storage profile: {profile}. Use one of {PROFILES}.')
+
+    return profile
+
+def createGrid(dataset, name, dimensions, units, profile = 'float', **options):
+    # Create the variable of a grid in dataset, stored the way profile says. options are passed on to createVariable,
+    # e.g. chunksizes. The compact profile chunks by one step along unlimited dimensions (a day) and the whole of
+    # the others, unless chunksizes is given. netCDF4 unpacks the grid (and masks the fill value) when it is read.
+    if profile == 'compact':
+        chunksizes = tuple(1 if dataset.dimensions[dim].isunlimited() else len(dataset.dimensions[dim]) for dim in dimensions)
+        options = {'zlib': True, 'complevel': 4, 'shuffle': True, 'chunksizes': chunksizes, **options}
+        variable = dataset.createVariable(name, 'i2', dimensions, fill_value=FILL_VALUE, **options)
+        variable.scale_factor, variable.add_offset = PACKING[units]
+    else:
+        variable = dataset.createVariable(name, 'f4', dimensions, **options)
+
+    variable.units = units
+
+    return variable
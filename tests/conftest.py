@@ -0,0 +1,40 @@
+import sys
+import os
+import stat
+import pytest
+
+# Add the paths ./main/, ./benchmark/ and ./dashboard/ to the sys.path, the same as main.py, the benchmark and the dashboard.
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(repo, 'main'))
+sys.path.append(os.path.join(repo, 'benchmark'))
+sys.path.append(os.path.join(repo, 'dashboard'))
+from synthetic import makeWorkspace
+
+# Stands in for podaac-data-downloader: copies the synthetic granules from --start-date to --end-date into -d.
+DOWNLOADER = f'''#!{sys.executable}
+import sys, os, shutil
+args = sys.argv[1:]
+folder, start, end = args[args.index('-d') + 1], args[args.index('--start-date') + 1][:10], args[args.index('--end-date') + 1][:10]
+for filename in sorted(os.listdir(os.environ['BMNP_GRANULES'])):
+    date = f'{{filename[0:4]}}-{{filename[4:6]}}-{{filename[6:8]}}'
+    if start <= date <= end: shutil.copy(os.path.join(os.environ['BMNP_GRANULES'], filename), folder)
+'''
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # A synthetic workspace of 100 days (enough for 16 DHWs), with a fake podaac-data-downloader and .netrc,
+    # that BMNP_Data runs in. Returns the list of dates.
+    dates = makeWorkspace(str(tmp_path), 100 / 365.25, os.path.join(repo, 'config.ini'))
+
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'podaac-data-downloader').write_text(DOWNLOADER)
+    (bin_dir / 'podaac-data-downloader').chmod(stat.S_IRWXU)
+    (tmp_path / '.netrc').write_text('machine urs.earthdata.nasa.gov login user password pass')
+
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('BMNP_GRANULES', str(tmp_path / 'granules'))
+    monkeypatch.chdir(tmp_path)
+
+    return dates
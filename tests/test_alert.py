@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from alert import alertLevel, areaLevel, ALERT_FILL
+from bmnp import BMNP_DHWWindow
+
+# (HotSpot, DHW, level) at the edges of each NOAA Coral Reef Watch level.
+LEVELS = [(0.0, 0.0, 0), (0.0, 25.0, 0),
+          (0.01, 0.0, 1), (0.99, 30.0, 1),
+          (1.0, 0.0, 2), (1.0, 3.99, 2),
+          (1.0, 4.0, 3), (2.5, 7.99, 3),
+          (1.0, 8.0, 4), (1.0, 11.99, 4),
+          (1.0, 12.0, 5), (1.0, 15.99, 5),
+          (1.0, 16.0, 6), (1.0, 19.99, 6),
+          (1.0, 20.0, 7), (5.0, 40.0, 7)]
+
+@pytest.mark.parametrize('hotspot, dhw, level', LEVELS)
+def test_alert_level(hotspot, dhw, level):
+    assert alertLevel(np.array([hotspot]), np.array([dhw]))[0] == level
+
+def test_alert_level_grid():
+    # The same table, as one grid.
+    hotspot, dhw, level = (np.array(column) for column in zip(*LEVELS))
+    assert np.array_equal(alertLevel(hotspot, dhw), level)
+    assert alertLevel(hotspot, dhw).dtype == np.uint8
+
+@pytest.mark.parametrize('levels, fraction, area', [([0] * 9 + [7], 0.1, 0), ([0] * 8 + [7, 7], 0.1, 7),
+                                                     ([3] * 10, 0.1, 3), ([1, 2, 3, 4], 0.5, 2),
+                                                     ([ALERT_FILL] * 5 + [0] * 9 + [5], 0.1, 0),
+                                                     ([ALERT_FILL] * 3, 0.1, None), ([], 0.1, None)])
+def test_area_level(levels, fraction, area):
+    # The highest level reached by at least fraction of the pixels, ignoring missing pixels (ALERT_FILL).
+    assert areaLevel(np.array(levels, dtype=np.uint8), fraction) == area
+
+def test_window_masks_missing_pixels():
+    # A pixel without sst on the day is masked in the alerts, and adds nothing to the window.
+    window = BMNP_DHWWindow(np.full(3, 28.0), days=84, alert_days=7)
+    for day in range(84):
+        window.push(np.ma.masked_array([29.5, 29.5, 27.0], mask=[False, day == 83, False]))
+
+    alerts = window.alerts()
+    assert np.array_equal(np.ma.getmaskarray(alerts['alert']), [False, True, False])
+    assert np.array_equal(np.ma.getmaskarray(alerts['alert_area']), [False, True, False])
+    assert alerts['alert'][0] == 6 and alerts['alert'][2] == 0
+    assert np.allclose(window.dhw().compressed(), [18.0, 0.0])
+    assert alerts['hotspot'][0] == pytest.approx(1.5)
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+from align import BMNP_Align
+
+def threshold(lats, lons):
+    # A threshold that is different at every pixel, to see where each value ends up.
+    return 28.0 + 10 * (lats[:, None] - 12.0) + 0.1 * (lons[None, :] + 68.0)
+
+# The threshold (source) grid, and an sst grid that is larger, two cells offset from it, and off by float32 noise.
+SOURCE_LATS = np.round(12.02 + 0.01 * np.arange(8), 2).astype(np.float32)
+SOURCE_LONS = np.round(-68.40 + 0.01 * np.arange(6), 2).astype(np.float32)
+LATS = np.round(12.00 + 0.01 * np.arange(14), 2) + 3e-6
+LONS = np.round(-68.43 + 0.01 * np.arange(12), 2) - 4e-6
+
+def test_threshold_lines_up_with_sst_grid(tmp_path):
+    align = BMNP_Align(SOURCE_LATS, SOURCE_LONS, LATS, LONS, cache_dir=f'{tmp_path}/')
+    min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx = align.window
+
+    assert align.window == (2, 10, 3, 9)
+    assert np.allclose(LATS[min_lat_idx:max_lat_idx], SOURCE_LATS, atol=1e-5)
+    assert np.allclose(LONS[min_lon_idx:max_lon_idx], SOURCE_LONS, atol=1e-5)
+
+    # Each pixel of the window gets the threshold of the same place.
+    aligned = align.align(threshold(SOURCE_LATS.astype(float), SOURCE_LONS.astype(float)))
+    assert np.allclose(aligned, threshold(LATS[min_lat_idx:max_lat_idx], LONS[min_lon_idx:max_lon_idx]), atol=1e-3)
+
+    # A threshold grid stored with latitude descending lines up the same way.
+    flipped = BMNP_Align(SOURCE_LATS[::-1], SOURCE_LONS, LATS, LONS, cache_dir=f'{tmp_path}/')
+    assert flipped.window == align.window
+    assert np.allclose(flipped.align(threshold(SOURCE_LATS[::-1].astype(float), SOURCE_LONS.astype(float))), aligned)
+
+def test_cached_alignment_follows_the_grid(tmp_path):
+    # The cached alignment is used for the same grids, and a new one is made once the sst grid changes.
+    first = BMNP_Align(SOURCE_LATS, SOURCE_LONS, LATS, LONS, cache_dir=f'{tmp_path}/')
+    again = BMNP_Align(SOURCE_LATS, SOURCE_LONS, LATS, LONS, cache_dir=f'{tmp_path}/')
+    assert again.cache_file == first.cache_file and again.window == first.window
+    assert len(os.listdir(tmp_path)) == 1
+
+    moved = BMNP_Align(SOURCE_LATS, SOURCE_LONS, LATS[1:], LONS[:-1], cache_dir=f'{tmp_path}/')
+    assert moved.cache_file != first.cache_file
+    assert moved.window == (1, 9, 3, 9)
+    assert len(os.listdir(tmp_path)) == 2
+
+@pytest.mark.parametrize('lats, lons', [(LATS + 0.005, LONS), (LATS, LONS + 0.004), (LATS[4:], LONS), (LATS + 1, LONS)])
+def test_grids_that_do_not_line_up(tmp_path, lats, lons):
+    # Half a cell off, not covering the threshold grid, or not overlapping at all.
+    with pytest.raises(ValueError):
+        BMNP_Align(SOURCE_LATS, SOURCE_LONS, lats, lons, cache_dir=f'{tmp_path}/')
+    assert len(os.listdir(tmp_path)) == 0
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from archive import BMNP_Archive
+from bmnp import BMNP_Data
+
+LATS = np.round(12.0 + 0.01 * np.arange(4), 2)
+LONS = np.round(-68.4 + 0.01 * np.arange(5), 2)
+
+@pytest.mark.parametrize('storage', ['float', 'compact'])
+def test_write_keeps_land_masked(tmp_path, storage):
+    # Land pixels of a single day have to read back as masked, not as the fill value.
+    land = np.zeros((len(LATS), len(LONS)), dtype=bool)
+    land[1:3, 2:4] = True
+    grid = np.ma.masked_array(np.full(land.shape, 28.5), mask=land)
+
+    archive = BMNP_Archive(str(tmp_path / 'sst_bmnp.nc'), storage=storage)
+    archive.write('2002-06-02', grid, LATS, LONS)
+    dates, data = archive.read('2002-06-02', '2002-06-02')
+
+    assert dates == ['2002-06-02']
+    assert np.array_equal(np.ma.getmaskarray(data[0]), land)
+    assert np.allclose(data[0].compressed(), 28.5, atol=0.001)
+
+def test_archive_starts_at_epoch(workspace):
+    # A later run that starts before the first one can still add its days to the archive.
+    BMNP_Data(workspace[60], workspace[-1], downloadnew=True, downloadtype='bulk', create_databases=True, text_csvs=False)
+    data = BMNP_Data(workspace[0], workspace[-1], downloadnew=True, downloadtype='bulk', create_databases=True, text_csvs=False)
+
+    assert data.archive.start_date == '2002-06-01'
+    assert data.catalog.dates('sst') == set(workspace)
+    assert data.archive.dates() == workspace
@@ -0,0 +1,28 @@
+import os
+from bmnp import BMNP_Data
+
+def test_recreate_csvs_after_download(workspace, capsys):
+    # The csv files written by a download are up to date, so recreateCSVs has nothing to convert.
+    data = BMNP_Data(workspace[0], workspace[-1], downloadnew=True, downloadtype='bulk')
+    times = {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(data.csv_sst)}
+    assert len(times) == len(workspace)
+
+    capsys.readouterr()
+    data.recreateCSVs()
+
+    assert 'No files need to be converted' in capsys.readouterr().out
+    assert {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(data.csv_sst)} == times
+
+def test_monthly_rebuild_keeps_daily_statistics(workspace):
+    # Rebuilding the monthly outputs recalculates them, and leaves the daily statistics alone.
+    data = BMNP_Data(workspace[0], workspace[9], downloadnew=True, downloadtype='bulk', text_csvs=False)
+    statistics = os.path.join(data.pandas_dir, 'daily_statistics.csv')
+    with open(statistics) as f:
+        before = f.read()
+
+    data.monthlyCalculations(rebuild=True)
+
+    with open(statistics) as f:
+        assert f.read() == before
+    for filename in ['monthly_manifest.json', 'sst_monthly_averages.csv', 'dhw_monthly_averages.csv']:
+        assert os.path.exists(os.path.join(data.pandas_dir, filename))
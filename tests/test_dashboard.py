@@ -0,0 +1,36 @@
+import os
+from configparser import ConfigParser
+import netCDF4 as nc
+import numpy as np
+from cache import GridCache
+from render import RenderCache
+
+def writeSST(filename, kelvin, mtime):
+    # A daily sst file of a 3 x 4 grid, all at kelvin, modified at mtime (seconds).
+    with nc.Dataset(filename, 'w') as file:
+        file.createDimension('lat', 3)
+        file.createDimension('lon', 4)
+        file.createDimension('time', None)
+        file.createVariable('lat', 'f4', ('lat',))[:] = 12.0 + 0.01 * np.arange(3)
+        file.createVariable('lon', 'f4', ('lon',))[:] = -68.4 + 0.01 * np.arange(4)
+        file.createVariable('analysed_sst', 'f4', ('time', 'lat', 'lon'))[0] = np.full((3, 4), kelvin)
+    os.utime(filename, (mtime, mtime))
+
+def test_caches_follow_rewritten_files(tmp_path, monkeypatch):
+    # A daily file that is written again is loaded and drawn again, instead of serving the old grid and map.
+    monkeypatch.chdir(tmp_path)
+    config = ConfigParser()
+    config['folders'] = {'nc_sst': f'{tmp_path}/', 'masks': f'{tmp_path}/masks/'}
+    grids = GridCache(config)
+    renders = RenderCache(grids, folder=f'{tmp_path}/renders')
+
+    writeSST(tmp_path / '2002-06-01.nc', 301.15, 1000000000)
+    first = renders.get('sst', '2002-06-01')
+    assert grids.get('sst', '2002-06-01')['average'] == 28.0
+    assert renders.get('sst', '2002-06-01') is first
+
+    writeSST(tmp_path / '2002-06-01.nc', 303.15, 1000000100)
+    assert grids.get('sst', '2002-06-01')['average'] == 30.0
+    assert renders.get('sst', '2002-06-01') != first
+    assert len(os.listdir(tmp_path / 'renders')) == 1
+    assert len(renders.items) == 1
@@ -0,0 +1,82 @@
+import os
+import netCDF4 as nc
+import numpy as np
+from bmnp import BMNP_Data
+from archive import BMNP_Archive
+
+def hotspots(data, dates, window, bleaching_threshold):
+    # Clipped daily HotSpots (sst above the threshold, missing pixels as 0) of each date, and the missing pixels.
+    min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx = window
+    days, masks = [], []
+    for date in dates:
+        with nc.Dataset(f'{data.refined_dir}{date}.nc') as file:
+            sst = file.variables['analysed_sst'][0, min_lat_idx:max_lat_idx, min_lon_idx:max_lon_idx].astype(float) - 273.15
+        hotspot = sst - np.ma.asarray(bleaching_threshold, dtype=float)
+        days.append(np.clip(np.ma.filled(hotspot, 0), 0, None))
+        masks.append(np.ma.getmaskarray(hotspot))
+
+    return np.array(days), np.array(masks)
+
+def lowerThreshold(degrees = 3.0):
+    # Lower the synthetic MMM, so that the first months of sst have HotSpots and the DHWs are not all 0.
+    with nc.Dataset('data/hrcs_mmm.nc', 'a') as file:
+        file.variables['variable'][:] = file.variables['variable'][:] - degrees
+
+def test_rolling_dhws_match_brute_force(workspace):
+    # Each DHW is the sum of the clipped HotSpots of the 84 sst files up to its date, divided by 7. One day is
+    # missing, so some windows span the gap (and reach one file further back), and the first 84 files have no DHW.
+    lowerThreshold()
+    os.remove(f"granules/{workspace[50].replace('-', '')}090000-JPL-L4_GHRSST-SSTfnd-MUR-GLOB-v02.0-fv04.1.nc")
+    data = BMNP_Data(workspace[0], workspace[-1], downloadnew=True, downloadtype='bulk', delete_singles=True, text_csvs=False)
+
+    files = sorted(data.catalog.dates('sst'))
+    assert workspace[50] not in files
+    assert sorted(data.catalog.dates('dhw')) == files[84:]
+
+    window, new_lat, new_lon, bleaching_threshold = data.dhwGridSetup([f'{date}.nc' for date in files])
+    days, masks = hotspots(data, files, window, bleaching_threshold)
+
+    for idx in range(84, len(files)):
+        expected = np.around(days[idx - 83:idx + 1].sum(axis=0) / 7.0, 2)
+        with nc.Dataset(f'{data.nc_dhw}{files[idx]}.nc') as file:
+            dhw = np.flip(file.variables['dhw'][:], 0)
+
+        # Pixels without sst on the day are masked (so is land, from the coastline).
+        assert np.ma.getmaskarray(dhw)[masks[idx]].all()
+        assert np.ma.max(dhw) > 4
+        assert np.allclose(dhw.compressed(), expected[~np.ma.getmaskarray(dhw)], atol=1e-5)
+
+    # Targets with gaps between them start a fresh window, and still match.
+    ocean = data.oceanMask(new_lat[::-1], new_lon)
+    for idx, date, dhw, alerts in data.rollingDHWs(files, [84, 86, 97], window, bleaching_threshold, ocean):
+        expected = np.around(days[idx - 83:idx + 1].sum(axis=0) / 7.0, 2)
+        assert date == files[idx]
+        assert np.allclose(dhw.compressed(), expected[~np.ma.getmaskarray(dhw)], atol=1e-5)
+
+def test_dhw_database_matches_daily_loop(workspace):
+    # The chunked cumulative sums of dhwDatabase give the same DHWs as summing the 84 days before each day, one day
+    # at a time (days missing from the archive count as 0). Small chunks make several chunk boundaries.
+    lowerThreshold()
+    os.remove(f"granules/{workspace[50].replace('-', '')}090000-JPL-L4_GHRSST-SSTfnd-MUR-GLOB-v02.0-fv04.1.nc")
+    data = BMNP_Data(workspace[0], workspace[-1], downloadnew=True, downloadtype='bulk', create_databases=True, text_csvs=False)
+    data.dhwDatabase([], chunk_days=5)
+
+    files = sorted(data.catalog.dates('sst'))
+    window, new_lat, new_lon, bleaching_threshold = data.dhwGridSetup([f'{date}.nc' for date in files])
+    min_lat_idx, max_lat_idx, min_lon_idx, max_lon_idx = window
+    dates, sst = BMNP_Archive(f'{data.data_dir}sst_bmnp.nc').read(None, None, slice(min_lat_idx, max_lat_idx), slice(min_lon_idx, max_lon_idx))
+    dhw_dates, dhw = BMNP_Archive(f'{data.data_dir}dhw_bmnp.nc', variable='dhw').read(dates[84], dates[-1])
+    assert dhw_dates == dates[84:]
+
+    threshold = np.ma.asarray(bleaching_threshold, dtype=float)
+    for slot in range(84, len(dates)):
+        total = np.zeros(threshold.shape)
+        for day in range(slot - 83, slot + 1):
+            total += np.clip(np.ma.filled(sst[day].astype(float) - threshold, 0), 0, None)
+        expected = np.around(total / 7.0, 2)
+
+        grid = dhw[slot - 84]
+        assert np.ma.getmaskarray(grid)[np.ma.getmaskarray(sst[slot])].all()
+        assert np.allclose(grid.compressed(), expected[~np.ma.getmaskarray(grid)], atol=1e-5)
+
+    assert np.ma.max(dhw) > 4
@@ -0,0 +1,34 @@
+import netCDF4 as nc
+import pytest
+import instrument
+from instrument import BMNP_Instrument
+from bmnp import BMNP_Data
+
+def test_hook_is_added_once(tmp_path, monkeypatch):
+    # Every recording instrument shares one audit hook, and stops counting once it is closed.
+    added = []
+    monkeypatch.setattr(instrument.sys, 'addaudithook', lambda hook: added.append(hook))
+    monkeypatch.setattr(instrument, 'hooked', False)
+
+    first = BMNP_Instrument(f'{tmp_path}/reports/')
+    first.close()
+    second = BMNP_Instrument(f'{tmp_path}/reports/')
+    instrument.auditOpens('open', (f'{tmp_path}/file.csv', 'w'))
+    second.finish()
+    instrument.auditOpens('open', (f'{tmp_path}/file.csv', 'w'))
+
+    assert len(added) == 1
+    assert 'file_opens_write' not in first.counters
+    assert second.counters['file_opens_write'] == 1
+
+def test_failed_run_puts_dataset_back(workspace, monkeypatch):
+    # A run that fails part way still stops counting and puts netCDF4.Dataset back.
+    original = nc.Dataset
+    def fail(self): raise RuntimeError('failed stage')
+    monkeypatch.setattr(BMNP_Data, 'createDHWs', fail)
+
+    with pytest.raises(RuntimeError):
+        BMNP_Data(workspace[0], workspace[-1], downloadnew=True, downloadtype='bulk', report=True, text_csvs=False)
+
+    assert nc.Dataset is original
+    assert instrument.recording == []
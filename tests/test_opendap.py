@@ -0,0 +1,121 @@
+import os
+import re
+import shutil
+import threading
+import numpy as np
+import netCDF4 as nc
+from configparser import ConfigParser
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from bmnp import BMNP_Data
+
+class OPeNDAPHandler(BaseHTTPRequestHandler):
+    # Stands in for the OPeNDAP server: answers /<granule>.dap.nc4?dap4.ce=<constraint> with the file in
+    # server.responses[(granule, constraint)], or 400 for any other request. Every constraint is recorded in
+    # server.constraints. The responses are made beforehand, so that this thread does not use netCDF.
+    def do_GET(self):
+        url = urlparse(self.path)
+        granule = os.path.basename(url.path)[:-len('.dap.nc4')]
+        constraint = parse_qs(url.query)['dap4.ce'][0]
+        self.server.constraints.append(constraint)
+
+        if (granule, constraint) not in self.server.responses:
+            self.send_error(400)
+            return
+        with open(self.server.responses[(granule, constraint)], 'rb') as f:
+            content = f.read()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+def subset(granule, constraint, filename):
+    # The variables of constraint (with their index ranges, which include the last index) from granule, as filename.
+    source = nc.Dataset(granule, 'r')
+    file = nc.Dataset(filename, 'w')
+    for name, ranges in re.findall(r'/(\w+)((?:\[\d+(?::\d+)?\])*)', constraint):
+        variable = source.variables[name]
+        variable.set_auto_maskandscale(False)
+        index = tuple(slice(int(start), int(stop or start) + 1) for start, stop in re.findall(r'\[(\d+)(?::(\d+))?\]', ranges))
+        values = variable[index] if index else variable[:]
+        for dimension, size in zip(variable.dimensions, values.shape):
+            if dimension not in file.dimensions: file.createDimension(dimension, size)
+        copy = file.createVariable(name, variable.dtype, variable.dimensions, fill_value=getattr(variable, '_FillValue', None))
+        copy.setncatts({key: variable.getncattr(key) for key in variable.ncattrs() if key != '_FillValue'})
+        copy.set_auto_maskandscale(False)
+        copy[:] = values
+    file.close()
+    source.close()
+
+def readFolder(folder):
+    # Every variable of every file in folder, as {filename: {name: values}}.
+    files = {}
+    for filename in sorted(os.listdir(folder)):
+        dataset = nc.Dataset(os.path.join(folder, filename), 'r')
+        files[filename] = {name: dataset.variables[name][:] for name in dataset.variables}
+        dataset.close()
+    return files
+
+def test_opendap_requests_the_window(workspace, tmp_path):
+    config = ConfigParser()
+    config.read('config.ini')
+    dates = workspace[:6]
+    granules = {date: config['opendap']['granule'].format(date=date.replace('-', '')) for date in dates}
+
+    # The Bonaire window of the MUR grid, which is all that should be requested of analysed_sst.
+    grid = nc.Dataset(os.path.join('granules', f'{granules[dates[0]]}.nc'), 'r')
+    lats, lons = grid.variables['lat'][:], grid.variables['lon'][:]
+    grid.close()
+    coordinates = config['coordinates']
+    lat_idx = np.where((lats >= coordinates.getfloat('min_lat')) & (lats <= coordinates.getfloat('max_lat')))[0]
+    lon_idx = np.where((lons >= coordinates.getfloat('min_lon')) & (lons <= coordinates.getfloat('max_lon')))[0]
+    assert len(lat_idx) * len(lon_idx) < len(lats) * len(lons)
+    lat_range, lon_range = f'[{lat_idx[0]}:{lat_idx[-1]}]', f'[{lon_idx[0]}:{lon_idx[-1]}]'
+    window = f'/analysed_sst[0]{lat_range}{lon_range};/lat{lat_range};/lon{lon_range};/time'
+
+    # Serve the grid and the window of every granule locally, and point [opendap] url at the server.
+    server = HTTPServer(('127.0.0.1', 0), OPeNDAPHandler)
+    server.constraints = []
+    server.responses = {}
+    os.makedirs(tmp_path / 'responses')
+    for date, granule in granules.items():
+        for number, constraint in enumerate(['/lat;/lon', window]):
+            filename = str(tmp_path / 'responses' / f'{granule}.{number}.nc')
+            subset(os.path.join('granules', f'{granule}.nc'), constraint, filename)
+            server.responses[(granule, constraint)] = filename
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    config['opendap']['url'] = f'http://127.0.0.1:{server.server_address[1]}/'
+    with open('config.ini', 'w') as f:
+        config.write(f)
+
+    # A copy of the fresh data folder, for the full-granule run.
+    shutil.copytree('data', 'data_fresh')
+
+    try:
+        data = BMNP_Data(dates[0], dates[-1], downloadnew=True, downloadtype='opendap', download_workers=3, text_csvs=False)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # The grid is requested once, and every date only asks for the window of analysed_sst.
+    assert data.download.failed_dates == {}
+    assert len(data.download.downloaded_dates) == len(dates)
+    assert sorted(server.constraints) == sorted(['/lat;/lon'] + [window] * len(dates))
+
+    # The refined files are the same as those of the full granules (a bulk download of the same dates).
+    os.rename('data', 'data_opendap')
+    os.rename('data_fresh', 'data')
+    bulk = BMNP_Data(dates[0], dates[-1], downloadnew=True, downloadtype='bulk', text_csvs=False)
+    assert len(bulk.download.downloaded_dates) == len(dates)
+
+    opendap, full = readFolder(os.path.join('data_opendap', 'nc_sst')), readFolder(os.path.join('data', 'nc_sst'))
+    assert sorted(opendap) == sorted(full) == [f'{date}.nc' for date in dates]
+    for filename in full:
+        assert sorted(opendap[filename]) == sorted(full[filename])
+        for name in full[filename]:
+            assert np.array_equal(np.ma.getmaskarray(opendap[filename][name]), np.ma.getmaskarray(full[filename][name]))
+            assert np.ma.allequal(opendap[filename][name], full[filename][name])
@@ -0,0 +1,10 @@
+import os
+from bmnp import BMNP_Data
+
+def test_pipeline_bulk_download(workspace):
+    # The bulk download subsets its granules while the DHW and summary stages read netCDF files.
+    data = BMNP_Data(workspace[0], workspace[-1], downloadnew=True, downloadtype='bulk', pipeline=True, text_csvs=False)
+
+    assert len(data.download.downloaded_dates) == len(workspace)
+    assert data.catalog.dates('dhw') == set(workspace[84:])
+    assert sorted(os.listdir(data.nc_dhw)) == [f'{date}.nc' for date in workspace[84:]]
@@ -0,0 +1,28 @@
+import numpy as np
+from archive import BMNP_Archive
+from reader import BMNP_Reader
+
+LATS = np.round(12.0 + 0.01 * np.arange(3), 2)
+LONS = np.round(-68.4 + 0.01 * np.arange(4), 2)
+
+def makeReader(tmp_path):
+    # A reader of an sst archive with 5 days from 2002-06-01.
+    config = {'folders': {'data': f'{tmp_path}/', 'export': f'{tmp_path}/export/'}}
+    BMNP_Archive(f'{tmp_path}/sst_bmnp.nc').writeMany('2002-06-01', np.ma.masked_array(np.full((5, 3, 4), 28.0)), LATS, LONS)
+
+    return BMNP_Reader(config)
+
+def test_read_past_end_of_archive(tmp_path):
+    # A range entirely after the last day of the archive is all nan.
+    dates, lats, lons, data = makeReader(tmp_path).read('sst', '2002-07-01', '2002-07-03')
+
+    assert dates == ['2002-07-01', '2002-07-02', '2002-07-03']
+    assert data.shape == (3, 3, 4)
+    assert np.isnan(data).all()
+
+def test_read_across_end_of_archive(tmp_path):
+    # Days after the end of the archive are nan, the rest are read from it.
+    dates, lats, lons, data = makeReader(tmp_path).read('sst', '2002-06-04', '2002-06-07')
+
+    assert np.allclose(data[:2], 28.0)
+    assert np.isnan(data[2:]).all()